@@ -7,6 +7,8 @@ class Settings(BaseSettings):
     NEO4J_URI: str
     NEO4J_USER: str
     NEO4J_PASSWORD: str
+    # 目标数据库（显式指定可省去驱动解析默认数据库的额外往返）
+    NEO4J_DATABASE: str = "neo4j"
     
     # 千问配置（支持QWEN和QIANWEN两种命名）
     # 完全从 .env 文件读取，不设置任何默认值
@@ -95,6 +97,10 @@ class Settings(BaseSettings):
     # 建议值：2-3（8G内存服务器），可根据实际情况调整
     EMBEDDING_MAX_CONCURRENT: int = 2
     
+    # ==================== 模板生成配置 ====================
+    # 全文分块模式下各块LLM分析的最大并发数
+    TEMPLATE_CHUNK_MAX_CONCURRENT: int = 4
+    
     # ==================== Milvus配置（可选）====================
     MILVUS_HOST: str = ""
     MILVUS_PORT: int = 19530
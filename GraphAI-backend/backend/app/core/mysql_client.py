@@ -2,6 +2,7 @@
 MySQL数据库连接客户端
 """
 from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -15,6 +16,9 @@ MYSQL_SERVER_URL = f"mysql+pymysql://{settings.MYSQL_USER}:{settings.MYSQL_PASSW
 # 构建MySQL连接URL（指定数据库）
 MYSQL_URL = f"mysql+pymysql://{settings.MYSQL_USER}:{settings.MYSQL_PASSWORD}@{settings.MYSQL_HOST}:{settings.MYSQL_PORT}/{settings.MYSQL_DATABASE}?charset=utf8mb4"
 
+# 构建MySQL异步连接URL（用于异步服务中的只读查询，避免阻塞事件循环）
+MYSQL_ASYNC_URL = f"mysql+aiomysql://{settings.MYSQL_USER}:{settings.MYSQL_PASSWORD}@{settings.MYSQL_HOST}:{settings.MYSQL_PORT}/{settings.MYSQL_DATABASE}?charset=utf8mb4"
+
 # 创建数据库引擎
 engine = create_engine(
     MYSQL_URL,
@@ -26,6 +30,19 @@ engine = create_engine(
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步数据库引擎（共享连接池，供 async 服务复用）
+async_engine = create_async_engine(
+    MYSQL_ASYNC_URL,
+    pool_size=10,         # 常驻连接数
+    max_overflow=20,      # 峰值时额外允许的连接数
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    echo=False
+)
+
+# 创建异步会话工厂
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 # 创建基础模型类
 Base = declarative_base()
 
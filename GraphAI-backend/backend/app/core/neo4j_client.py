@@ -19,8 +19,8 @@ class Neo4jClient:
     def close(self):
         self.driver.close()
     
-    def get_session(self):
-        return self.driver.session()
+    def get_session(self, database: str = None):
+        return self.driver.session(database=database or settings.NEO4J_DATABASE)
     
     def _verify_connectivity(self):
         """验证连接是否健康"""
@@ -31,7 +31,7 @@ class Neo4jClient:
             logger.warning(f"Neo4j连接验证失败: {e}")
             return False
     
-    def execute_query(self, query: str, parameters: dict = None, retry_count: int = 3):
+    def execute_query(self, query: str, parameters: dict = None, retry_count: int = 3, database: str = None):
         """执行Cypher查询，带重试机制"""
         last_error = None
         for attempt in range(retry_count):
@@ -42,7 +42,7 @@ class Neo4jClient:
                         logger.warning(f"Neo4j连接不健康，等待后重试... (尝试 {attempt + 1}/{retry_count})")
                         time.sleep(1)  # 等待1秒后重试
                 
-                with self.get_session() as session:
+                with self.get_session(database) as session:
                     result = session.run(query, parameters or {})
                     records = [record.data() for record in result]
                     return records
@@ -55,7 +55,23 @@ class Neo4jClient:
                     logger.error(f"Neo4j查询最终失败: {e}")
                     raise
     
-    def execute_write(self, query: str, parameters: dict = None, retry_count: int = 3):
+    def stream_query(self, query: str, parameters: dict = None, handler=None, database: str = None) -> int:
+        """
+        流式执行Cypher查询：逐条把Record交给handler处理，不在内存中缓冲全部结果
+        
+        结果可能已被handler部分消费，因此不做重试，失败直接抛出。
+        
+        Returns:
+            处理的记录数
+        """
+        count = 0
+        with self.get_session(database) as session:
+            for record in session.run(query, parameters or {}):
+                handler(record)
+                count += 1
+        return count
+    
+    def execute_write(self, query: str, parameters: dict = None, retry_count: int = 3, database: str = None):
         """执行写操作，带重试机制"""
         last_error = None
         for attempt in range(retry_count):
@@ -66,7 +82,7 @@ class Neo4jClient:
                         logger.warning(f"Neo4j连接不健康，等待后重试... (尝试 {attempt + 1}/{retry_count})")
                         time.sleep(1)  # 等待1秒后重试
                 
-                with self.get_session() as session:
+                with self.get_session(database) as session:
                     result = session.run(query, parameters or {})
                     return result.consume().counters
             except Exception as e:
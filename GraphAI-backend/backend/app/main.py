@@ -153,6 +153,8 @@ def _init_neo4j_indices():
         "CREATE FULLTEXT INDEX node_name_and_summary IF NOT EXISTS FOR (n:Entity) ON EACH [n.name, n.summary, n.group_id]",
         "CREATE FULLTEXT INDEX community_name IF NOT EXISTS FOR (n:Community) ON EACH [n.name, n.group_id]",
         "CREATE FULLTEXT INDEX edge_name_and_fact IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON EACH [e.name, e.fact, e.group_id]",
+        # 智能检索阶段2：Entity名称 -> DocumentChunk 关联
+        "CREATE FULLTEXT INDEX document_chunk_text IF NOT EXISTS FOR (n:DocumentChunk) ON EACH [n.text]",
     ]
     
     # 创建 Range 索引
@@ -172,6 +174,14 @@ def _init_neo4j_indices():
             logging.warning(f"Neo4j Fulltext 索引创建失败（可能已存在）: {index_query[:50]}... - {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放进程池等资源"""
+    from app.services.intelligent_chat_service import shutdown_link_process_pool
+    shutdown_link_process_pool()
+    logging.info("Entity关联进程池已关闭")
+
+
 @app.get("/")
 async def root():
     return {"message": "GraphAI Knowledge Graph API", "version": "1.0.0"}
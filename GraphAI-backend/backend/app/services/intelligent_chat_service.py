@@ -5,10 +5,18 @@
 """
 import logging
 import asyncio
+import atexit
+import functools
+import heapq
+import math
+import multiprocessing
 import re
 import json
 import os
-from typing import Dict, List, Any, Optional, AsyncGenerator
+from typing import Dict, List, Any, Optional, AsyncGenerator, Final
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from app.core.graphiti_client import get_graphiti_instance
 from app.core.neo4j_client import neo4j_client
@@ -19,7 +27,9 @@ from app.core.llm_client import LLMClient
 from app.services.milvus_service import get_milvus_service, VectorType
 from app.services.cognee_service import get_cognee, CogneeService
 from app.services.graphiti_service import GraphitiService
-from app.core.mysql_client import SessionLocal
+from app.core.mysql_client import SessionLocal, AsyncSessionLocal
+from app.core.redis_client import get_redis_client
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models.document_upload import DocumentUpload
 from app.models.graphiti_entities import (
@@ -28,16 +38,194 @@ from app.models.graphiti_entities import (
     LIGHTWEIGHT_EDGE_TYPE_MAP
 )
 from app.core.utils import serialize_neo4j_properties
+from app.utils.entity_linking import match_names_in_texts
 from app.services.template_service import TemplateService
 from app.services.template_generation_service import TemplateGenerationService
 from app.models.template import EntityEdgeTemplate
 from typing import Type
 from pydantic import BaseModel
+import numpy as np
 import os
 import json
 
 logger = logging.getLogger(__name__)
 
+# Neo4j查询线程池（模块级共享：服务实例按请求创建，不能每个实例各建一个线程池）
+_NEO4J_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="neo4j-query")
+
+# 智能检索阶段1元数据缓存（Redis，chunk元数据与文档名称很少变化，使用短TTL）
+_CHUNK_META_CACHE_PREFIX = "chunkmeta:"
+_DOCUMENT_NAME_CACHE_PREFIX = "docname:"
+_SMART_RETRIEVAL_CACHE_TTL = 300  # 5分钟
+
+# 智能检索各I/O调用的超时（秒），超时后降级为部分结果，避免慢查询拖长尾延迟
+_STAGE1_NEO4J_TIMEOUT = 2.0
+_STAGE1_MYSQL_TIMEOUT = 1.0
+_STAGE1_REDIS_TIMEOUT = 0.5
+_STAGE2_NEO4J_TIMEOUT = 5.0
+
+# Entity×chunk 组合数达到该值时，Entity关联chunk改由Neo4j全文索引匹配；
+# 规模较小时内存扫描比一次网络往返更快
+_FULLTEXT_LINK_MIN_PAIRS = 5000
+# 全文索引关联时每个名称最多取回的命中数（按相关度），避免常见名称从整个库拉回大量chunk
+_FULLTEXT_LINK_QUERY_LIMIT = 500
+
+# 每个Entity最多关联的chunk数量
+_MAX_RELATED_CHUNKS = 5
+
+# 大规模Entity关联在全文索引不可用时使用的进程池（懒创建，模块级共享）；
+# 用spawn而不是fork，避免复制已启动Neo4j/线程池线程的进程状态
+_LINK_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_link_process_pool() -> ProcessPoolExecutor:
+    """获取Entity关联进程池"""
+    global _LINK_PROCESS_POOL
+    if _LINK_PROCESS_POOL is None:
+        _LINK_PROCESS_POOL = ProcessPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) // 2),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Celery worker 等不走 FastAPI shutdown 事件的进程退出时也能回收子进程
+        atexit.register(shutdown_link_process_pool)
+    return _LINK_PROCESS_POOL
+
+
+def shutdown_link_process_pool() -> None:
+    """关闭Entity关联进程池（应用关闭/重载时调用，避免spawn子进程残留）"""
+    global _LINK_PROCESS_POOL
+    if _LINK_PROCESS_POOL is not None:
+        atexit.unregister(shutdown_link_process_pool)
+        _LINK_PROCESS_POOL.shutdown(wait=False, cancel_futures=True)
+        _LINK_PROCESS_POOL = None
+
+
+@dataclass(slots=True)
+class ChunkMeta:
+    """智能检索阶段1：从Neo4j/MySQL补充的DocumentChunk元数据"""
+    chunk_name: Optional[str] = ""
+    group_id: Optional[str] = ""
+    doc_id: Optional[str] = ""
+    chunk_index: Optional[int] = 0
+    section_name: Optional[str] = ""
+    section_id: Optional[str] = ""
+    section_group_id: Optional[str] = ""
+    episode_group_ids: List[str] = field(default_factory=list)
+    section_index: int = 1
+    document_name: str = ""
+
+
+# ==================== 智能检索 Cypher 语句 ====================
+# 固定的参数化查询文本，保证每次请求的查询文本一致，命中Neo4j查询计划缓存
+
+# 阶段1：批量补充chunk元数据（按group_id过滤，同时返回阶段2所需的Episode/TextDocument group_id）
+# 文档名称统一由MySQL查询（document_name_map），此处不再关联 :Document 节点
+_CYPHER_CHUNK_META: Final[str] = """
+UNWIND $chunk_ids AS cid
+MATCH (dc:DocumentChunk {id: cid})
+WHERE $group_ids IS NULL OR dc.group_id IN $group_ids
+OPTIONAL MATCH (dc)-[:is_part_of]->(td:TextDocument)
+OPTIONAL MATCH (e:Episodic)
+WHERE e.doc_id = dc.doc_id
+RETURN 
+    cid as chunk_id,
+    dc.name as chunk_name,
+    dc.group_id as group_id,
+    dc.doc_id as doc_id,
+    dc.chunk_index as chunk_index,
+    td.name as section_name,
+    td.id as section_id,
+    COALESCE(td.group_id, dc.group_id) as section_group_id,
+    collect(DISTINCT e.group_id) as episode_group_ids
+"""
+
+# 阶段2：Graphiti + Cognee Entity详细信息（UNION ALL合并为1次往返，按src列区分来源）
+# 注意：末尾的 LIMIT 50 只作用于 UNION 的第二部分（Cognee）
+_CYPHER_ENTITY_DETAILS: Final[str] = """
+MATCH (e:Entity)
+WHERE e.uuid IN $entity_uuids
+RETURN 
+    'graphiti' as src,
+    COALESCE(e.uuid, toString(id(e))) as key,
+    e.name as name,
+    labels(e) as labels,
+    properties(e) as properties,
+    e.group_id as group_id
+UNION ALL
+MATCH (e:Entity)
+WHERE e.id IN $entity_ids
+  AND e.group_id IN $group_ids
+RETURN 
+    'cognee' as src,
+    e.id as key,
+    e.name as name,
+    labels(e) as labels,
+    properties(e) as properties,
+    e.group_id as group_id
+LIMIT 50
+"""
+
+# 阶段2：通过全文索引批量查找可能包含Entity名称的chunk（只在本次结果的chunk内），
+# 每个名称的命中数由 $limit 限制；结果只是候选，调用方再做子串校验
+_CYPHER_CHUNK_FULLTEXT_LINK: Final[str] = """
+UNWIND $queries AS q
+CALL db.index.fulltext.queryNodes('document_chunk_text', q.query, {limit: $limit}) YIELD node
+WHERE node.id IN $chunk_ids
+RETURN q.name as name, collect(node.id) as chunk_ids
+"""
+
+# 阶段2：chunk关键词提取（中文词 / 英文词 / 字母数字组合如"SD-WAN"）
+_RE_CN: Final = re.compile(r'[\u4e00-\u9fff]{2,}')
+_RE_EN: Final = re.compile(r'[a-zA-Z]{3,}')
+_RE_AN: Final = re.compile(r'[a-zA-Z0-9-]{4,}')
+# 全文索引关联：可按前缀查询的单个英文/数字词
+_RE_FULLTEXT_TERM: Final = re.compile(r'[a-z0-9]+')
+
+# 阶段2：关系扩展，Graphiti与Cognee两部分合并为一次往返，按 tag 区分结果
+# Graphiti：1-2跳APOC路径扩展，RELATIONSHIP_GLOBAL 保证同一种子下每条关系只遍历一次，每条路径只需取最后一跳
+# Cognee：1跳关系
+# 下游只使用关系的 type/fact，不返回 properties(r)，省去传输和逐值序列化
+_CYPHER_STAGE2_TRAVERSE: Final[str] = """
+MATCH (source:Entity)
+WHERE source.uuid IN $entity_uuids
+CALL apoc.path.expandConfig(source, {
+    minLevel: 1,
+    maxLevel: $max_depth,
+    relationshipFilter: '>',
+    labelFilter: '+Entity',
+    uniqueness: 'RELATIONSHIP_GLOBAL',
+    bfs: true
+}) YIELD path
+WITH path
+WHERE all(n IN tail(nodes(path)) WHERE $group_ids IS NULL OR n.group_id IN $group_ids)
+WITH path
+ORDER BY length(path)
+LIMIT 100
+RETURN 'graphiti' as tag, {
+    nodes: [n IN nodes(path) | {uuid: n.uuid, name: n.name, labels: labels(n)}],
+    rels: [r IN relationships(path) | {type: type(r), fact: r.fact}],
+    depth: length(path)
+} as row
+
+UNION ALL
+
+MATCH (source:Entity)
+WHERE source.id IN $entity_ids
+MATCH (source)-[r]->(target:Entity)
+WHERE ($group_ids IS NULL OR target.group_id IN $group_ids)
+WITH DISTINCT source, r, target
+LIMIT 50
+RETURN 'cognee' as tag, {
+    source_id: source.id,
+    source_name: source.name,
+    source_labels: labels(source),
+    target_id: target.id,
+    target_name: target.name,
+    target_labels: labels(target),
+    rel_type: type(r)
+} as row
+"""
+
 
 class IntelligentChatService:
     """智能对话服务"""
@@ -46,6 +234,44 @@ class IntelligentChatService:
         self.llm_client = LLMClient()
         self.milvus = get_milvus_service()
     
+    async def _neo4j(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        在共享线程池中执行Neo4j查询，避免同步Bolt调用阻塞事件循环
+        
+        超过 timeout（秒）时抛出 asyncio.TimeoutError，由调用方降级处理；
+        后台线程中的查询无法中断，会在完成后被丢弃。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _NEO4J_EXECUTOR,
+            functools.partial(neo4j_client.execute_query, query, parameters)
+        )
+        return await asyncio.wait_for(future, timeout=timeout)
+    
+    async def _neo4j_stream(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]],
+        handler,
+        timeout: Optional[float] = None
+    ) -> int:
+        """
+        在共享线程池中流式执行Neo4j查询，handler在工作线程中逐条处理Record
+        
+        超时语义同 _neo4j；超时后handler可能仍在后台执行，调用方应丢弃其部分结果。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _NEO4J_EXECUTOR,
+            functools.partial(neo4j_client.stream_query, query, parameters, handler)
+        )
+        return await asyncio.wait_for(future, timeout=timeout)
+    
     # ==================== 文档入库流程 ====================
     
     async def _save_graphiti_template_to_db(
@@ -4023,7 +4249,7 @@ class IntelligentChatService:
             
             # 检查 collection 是否存在
             if not utility.has_collection(collection_name):
-                logger.warning(f"❌ Milvus collection '{collection_name}' 不存在")
+                logger.warning("❌ Milvus collection '%s' 不存在", collection_name)
                 return []
             
             # 获取 collection
@@ -4037,11 +4263,22 @@ class IntelligentChatService:
             }
             
             # 根据collection类型选择不同的输出字段
+            # text 作为输出字段随向量检索一并返回，chunk内容无需再回查Neo4j
             if collection_name == "Entity_name":
                 output_fields = ["id", "text", "metadata"]
             else:
                 output_fields = ["id", "text"]
             
+            # 校验 collection schema 是否包含输出字段（旧数据可能缺少 text 标量字段）
+            schema_fields = {f.name for f in collection.schema.fields}
+            missing_fields = [f for f in output_fields if f not in schema_fields]
+            if missing_fields:
+                logger.warning(
+                    "⚠️ Milvus collection '%s' 缺少字段 %s，检索结果将不包含这些字段，请重新索引该 collection",
+                    collection_name, missing_fields
+                )
+                output_fields = [f for f in output_fields if f in schema_fields]
+            
             # 执行搜索
             search_results = collection.search(
                 data=[query_embedding],
@@ -4075,15 +4312,15 @@ class IntelligentChatService:
                         # 从metadata中提取group_id等信息
                         result["group_id"] = metadata.get("group_id", "") if isinstance(metadata, dict) else ""
                         # 调试：前3个结果的metadata
-                        if len(results) < 3:
-                            logger.info(f"🔍 Entity_name结果{len(results)}: text={result['text']}, group_id={result['group_id']}, metadata={metadata}, metadata类型={type(metadata)}")
+                        if len(results) < 3 and logger.isEnabledFor(logging.INFO):
+                            logger.info("🔍 Entity_name结果%s: text=%s, group_id=%s, metadata=%s, metadata类型=%s", len(results), result['text'], result['group_id'], metadata, type(metadata))
                     
                     results.append(result)
             
-            logger.info(f"✅ 查询 {collection_name}: 找到 {len(results)} 个结果")
+            logger.info("✅ 查询 %s: 找到 %s 个结果", collection_name, len(results))
             
         except Exception as e:
-            logger.error(f"❌ 查询 Milvus collection '{collection_name}' 失败: {e}", exc_info=True)
+            logger.error("❌ 查询 Milvus collection '%s' 失败: %s", collection_name, e, exc_info=True)
         
         return results
     
@@ -4093,7 +4330,8 @@ class IntelligentChatService:
         top_k: int = 50,
         min_score: float = 70.0,
         group_ids: Optional[List[str]] = None,
-        enable_refine: bool = True
+        enable_refine: bool = True,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """
         智能检索：两阶段检索策略（优化版 v4.0）
@@ -4124,6 +4362,7 @@ class IntelligentChatService:
             min_score: 最小分数阈值，0-100（默认70）
             group_ids: 检索范围（可选，过滤指定文档）
             enable_refine: 是否启用阶段2精细处理（默认True）
+            query_embedding: 调用方已生成的查询向量（可选，避免重复请求embedding服务）
             
         Returns:
             {
@@ -4162,13 +4401,17 @@ class IntelligentChatService:
         import time
         start_time = time.time()
         
-        logger.info(f"🚀 开始智能检索 v4.0: query='{query[:50]}...', top_k={top_k}, min_score={min_score}, enable_refine={enable_refine}")
+        logger.info("🚀 开始智能检索 v4.0: query='%s...', top_k=%s, min_score=%s, enable_refine=%s", query[:50], top_k, min_score, enable_refine)
+        
+        # 归一化为frozenset，组装阶段的成员判断为O(1)
+        group_ids_set = frozenset(group_ids) if group_ids else None
         
         # ========== 阶段1：DocumentChunk粒度检索 ==========
         stage1_start = time.time()
         
-        # 1. 生成查询向量
-        query_embedding = await embedding_client.get_embedding(query)
+        # 1. 生成查询向量（调用方已提供时直接复用）
+        if not query_embedding:
+            query_embedding = await embedding_client.get_embedding(query)
         if not query_embedding:
             return {
                 "success": False,
@@ -4177,18 +4420,17 @@ class IntelligentChatService:
                 "stage2": {"refined_results": [], "total_count": 0}
             }
         
-        logger.info(f"  ✅ 查询向量生成成功（维度：{len(query_embedding)}）")
+        logger.info("  ✅ 查询向量生成成功（维度：%s）", len(query_embedding))
         
         # 2. Milvus检索DocumentChunk_text
         # 注意：DocumentChunk_text collection 中没有 group_id 字段（group_id 在 metadata 中）
         # 因此不能在 Milvus 查询时直接过滤 group_id
-        # 改为：先检索更多结果，然后在应用层通过 Neo4j 查询后的 group_id 进行过滤
-        
-        # 如果指定了 group_ids，需要检索更多结果以确保过滤后仍有足够数量
+        # 改为：在 Neo4j 元数据查询的 WHERE 中过滤 group_id，只补充会被保留的chunk
+        # 指定 group_ids 时过滤会丢弃其他组的chunk，多取一些候选（3倍）保证过滤后仍有 top_k 个
         milvus_top_k = top_k * 3 if group_ids else top_k * 2
-        logger.info(f"  🔍 Milvus检索 DocumentChunk_text (候选数={milvus_top_k})")
+        logger.info("  🔍 Milvus检索 DocumentChunk_text (候选数=%s)", milvus_top_k)
         if group_ids:
-            logger.info(f"    - 指定了 group_ids: {group_ids}, 将在应用层过滤（Neo4j查询后）")
+            logger.info("    - 指定了 group_ids: %s, 将在Neo4j查询中过滤", group_ids)
         
         chunk_results = await self._search_cognee_milvus_collection(
             collection_name="DocumentChunk_text",
@@ -4197,216 +4439,183 @@ class IntelligentChatService:
             filter_expr=None  # 不在 Milvus 层过滤 group_id
         )
         
-        logger.info(f"  ✅ Milvus返回: {len(chunk_results)} 个chunk")
+        logger.info("  ✅ Milvus返回: %s 个chunk", len(chunk_results))
         
         if not chunk_results:
             logger.warning("  ⚠️ Milvus未返回任何结果")
-            return {
-                "success": True,
-                "stage1": {
-                    "chunk_results": [],
-                    "summary": {
-                        "total_chunks": 0,
-                        "total_documents": 0,
-                        "score_range": [0, 0],
-                        "threshold": min_score,
-                        "top_k": top_k,
-                        "filtered_count": 0,
-                        "execution_time": time.time() - stage1_start
-                    }
-                },
-                "stage2": {"refined_results": [], "total_count": 0}
-            }
+            return self._empty_stage1_result(min_score, top_k, 0, stage1_start)
         
         # 3. 过滤分数阈值（转换为百分制并过滤）
-        logger.info(f"  🔍 过滤分数阈值: score >= {min_score}")
-        
-        filtered_chunks = []
-        for chunk in chunk_results:
-            score_100 = float(chunk.get("score", 0.0)) * 100  # 转换为百分制
-            if score_100 >= min_score:
-                chunk["score"] = score_100  # 更新为百分制分数
-                filtered_chunks.append(chunk)
-        
-        logger.info(f"  ✅ 阈值过滤: {len(chunk_results)} → {len(filtered_chunks)} (threshold={min_score})")
-        
-        if not filtered_chunks:
-            logger.warning(f"  ⚠️ 没有chunk满足阈值 {min_score}")
-            return {
-                "success": True,
-                "stage1": {
-                    "chunk_results": [],
-                    "summary": {
-                        "total_chunks": 0,
-                        "total_documents": 0,
-                        "score_range": [0, 0],
-                        "threshold": min_score,
-                        "top_k": top_k,
-                        "filtered_count": 0,
-                        "execution_time": time.time() - stage1_start
-                    }
-                },
-                "stage2": {"refined_results": [], "total_count": 0}
-            }
-        
-        # 4. 排序（按分数从高到低）
-        filtered_chunks.sort(key=lambda x: x["score"], reverse=True)
-        
-        # 5. 截取Top K
-        top_k_chunks = filtered_chunks[:top_k]
-        logger.info(f"  ✅ Top K截取: {len(filtered_chunks)} → {len(top_k_chunks)} (top_k={top_k})")
+        logger.info("  🔍 过滤分数阈值: score >= %s", min_score)
+        
+        # 一次性向量化计算百分制分数与阈值掩码
+        scores_100 = np.fromiter(
+            (chunk.get("score", 0.0) for chunk in chunk_results),
+            dtype=np.float64,
+            count=len(chunk_results)
+        ) * 100.0
+        keep_idx = np.flatnonzero(scores_100 >= min_score)
+        filtered_count = len(keep_idx)
+        
+        logger.info("  ✅ 阈值过滤: %s → %s (threshold=%s)", len(chunk_results), filtered_count, min_score)
+        
+        if not filtered_count:
+            logger.warning("  ⚠️ 没有chunk满足阈值 %s", min_score)
+            return self._empty_stage1_result(min_score, top_k, 0, stage1_start)
+        
+        # 4-5. 排序并截取Top K（稳定排序，同分时保持Milvus返回顺序）
+        # 指定了 group_ids 时保留全部候选，由 Neo4j 按 group_id 过滤后再在组装阶段截取Top K
+        candidate_count = filtered_count if group_ids else top_k
+        order = keep_idx[np.argsort(-scores_100[keep_idx], kind="stable")][:candidate_count]
+        # 百分制分数写入新dict，不修改原结果
+        top_k_chunks = [dict(chunk_results[i], score=float(scores_100[i])) for i in order]
+        logger.info("  ✅ Top K截取: %s → %s (top_k=%s)", filtered_count, len(top_k_chunks), top_k)
         
         # 6. 批量查询Neo4j补充元数据（关键优化：1次查询代替N次）
-        logger.info(f"  🔍 批量查询Neo4j补充元数据")
+        logger.info("  🔍 批量查询Neo4j补充元数据")
         
         chunk_ids = [chunk.get("id") for chunk in top_k_chunks if chunk.get("id")]
         
         if not chunk_ids:
             logger.warning("  ⚠️ 没有有效的chunk ID")
-            return {
-                "success": True,
-                "stage1": {
-                    "chunk_results": [],
-                    "summary": {
-                        "total_chunks": 0,
-                        "total_documents": 0,
-                        "score_range": [0, 0],
-                        "threshold": min_score,
-                        "top_k": top_k,
-                        "filtered_count": len(filtered_chunks),
-                        "execution_time": time.time() - stage1_start
-                    }
-                },
-                "stage2": {"refined_results": [], "total_count": 0}
-            }
+            return self._empty_stage1_result(min_score, top_k, filtered_count, stage1_start)
+        
+        # 先读Redis缓存（chunk元数据变化很少，短TTL缓存可让重复查询跳过Neo4j）
+        cached_meta = await self._get_cached_chunk_meta(chunk_ids)
+        missing_chunk_ids = [cid for cid in chunk_ids if cid not in cached_meta]
+        if cached_meta:
+            logger.info("  ✅ Redis缓存命中: %s 条元数据, 待查询: %s", len(cached_meta), len(missing_chunk_ids))
         
         # 批量查询Neo4j（关键：只查1次！）
-        # 同时获取真实的文档名称（通过group_id）
-        neo4j_query = """
-        MATCH (dc:DocumentChunk)
-        WHERE dc.id IN $chunk_ids
-        OPTIONAL MATCH (dc)-[:is_part_of]->(td:TextDocument)
-        OPTIONAL MATCH (doc:Document)
-        WHERE doc.document_id = dc.group_id OR doc.group_id = dc.group_id
-        RETURN 
-            dc.id as chunk_id,
-            dc.name as chunk_name,
-            dc.group_id as group_id,
-            dc.doc_id as doc_id,
-            dc.chunk_index as chunk_index,
-            td.name as section_name,
-            td.id as section_id,
-            COALESCE(doc.name, doc.filename, doc.title) as document_name
-        """
+        # 一并返回阶段2所需的 Episode group_id 与 TextDocument group_id，
+        # 避免阶段2再发起两次查询（见 _CYPHER_CHUNK_META）
+        fresh_meta = {}
+        if missing_chunk_ids:
+            try:
+                neo4j_results = await self._neo4j(_CYPHER_CHUNK_META, {
+                    "chunk_ids": missing_chunk_ids,
+                    "group_ids": group_ids or None
+                }, timeout=_STAGE1_NEO4J_TIMEOUT)
+                logger.info("  ✅ Neo4j返回: %s 条元数据", len(neo4j_results))
+                
+                # 构建ID到元数据的映射
+                for result in neo4j_results:
+                    chunk_id = result.get("chunk_id")
+                    if chunk_id:
+                        fresh_meta[chunk_id] = ChunkMeta(
+                            chunk_name=result.get("chunk_name", ""),
+                            group_id=result.get("group_id", ""),
+                            doc_id=result.get("doc_id", ""),
+                            chunk_index=result.get("chunk_index", 0),
+                            section_name=result.get("section_name", ""),
+                            section_id=result.get("section_id", ""),
+                            section_group_id=result.get("section_group_id", ""),
+                            episode_group_ids=result.get("episode_group_ids") or []
+                        )
+                await self._cache_chunk_meta(fresh_meta)
+            except asyncio.TimeoutError:
+                # 超时降级：不补充元数据，组装阶段使用默认值
+                logger.warning("  ⚠️ Neo4j批量查询超时（%.1f秒），跳过元数据补充", _STAGE1_NEO4J_TIMEOUT)
+            except Exception as e:
+                logger.error("  ❌ Neo4j批量查询失败: %s", e, exc_info=True)
         
-        # 初始化 metadata_map，确保在所有情况下都有定义
+        # 合并缓存与新查询结果，按chunk顺序排列；缓存结果需按group_ids再过滤一次
         metadata_map = {}
-        try:
-            neo4j_results = neo4j_client.execute_query(neo4j_query, {"chunk_ids": chunk_ids})
-            logger.info(f"  ✅ Neo4j返回: {len(neo4j_results)} 条元数据")
-            
-            # 构建ID到元数据的映射
-            for result in neo4j_results:
-                chunk_id = result.get("chunk_id")
-                if chunk_id:
-                    metadata_map[chunk_id] = {
-                        "chunk_name": result.get("chunk_name", ""),
-                        "group_id": result.get("group_id", ""),
-                        "doc_id": result.get("doc_id", ""),
-                        "chunk_index": result.get("chunk_index", 0),
-                        "section_name": result.get("section_name", ""),
-                        "section_id": result.get("section_id", "")
-                    }
-        except Exception as e:
-            logger.error(f"  ❌ Neo4j批量查询失败: {e}", exc_info=True)
-            metadata_map = {}  # 确保即使出错也有定义
+        for cid in chunk_ids:
+            metadata = fresh_meta.get(cid) or cached_meta.get(cid)
+            if metadata is None:
+                continue
+            if group_ids_set is not None and metadata.group_id not in group_ids_set:
+                continue
+            metadata_map[cid] = metadata
         
         # 6.0 根据TextDocument分组计算章节号
-        # 收集所有TextDocument的id，按创建顺序排序
-        section_id_to_index = {}
-        section_ids = set()
-        for metadata in metadata_map.values():
-            section_id = metadata.get("section_id")
-            if section_id:
-                section_ids.add(section_id)
-        
-        # 如果有多个不同的TextDocument，按id排序分配章节号
-        if len(section_ids) > 1:
-            sorted_section_ids = sorted(section_ids)
-            for idx, sid in enumerate(sorted_section_ids):
-                section_id_to_index[sid] = idx + 1
-        elif len(section_ids) == 1:
-            # 只有一个TextDocument，所有chunk都是第1章
-            section_id_to_index[list(section_ids)[0]] = 1
+        # 按Neo4j返回顺序对TextDocument的id去重（保持顺序，无需再排序），依次分配章节号
+        # 只有一个TextDocument时，所有chunk都是第1章
+        ordered_section_ids = dict.fromkeys(
+            metadata.section_id for metadata in metadata_map.values() if metadata.section_id
+        )
+        section_id_to_index = {sid: idx for idx, sid in enumerate(ordered_section_ids, start=1)}
         
         # 将章节号添加到metadata_map
         for chunk_id, metadata in metadata_map.items():
-            section_id = metadata.get("section_id", "")
+            section_id = metadata.section_id
             if section_id in section_id_to_index:
-                metadata["section_index"] = section_id_to_index[section_id]
+                metadata.section_index = section_id_to_index[section_id]
             else:
-                metadata["section_index"] = 1  # 默认第1章
-        
-        # 6.1 批量查询MySQL获取文档名称
-        from app.core.mysql_client import SessionLocal
-        from app.models.document_upload import DocumentUpload
+                metadata.section_index = 1  # 默认第1章
         
+        # 6.1 批量查询MySQL获取文档名称（先读Redis缓存；异步会话，复用共享连接池，不阻塞事件循环）
         unique_group_ids = set()
         for metadata in metadata_map.values():
-            group_id = metadata.get("group_id")
+            group_id = metadata.group_id
             if group_id:
                 unique_group_ids.add(group_id)
         
-        document_name_map = {}
-        if unique_group_ids:
-            db = SessionLocal()
+        document_name_map = await self._get_cached_document_names(list(unique_group_ids)) if unique_group_ids else {}
+        missing_group_ids = [gid for gid in unique_group_ids if gid not in document_name_map]
+        if missing_group_ids:
             try:
-                documents = db.query(DocumentUpload).filter(
-                    DocumentUpload.document_id.in_(unique_group_ids)
-                ).all()
-                for doc in documents:
-                    document_name_map[doc.document_id] = doc.file_name or "未知文档"
-                logger.info(f"  ✅ MySQL返回: {len(document_name_map)} 个文档名称")
+                fresh_names = await asyncio.wait_for(
+                    self._fetch_document_names(missing_group_ids),
+                    timeout=_STAGE1_MYSQL_TIMEOUT
+                )
+                document_name_map.update(fresh_names)
+                await self._cache_document_names(fresh_names)
+                logger.info("  ✅ MySQL返回: %s 个文档名称", len(fresh_names))
+            except asyncio.TimeoutError:
+                # 超时降级：文档名称使用默认值
+                logger.warning("  ⚠️ MySQL查询超时（%.1f秒），文档名称使用默认值", _STAGE1_MYSQL_TIMEOUT)
             except Exception as e:
-                logger.error(f"  ❌ MySQL查询失败: {e}", exc_info=True)
-            finally:
-                db.close()
+                logger.error("  ❌ MySQL查询失败: %s", e, exc_info=True)
         
         for chunk_id, metadata in metadata_map.items():
-            group_id = metadata.get("group_id", "")
+            group_id = metadata.group_id
             if group_id in document_name_map:
-                metadata["document_name"] = document_name_map[group_id]
+                metadata.document_name = document_name_map[group_id]
         
         # 7. 组装完整的chunk信息
-        logger.info(f"  🔧 组装完整chunk信息")
+        logger.info("  🔧 组装完整chunk信息")
         
         final_chunks = []
         for chunk in top_k_chunks:
+            if len(final_chunks) >= top_k:
+                break
             chunk_id = chunk.get("id")
-            metadata = metadata_map.get(chunk_id, {})
+            metadata = metadata_map.get(chunk_id)
             
             # 如果Neo4j查询失败，使用默认值
-            group_id = metadata.get("group_id", "unknown")
-            if group_ids and group_id not in group_ids:
+            if metadata is None:
+                neo4j_enriched = False
+                metadata = ChunkMeta(group_id="unknown")
+            else:
+                neo4j_enriched = True
+            
+            group_id = metadata.group_id
+            if group_ids_set is not None and group_id not in group_ids_set:
                 # 如果指定了group_ids，但这个chunk不属于，跳过
                 continue
             
+            section_name = metadata.section_name
+            if not section_name or section_name.startswith("text_"):
+                section_name = f"第{metadata.section_index}章"
+            
             final_chunks.append({
                 "uuid": chunk_id,
                 "score": chunk.get("score", 0.0),
                 "content": chunk.get("text", ""),
-                "chunk_index": metadata.get("chunk_index", 0),
-                "section_name": (metadata.get("section_name") if metadata.get("section_name") and not metadata.get("section_name", "").startswith("text_") else f"第{metadata.get('section_index', 1)}章"),
-                "section_id": metadata.get("section_id", ""),
-                "document_name": metadata.get("document_name") or "未知文档",
-                "document_id": metadata.get("doc_id", ""),
+                "chunk_index": metadata.chunk_index,
+                "section_name": section_name,
+                "section_id": metadata.section_id,
+                "document_name": metadata.document_name or "未知文档",
+                "document_id": metadata.doc_id,
                 "group_id": group_id,
                 "metadata": {
                     "source": "DocumentChunk_text",
                     "milvus_search": True,
-                    "neo4j_enriched": bool(metadata)
+                    "neo4j_enriched": neo4j_enriched
                 }
-                    })
+            })
         
         # 8. 统计信息
         scores = [chunk["score"] for chunk in final_chunks]
@@ -4422,16 +4631,14 @@ class IntelligentChatService:
                 "score_range": [max(scores), min(scores)] if scores else [0, 0],
                 "threshold": min_score,
                 "top_k": top_k,
-                "filtered_count": len(filtered_chunks),
+                "filtered_count": filtered_count,
                 "execution_time": round(stage1_time, 2)
             }
         }
         
         logger.info(
-            f"✅ 阶段1完成: 返回 {len(final_chunks)} 个chunk, "
-            f"涉及 {len(documents)} 个文档, "
-            f"分数范围: {stage1_result['summary']['score_range']}, "
-            f"耗时: {stage1_time:.2f}秒"
+            "✅ 阶段1完成: 返回 %s 个chunk, 涉及 %s 个文档, 分数范围: %s, 耗时: %.2f秒",
+            len(final_chunks), len(documents), stage1_result['summary']['score_range'], stage1_time
         )
         
         # ========== 阶段2：精细处理（可选）==========
@@ -4464,16 +4671,22 @@ class IntelligentChatService:
         }
         
         if enable_refine and final_chunks:
-            logger.info(f"🚀 阶段2开始：Graphiti + Cognee 双路扩展")
+            logger.info("🚀 阶段2开始：Graphiti + Cognee 双路扩展")
             
             try:
-                # 收集doc_ids和group_ids
-                unique_doc_ids = list(set(chunk.get("document_id", "") for chunk in final_chunks if chunk.get("document_id")))
-                unique_group_ids = list(set(chunk["group_id"] for chunk in final_chunks if chunk.get("group_id")))
-                logger.info(f"  📋 涉及 {len(unique_doc_ids)} 个文档, {len(unique_group_ids)} 个group_id")
+                # 收集doc_ids和group_ids（单次遍历，dict保序去重，保证Cypher参数顺序稳定）
+                doc_ids_od = {}
+                group_ids_od = {}
+                for chunk in final_chunks:
+                    if chunk.get("document_id"):
+                        doc_ids_od[chunk["document_id"]] = None
+                    if chunk.get("group_id"):
+                        group_ids_od[chunk["group_id"]] = None
+                unique_doc_ids = list(doc_ids_od)
+                unique_group_ids = list(group_ids_od)
+                logger.info("  📋 涉及 %s 个文档, %s 个group_id", len(unique_doc_ids), len(unique_group_ids))
                 
-                # 生成查询向量
-                query_embedding = await embedding_client.get_embedding(query)
+                # 复用阶段1的查询向量（阶段1向量生成失败时已提前返回）
                 if not query_embedding:
                     logger.warning("  ⚠️ 查询向量生成失败，跳过阶段2")
                 else:
@@ -4481,22 +4694,22 @@ class IntelligentChatService:
                     graphiti_entities = []
                     graphiti_entity_uuids = []
                     graphiti_entity_map = {}
+                    milvus_results = []
                     
                     try:
-                        logger.info(f"  🔍 Graphiti扩展：基于Episode检索文档级Entity")
-        
-                        # 步骤1：通过doc_id找到Episode
-                        episode_query = """
-                        MATCH (e:Episodic)
-                        WHERE e.doc_id IN $doc_ids
-                        RETURN DISTINCT e.doc_id as doc_id, e.group_id as group_id, e.version as version
-                        LIMIT 10
-                        """
-                        episodes = neo4j_client.execute_query(episode_query, {"doc_ids": unique_doc_ids}) if unique_doc_ids else []
+                        logger.info("  🔍 Graphiti扩展：基于Episode检索文档级Entity")
+        
+                        # 步骤1：通过doc_id找到Episode（阶段1的元数据查询已一并返回Episode group_id）
+                        episode_group_ids = list(dict.fromkeys(
+                            gid
+                            for chunk in final_chunks
+                            if chunk["uuid"] in metadata_map
+                            for gid in metadata_map[chunk["uuid"]].episode_group_ids
+                            if gid
+                        ))[:10]
                         
-                        if episodes:
-                            episode_group_ids = [ep.get("group_id") for ep in episodes if ep.get("group_id")]
-                            logger.info(f"    ✅ 找到 {len(episodes)} 个Episode, group_ids={len(episode_group_ids)}")
+                        if episode_group_ids:
+                            logger.info("    ✅ 找到 Episode, group_ids=%s", len(episode_group_ids))
                             
                             # 步骤2：使用Milvus的graphiti_entity_vectors检索文档级Entity
                             if self.milvus.is_available():
@@ -4508,183 +4721,179 @@ class IntelligentChatService:
                                     min_score=0.5
                                 )
                                 
-                                logger.info(f"    ✅ Milvus返回 {len(milvus_results)} 个Graphiti Entity")
-                                
-                                # 步骤3：从Neo4j获取Entity详细信息
-                                if milvus_results:
-                                    entity_uuids = [r.uuid for r in milvus_results if r.uuid]
-                                    entity_details_query = """
-                                    MATCH (e:Entity)
-                                    WHERE e.uuid IN $entity_uuids
-                                    RETURN 
-                                        COALESCE(e.uuid, toString(id(e))) as uuid,
-                                        e.name as name,
-                                        labels(e) as labels,
-                                        properties(e) as properties,
-                                        e.group_id as group_id
-                                    """
-                                    entity_details = neo4j_client.execute_query(entity_details_query, {"entity_uuids": entity_uuids})
-                                    
-                                    # 构建Entity信息
-                                    for detail in entity_details:
-                                        entity_uuid = detail.get("uuid", "")
-                                        entity_name = detail.get("name", "")
-                                        labels = detail.get("labels", [])
-                                        properties = detail.get("properties", {})
-                                        
-                                        # 找到对应的Milvus结果获取分数
-                                        milvus_result = next((r for r in milvus_results if r.uuid == entity_uuid), None)
-                                        entity_score = (milvus_result.score * 100) if milvus_result else 0.0
-                                        
-                                        if entity_uuid and entity_uuid not in graphiti_entity_map:
-                                            graphiti_entity_uuids.append(entity_uuid)
-                                            # 从labels中获取类型
-                                            entity_type = "Entity"
-                                            for label in labels:
-                                                if label not in ["Entity", "__Node__"]:
-                                                    entity_type = label
-                                                    break
-                                            
-                                            if entity_type == "Entity":
-                                                entity_type = properties.get("type", "Entity")
-                                            
-                                            entity_info = {
-                                                "uuid": entity_uuid,
-                                                "name": entity_name or "未命名实体",
-                                                "type": entity_type,
-                                                "properties": serialize_neo4j_properties(properties),
-                                                "score": entity_score,
-                                                "relationships": [],
-                                                "paths": [],
-                                                "related_chunks": []
-                                            }
-                                            graphiti_entity_map[entity_uuid] = entity_info
-                                            graphiti_entities.append(entity_info)
-                                    
-                                    logger.info(f"    ✅ 提取到 {len(graphiti_entities)} 个有效Graphiti Entity")
+                                logger.info("    ✅ Milvus返回 %s 个Graphiti Entity", len(milvus_results))
                             else:
                                 logger.warning("    ⚠️ Milvus不可用，跳过Graphiti Entity检索")
                         else:
                             logger.warning("    ⚠️ 未找到Episode，跳过Graphiti扩展")
                             
                     except Exception as e:
-                        logger.error(f"  ❌ Graphiti扩展失败: {e}", exc_info=True)
+                        logger.error("  ❌ Graphiti扩展失败: %s", e, exc_info=True)
                     
                     # ========== Cognee扩展（章节级）==========
                     cognee_entities = []
                     cognee_entity_ids = []
                     cognee_entity_map = {}
+                    cognee_results = []
+                    text_doc_group_ids = []
                     
                     try:
-                        logger.info(f"  🔍 Cognee扩展：基于TextDocument/DataNode检索章节级Entity")
+                        logger.info("  🔍 Cognee扩展：基于TextDocument/DataNode检索章节级Entity")
                         
                         # 步骤1：通过chunk_id找到TextDocument/DataNode
+                        # （阶段1的元数据查询已一并返回 TextDocument group_id）
                         chunk_ids = [chunk.get("uuid", "") for chunk in final_chunks[:20] if chunk.get("uuid")]
                         if chunk_ids:
-                            text_doc_query = """
-                        MATCH (dc:DocumentChunk)
-                            WHERE dc.id IN $chunk_ids
-                        OPTIONAL MATCH (dc)-[:is_part_of]->(td:TextDocument)
-                            RETURN DISTINCT 
-                                COALESCE(td.group_id, dc.group_id) as group_id,
-                                COALESCE(td.doc_id, dc.doc_id) as doc_id
-                            LIMIT 10
-                            """
-                            text_docs = neo4j_client.execute_query(text_doc_query, {"chunk_ids": chunk_ids})
+                            text_doc_group_ids = list(dict.fromkeys(
+                                metadata_map[cid].section_group_id
+                                for cid in chunk_ids
+                                if cid in metadata_map and metadata_map[cid].section_group_id
+                            ))[:10]
                             
-                            if text_docs:
-                                text_doc_group_ids = [td.get("group_id") for td in text_docs if td.get("group_id")]
-                                logger.info(f"    ✅ 找到 {len(text_docs)} 个TextDocument, group_ids={len(text_doc_group_ids)}")
+                            # 步骤2：使用Milvus的Entity_name检索章节级Entity
+                            if text_doc_group_ids:
+                                logger.info("    ✅ 找到 TextDocument, group_ids=%s", len(text_doc_group_ids))
                                 
-                                # 步骤2：使用Milvus的Entity_name检索章节级Entity
-                                if text_doc_group_ids:
-                                    # ⚠️ 重要：Entity_name集合的metadata中没有group_id
-                                    # 因此不能通过Milvus过滤，需要先检索更多结果
-                                    # 然后在Neo4j查询时通过group_id过滤
-                                    cognee_results = await self._search_cognee_milvus_collection(
-                                        collection_name="Entity_name",
-                                        query_embedding=query_embedding,
-                                        top_k=100,  # 检索更多结果，因为无法在Milvus阶段过滤
-                                        filter_expr=None  # 不使用过滤表达式
-                                    )
-                                    
-                                    logger.info(f"    ✅ Milvus返回 {len(cognee_results)} 个Cognee Entity (未过滤，将在Neo4j阶段过滤)")
-                                    
-                                    # 步骤3：从Neo4j获取Entity详细信息，并在Neo4j查询时通过group_id过滤
-                                    if cognee_results:
-                                        # Entity_name集合返回的id是Milvus的id，需要通过text字段匹配Neo4j的Entity
-                                        entity_names = [r.get("text", "") for r in cognee_results if r.get("text")]
-                                        entity_details_query = """
-                                        MATCH (e:Entity)
-                                        WHERE e.name IN $entity_names
-                                          AND e.group_id IN $group_ids
-                        RETURN 
-                                            e.id as id,
-                                            e.name as name,
-                                            labels(e) as labels,
-                                            properties(e) as properties,
-                                            e.group_id as group_id
-                        LIMIT 50
-                        """
-                                        entity_details = neo4j_client.execute_query(entity_details_query, {
-                                            "entity_names": entity_names,
-                                            "group_ids": text_doc_group_ids
-                        })
-
-                                        logger.info(f"    ✅ Neo4j返回 {len(entity_details)} 个Cognee Entity (已通过group_id过滤)")
-                                        
-                                        # 构建Entity信息
-                                        for detail in entity_details:
-                                            entity_id = detail.get("id", "")
-                                            entity_name = detail.get("name", "")
-                                            labels = detail.get("labels", [])
-                                            properties = detail.get("properties", {})
-                                            
-                                            # 通过name匹配找到对应的Milvus结果获取分数
-                                            milvus_result = next((r for r in cognee_results if r.get("text", "") == entity_name), None)
-                                            entity_score = (milvus_result.get("score", 0.0) * 100) if milvus_result else 0.0
-                                            
-                                            if entity_id and entity_id not in cognee_entity_map:
-                                                cognee_entity_ids.append(entity_id)
-                                                # 从labels中获取类型
-                                                entity_type = "Entity"
-                                                for label in labels:
-                                                    if label not in ["Entity", "__Node__"]:
-                                                        entity_type = label
-                                                        break
-                                                
-                                                if entity_type == "Entity":
-                                                    entity_type = properties.get("type", "Entity")
-                                                
-                                                entity_info = {
-                                                    "id": entity_id,
-                                                    "name": entity_name or "未命名实体",
-                                                    "type": entity_type,
-                                                    "properties": serialize_neo4j_properties(properties),
-                                                    "score": entity_score,
-                                                    "relationships": [],
-                                                    "paths": [],
-                                                    "related_chunks": []
-                                                }
-                                                cognee_entity_map[entity_id] = entity_info
-                                                cognee_entities.append(entity_info)
-                                        
-                                        logger.info(f"    ✅ 提取到 {len(cognee_entities)} 个有效Cognee Entity")
+                                # ⚠️ 重要：Entity_name集合的metadata中没有group_id
+                                # 因此不能通过Milvus过滤，需要先检索更多结果
+                                # 然后在Neo4j查询时通过group_id过滤
+                                cognee_results = await self._search_cognee_milvus_collection(
+                                    collection_name="Entity_name",
+                                    query_embedding=query_embedding,
+                                    top_k=100,  # 检索更多结果，因为无法在Milvus阶段过滤
+                                    filter_expr=None  # 不使用过滤表达式
+                                )
+                                
+                                logger.info("    ✅ Milvus返回 %s 个Cognee Entity (未过滤，将在Neo4j阶段过滤)", len(cognee_results))
                         else:
                             logger.warning("    ⚠️ 未找到chunk_id，跳过Cognee扩展")
                             
                     except Exception as e:
-                        logger.error(f"  ❌ Cognee扩展失败: {e}", exc_info=True)
+                        logger.error("  ❌ Cognee扩展失败: %s", e, exc_info=True)
+                    
+                    # ========== 从Neo4j获取Entity详细信息（Graphiti + Cognee 合并为1次查询）==========
+                    entity_uuids = [r.uuid for r in milvus_results if r.uuid]
+                    # Entity_name集合的主键即Cognee DataPoint的id（MilvusAdapter.index_data_points写入str(data_point.id)），
+                    # 与Neo4j中Entity节点的id属性一致，可直接按id查找，无需按name匹配
+                    entity_ids = [str(r["id"]) for r in cognee_results if r.get("id")]
+                    
+                    graphiti_details = []
+                    cognee_details = []
+                    if entity_uuids or entity_ids:
+                        try:
+                            entity_details = await self._neo4j(_CYPHER_ENTITY_DETAILS, {
+                                "entity_uuids": entity_uuids,
+                                "entity_ids": entity_ids,
+                                "group_ids": text_doc_group_ids
+                            }, timeout=_STAGE2_NEO4J_TIMEOUT)
+                            for detail in entity_details:
+                                if detail.get("src") == "graphiti":
+                                    graphiti_details.append(detail)
+                                else:
+                                    cognee_details.append(detail)
+                            logger.info(
+                                "    ✅ Neo4j返回 %s 个Graphiti Entity, %s 个Cognee Entity (已通过group_id过滤)",
+                                len(graphiti_details), len(cognee_details)
+                            )
+                        except Exception as e:
+                            logger.error("  ❌ Entity详细信息查询失败: %s", e, exc_info=True)
+                    
+                    # 构建Graphiti Entity信息
+                    if graphiti_details:
+                        # uuid -> Milvus结果（reversed保证重复uuid时取第一个，即分数最高者）
+                        milvus_by_uuid = {r.uuid: r for r in reversed(milvus_results)}
+                        
+                        for detail in graphiti_details:
+                            entity_uuid = detail.get("key", "")
+                            entity_name = detail.get("name", "")
+                            labels = detail.get("labels", [])
+                            properties = detail.get("properties", {})
+                            
+                            # 找到对应的Milvus结果获取分数
+                            milvus_result = milvus_by_uuid.get(entity_uuid)
+                            entity_score = (milvus_result.score * 100) if milvus_result else 0.0
+                            
+                            if entity_uuid and entity_uuid not in graphiti_entity_map:
+                                graphiti_entity_uuids.append(entity_uuid)
+                                # 从labels中获取类型
+                                entity_type = "Entity"
+                                for label in labels:
+                                    if label not in ["Entity", "__Node__"]:
+                                        entity_type = label
+                                        break
+                                
+                                if entity_type == "Entity":
+                                    entity_type = properties.get("type", "Entity")
+                                
+                                entity_info = {
+                                    "uuid": entity_uuid,
+                                    "name": entity_name or "未命名实体",
+                                    "type": entity_type,
+                                    "properties": serialize_neo4j_properties(properties),
+                                    "score": entity_score,
+                                    "relationships": [],
+                                    "paths": [],
+                                    "related_chunks": []
+                                }
+                                graphiti_entity_map[entity_uuid] = entity_info
+                                graphiti_entities.append(entity_info)
+                        
+                        logger.info("    ✅ 提取到 %s 个有效Graphiti Entity", len(graphiti_entities))
+                    
+                    # 构建Cognee Entity信息
+                    if cognee_details:
+                        # id -> Milvus结果
+                        milvus_by_id = {str(r["id"]): r for r in cognee_results if r.get("id")}
+                        
+                        for detail in cognee_details:
+                            entity_id = detail.get("key", "")
+                            entity_name = detail.get("name", "")
+                            labels = detail.get("labels", [])
+                            properties = detail.get("properties", {})
+                            
+                            # 通过id找到对应的Milvus结果获取分数
+                            milvus_result = milvus_by_id.get(entity_id)
+                            entity_score = (milvus_result.get("score", 0.0) * 100) if milvus_result else 0.0
+                            
+                            if entity_id and entity_id not in cognee_entity_map:
+                                cognee_entity_ids.append(entity_id)
+                                # 从labels中获取类型
+                                entity_type = "Entity"
+                                for label in labels:
+                                    if label not in ["Entity", "__Node__"]:
+                                        entity_type = label
+                                        break
+                                
+                                if entity_type == "Entity":
+                                    entity_type = properties.get("type", "Entity")
+                                
+                                entity_info = {
+                                    "id": entity_id,
+                                    "name": entity_name or "未命名实体",
+                                    "type": entity_type,
+                                    "properties": serialize_neo4j_properties(properties),
+                                    "score": entity_score,
+                                    "relationships": [],
+                                    "paths": [],
+                                    "related_chunks": []
+                                }
+                                cognee_entity_map[entity_id] = entity_info
+                                cognee_entities.append(entity_info)
+                        
+                        logger.info("    ✅ 提取到 %s 个有效Cognee Entity", len(cognee_entities))
+                    
+                    # ========== 关系扩展（Graphiti + Cognee 一次往返） ==========
+                    graphiti_relationships, graphiti_paths, cognee_rel_results = await self._traverse_stage2_relationships(
+                        entity_uuids=graphiti_entity_uuids,
+                        cognee_entity_ids=cognee_entity_ids,
+                        group_ids=unique_group_ids,
+                        max_depth=2
+                    )
                     
                     # ========== Graphiti关系扩展 ==========
                     if graphiti_entity_uuids:
-                        logger.info(f"  🔗 Graphiti图遍历1-2跳关系: {len(graphiti_entity_uuids)} 个Entity")
-                        graphiti_relationships, graphiti_paths = await self._traverse_graphiti_relationships(
-                            entity_uuids=graphiti_entity_uuids,
-                            group_ids=unique_group_ids,
-                            max_depth=2
-                )
-                
+                        logger.info("  🔗 Graphiti图遍历1-2跳关系: %s 个Entity", len(graphiti_entity_uuids))
+                        
                         # 将关系关联到Entity
                         for rel in graphiti_relationships:
                             source_uuid = rel.get("source_uuid", "")
@@ -4721,196 +4930,78 @@ class IntelligentChatService:
                                         "depth": path.get("depth", 0)
                                     })
                         
-                        logger.info(f"  ✅ Graphiti图遍历完成: {len(graphiti_relationships)} 个关系, {len(graphiti_paths)} 个路径")
+                        logger.info("  ✅ Graphiti图遍历完成: %s 个关系, %s 个路径", len(graphiti_relationships), len(graphiti_paths))
                     
                     # ========== Cognee关系扩展 ==========
                     if cognee_entity_ids:
-                        logger.info(f"  🔗 Cognee图遍历1-2跳关系: {len(cognee_entity_ids)} 个Entity")
-                        # Cognee的关系扩展（简化版，使用通用关系查询）
+                        logger.info("  🔗 Cognee图遍历1-2跳关系: %s 个Entity", len(cognee_entity_ids))
+                        # Cognee的关系扩展（简化版，使用通用关系查询，已随Graphiti遍历一并返回）
                         cognee_relationships = []
-                        cognee_paths = []
                         
-                        try:
-                            cognee_rel_query = """
-                            MATCH (source:Entity)
-                            WHERE source.id IN $entity_ids
-                            MATCH (source)-[r]->(target:Entity)
-                            WHERE ($group_ids IS NULL OR target.group_id IN $group_ids)
-                            RETURN DISTINCT
-                                source.id as source_id,
-                                source.name as source_name,
-                                labels(source) as source_labels,
-                                target.id as target_id,
-                                target.name as target_name,
-                                labels(target) as target_labels,
-                                type(r) as rel_type,
-                                properties(r) as rel_props
-                            LIMIT 50
-                            """
-                            cognee_rel_results = neo4j_client.execute_query(cognee_rel_query, {
-                                "entity_ids": cognee_entity_ids,
-                                "group_ids": unique_group_ids
-                            })
+                        for record in cognee_rel_results:
+                            source_id = record.get("source_id", "")
+                            target_id = record.get("target_id", "")
+                            rel_type = record.get("rel_type", "")
                             
-                            for record in cognee_rel_results:
-                                source_id = record.get("source_id", "")
-                                target_id = record.get("target_id", "")
-                                rel_type = record.get("rel_type", "")
-                                
-                                if source_id in cognee_entity_map:
-                                    cognee_entity_map[source_id]["relationships"].append({
-                                        "type": rel_type,
-                                        "target": record.get("target_name", ""),
-                                        "target_id": target_id,
-                                        "target_type": record.get("target_labels", ["Entity"])[0] if record.get("target_labels") else "Entity"
-                                    })
-                                
-                                cognee_relationships.append({
-                                    "source_id": source_id,
+                            if source_id in cognee_entity_map:
+                                cognee_entity_map[source_id]["relationships"].append({
+                                    "type": rel_type,
+                                    "target": record.get("target_name", ""),
                                     "target_id": target_id,
-                                    "type": rel_type
+                                    "target_type": record.get("target_labels", ["Entity"])[0] if record.get("target_labels") else "Entity"
                                 })
                             
-                            logger.info(f"  ✅ Cognee图遍历完成: {len(cognee_relationships)} 个关系")
-                        except Exception as e:
-                            logger.error(f"  ❌ Cognee关系扩展失败: {e}", exc_info=True)
-                            
-                    # ========== 关联Entity到chunk ==========
-                    logger.info(f"  🔗 关联Entity到chunk")
-                    chunk_keywords = self._extract_keywords_from_chunks(final_chunks[:10])
-                    
-                    # Graphiti Entity关联chunk
-                    for entity in graphiti_entities:
-                        entity_name = entity.get("name", "").lower()
-                        related_chunks = []
-                        
-                        for chunk in final_chunks:
-                            chunk_content = chunk.get("content", "").lower()
-                            if entity_name in chunk_content or any(
-                                keyword in entity_name for keyword in chunk_keywords if len(keyword) > 3
-                            ):
-                                related_chunks.append({
-                                    "uuid": chunk.get("uuid", ""),
-                                    "score": chunk.get("score", 0.0),
-                                    "content_preview": chunk.get("content", "")[:200] + "...",
-                                    "section_name": chunk.get("section_name", ""),
-                                    "document_name": chunk.get("document_name", "")
-                                })
+                            cognee_relationships.append({
+                                "source_id": source_id,
+                                "target_id": target_id,
+                                "type": rel_type
+                            })
                         
-                        entity["related_chunks"] = related_chunks[:5]
+                        logger.info("  ✅ Cognee图遍历完成: %s 个关系", len(cognee_relationships))
                     
-                    # Cognee Entity关联chunk
-                    for entity in cognee_entities:
-                        entity_name = entity.get("name", "").lower()
-                        related_chunks = []
+                    # ========== 关联Entity到chunk ==========
+                    # 阶段2只在final_chunks非空时执行；没有任何Entity时关联和构图都是空操作，直接跳过
+                    if not graphiti_entities and not cognee_entities:
+                        graphiti_nodes, graphiti_edges = [], []
+                        cognee_nodes, cognee_edges = [], []
+                    else:
+                        logger.info("  🔗 关联Entity到chunk")
+                        chunk_keywords = self._extract_keywords_from_chunks(final_chunks[:10])
+                        # chunk的匹配文本和预览只构建一次，Graphiti、Cognee两部分共用；
+                        # 只有存在区分大小写的Entity名称（如英文）时才需要小写化chunk，纯中文名称直接匹配原文
+                        needs_lower = any(
+                            (name := entity.get("name", "")).lower() != name.upper()
+                            for entity in graphiti_entities + cognee_entities
+                        )
+                        lc_chunks, chunk_views = self._prepare_chunk_views(final_chunks, lowercase=needs_lower)
                         
-                        for chunk in final_chunks:
-                            chunk_content = chunk.get("content", "").lower()
-                            if entity_name in chunk_content or any(
-                                keyword in entity_name for keyword in chunk_keywords if len(keyword) > 3
-                            ):
-                                related_chunks.append({
-                                    "uuid": chunk.get("uuid", ""),
-                                    "score": chunk.get("score", 0.0),
-                                    "content_preview": chunk.get("content", "")[:200] + "...",
-                                    "section_name": chunk.get("section_name", ""),
-                                    "document_name": chunk.get("document_name", "")
-                                })
+                        # 规模较大时由Neo4j全文索引完成名称匹配；全文索引不可用时改在进程池中匹配，
+                        # 避免大量纯Python计算与事件循环争抢GIL；都失败时返回None，由各线程内存扫描
+                        name_hits = None
+                        if (len(graphiti_entities) + len(cognee_entities)) * len(final_chunks) >= _FULLTEXT_LINK_MIN_PAIRS:
+                            name_hits = await self._query_chunk_fulltext_hits(
+                                graphiti_entities + cognee_entities, lc_chunks, chunk_views
+                            )
+                            if name_hits is None:
+                                name_hits = await self._match_names_in_process_pool(
+                                    graphiti_entities + cognee_entities, lc_chunks
+                                )
+                        
+                        # Graphiti、Cognee两部分互不共享可变状态，且都是纯CPU计算，放到线程中并行执行
+                        (
+                            (graphiti_entities, graphiti_nodes, graphiti_edges),
+                            (cognee_entities, cognee_nodes, cognee_edges),
+                        ) = await asyncio.gather(
+                            asyncio.to_thread(
+                                self._build_graph_bundle_graphiti, graphiti_entities, lc_chunks, chunk_views, chunk_keywords,
+                                name_hits
+                            ),
+                            asyncio.to_thread(
+                                self._build_graph_bundle_cognee, cognee_entities, lc_chunks, chunk_views, chunk_keywords,
+                                name_hits
+                            ),
+                        )
                         
-                        entity["related_chunks"] = related_chunks[:5]
-                    
-                    # ========== 构建关系图 ==========
-                    # Graphiti关系图
-                    graphiti_nodes = []
-                    graphiti_edges = []
-                    graphiti_node_map = {}
-                    
-                    for idx, entity in enumerate(graphiti_entities):
-                        graphiti_node_map[entity["uuid"]] = idx
-                        graphiti_nodes.append({
-                            "id": entity["uuid"],
-                            "name": entity["name"],
-                            "type": entity["type"],
-                            "score": entity["score"],
-                            "properties": entity["properties"]
-                        })
-                    
-                    graphiti_edge_set = set()
-                    # 先添加所有检索到的Entity作为节点（即使target不在检索结果中，也添加为节点）
-                    for entity in graphiti_entities:
-                        for rel in entity["relationships"]:
-                            target_uuid = rel.get("target_uuid", "")
-                            target_name = rel.get("target", "")
-                            target_type = rel.get("target_type", "Entity")
-                            
-                            # 如果target不在节点映射中，添加为节点
-                            if target_uuid and target_uuid not in graphiti_node_map:
-                                graphiti_node_map[target_uuid] = len(graphiti_nodes)
-                                graphiti_nodes.append({
-                                    "id": target_uuid,
-                                    "name": target_name,
-                                    "type": target_type,
-                                    "score": 0.0,  # target不在检索结果中，分数为0
-                                    "properties": {}
-                                })
-                            
-                            # 添加边（无论target是否在检索结果中）
-                            if target_uuid:
-                                edge_key = (entity["uuid"], target_uuid, rel.get("type", ""))
-                                if edge_key not in graphiti_edge_set:
-                                    graphiti_edge_set.add(edge_key)
-                                    graphiti_edges.append({
-                                        "source": entity["uuid"],
-                                        "target": target_uuid,
-                                        "type": rel.get("type", ""),
-                                        "fact": rel.get("fact", "")
-                                    })
-                    
-                    # Cognee关系图
-                    cognee_nodes = []
-                    cognee_edges = []
-                    cognee_node_map = {}
-                    
-                    for idx, entity in enumerate(cognee_entities):
-                        cognee_node_map[entity["id"]] = idx
-                        cognee_nodes.append({
-                            "id": entity["id"],
-                            "name": entity["name"],
-                            "type": entity["type"],
-                            "score": entity["score"],
-                            "properties": entity["properties"]
-                        })
-                    
-                    cognee_edge_set = set()
-                    # 先添加所有检索到的Entity作为节点（即使target不在检索结果中，也添加为节点）
-                    for entity in cognee_entities:
-                        for rel in entity["relationships"]:
-                            target_id = rel.get("target_id", "")
-                            target_name = rel.get("target", "")
-                            target_type = rel.get("target_type", "Entity")
-                    
-                            # 如果target不在节点映射中，添加为节点
-                            if target_id and target_id not in cognee_node_map:
-                                cognee_node_map[target_id] = len(cognee_nodes)
-                                cognee_nodes.append({
-                                    "id": target_id,
-                                    "name": target_name,
-                                    "type": target_type,
-                                    "score": 0.0,  # target不在检索结果中，分数为0
-                                    "properties": {}
-                                })
-                            
-                            # 添加边（无论target是否在检索结果中）
-                            if target_id:
-                                edge_key = (entity["id"], target_id, rel.get("type", ""))
-                                if edge_key not in cognee_edge_set:
-                                    cognee_edge_set.add(edge_key)
-                                    cognee_edges.append({
-                                        "source": entity["id"],
-                                        "target": target_id,
-                                        "type": rel.get("type", "")
-                                    })
-                    
                     # ========== 更新结果 ==========
                     stage2_result = {
                         "graphiti": {
@@ -4941,13 +5032,12 @@ class IntelligentChatService:
                     
                     stage2_time = time.time() - stage2_start
                     logger.info(
-                        f"✅ 阶段2完成: "
-                        f"Graphiti(Entity={len(graphiti_entities)}, 关系={len(graphiti_edges)}), "
-                        f"Cognee(Entity={len(cognee_entities)}, 关系={len(cognee_edges)}), "
-                        f"耗时={stage2_time:.2f}秒"
+                        "✅ 阶段2完成: Graphiti(Entity=%s, 关系=%s), Cognee(Entity=%s, 关系=%s), 耗时=%.2f秒",
+                        len(graphiti_entities), len(graphiti_edges),
+                        len(cognee_entities), len(cognee_edges), stage2_time
                     )
             except Exception as e:
-                logger.error(f"❌ 阶段2执行失败: {e}", exc_info=True)
+                logger.error("❌ 阶段2执行失败: %s", e, exc_info=True)
                 # 失败时返回空结果，不影响阶段1
                 stage2_result = {
                     "graphiti": {
@@ -4970,10 +5060,8 @@ class IntelligentChatService:
         total_time = time.time() - start_time
         
         logger.info(
-            f"✅ 智能检索v4.0完成: "
-            f"阶段1={stage1_time:.2f}秒 (chunk={len(final_chunks)}, doc={len(documents)}), "
-            f"阶段2={stage2_time:.2f}秒, "
-            f"总计={total_time:.2f}秒"
+            "✅ 智能检索v4.0完成: 阶段1=%.2f秒 (chunk=%s, doc=%s), 阶段2=%.2f秒, 总计=%.2f秒",
+            stage1_time, len(final_chunks), len(documents), stage2_time, total_time
         )
         
         return {
@@ -4990,162 +5078,510 @@ class IntelligentChatService:
     
     # ==================== 辅助方法 ====================
     
-    async def _traverse_graphiti_relationships(
+    async def _get_cached_chunk_meta(self, chunk_ids: List[str]) -> Dict[str, ChunkMeta]:
+        """从Redis批量读取chunk元数据缓存（同步Redis调用放到线程中执行），读取失败或超时时返回空字典"""
+        def read() -> Dict[str, ChunkMeta]:
+            values = get_redis_client().mget([f"{_CHUNK_META_CACHE_PREFIX}{cid}" for cid in chunk_ids])
+            return {cid: ChunkMeta(**json.loads(value)) for cid, value in zip(chunk_ids, values) if value}
+        
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(read), timeout=_STAGE1_REDIS_TIMEOUT)
+        except Exception as e:
+            logger.warning("Redis chunk元数据缓存读取失败，继续查询Neo4j: %r", e)
+            return {}
+    
+    async def _cache_chunk_meta(self, metadata_map: Dict[str, ChunkMeta]) -> None:
+        """将chunk元数据写入Redis缓存（短TTL，同步Redis调用放到线程中执行）"""
+        if not metadata_map:
+            return
+        
+        def write() -> None:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for cid, metadata in metadata_map.items():
+                pipe.set(
+                    f"{_CHUNK_META_CACHE_PREFIX}{cid}",
+                    json.dumps(asdict(metadata), ensure_ascii=False),
+                    ex=_SMART_RETRIEVAL_CACHE_TTL
+                )
+            pipe.execute()
+        
+        try:
+            await asyncio.wait_for(asyncio.to_thread(write), timeout=_STAGE1_REDIS_TIMEOUT)
+        except Exception as e:
+            logger.warning("Redis chunk元数据缓存写入失败: %r", e)
+    
+    async def _fetch_document_names(self, group_ids: List[str]) -> Dict[str, str]:
+        """从MySQL批量查询文档名称（group_id -> 文件名）"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(DocumentUpload).where(DocumentUpload.document_id.in_(group_ids))
+            )
+            documents = result.scalars().all()
+        return {doc.document_id: doc.file_name or "未知文档" for doc in documents}
+    
+    async def _get_cached_document_names(self, group_ids: List[str]) -> Dict[str, str]:
+        """从Redis批量读取文档名称缓存（group_id -> 文件名，同步Redis调用放到线程中执行），读取失败或超时时返回空字典"""
+        def read() -> Dict[str, str]:
+            values = get_redis_client().mget([f"{_DOCUMENT_NAME_CACHE_PREFIX}{gid}" for gid in group_ids])
+            return {gid: value for gid, value in zip(group_ids, values) if value}
+        
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(read), timeout=_STAGE1_REDIS_TIMEOUT)
+        except Exception as e:
+            logger.warning("Redis文档名称缓存读取失败，继续查询MySQL: %r", e)
+            return {}
+    
+    async def _cache_document_names(self, document_name_map: Dict[str, str]) -> None:
+        """将文档名称写入Redis缓存（短TTL，同步Redis调用放到线程中执行）"""
+        if not document_name_map:
+            return
+        
+        def write() -> None:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for gid, name in document_name_map.items():
+                pipe.set(f"{_DOCUMENT_NAME_CACHE_PREFIX}{gid}", name, ex=_SMART_RETRIEVAL_CACHE_TTL)
+            pipe.execute()
+        
+        try:
+            await asyncio.wait_for(asyncio.to_thread(write), timeout=_STAGE1_REDIS_TIMEOUT)
+        except Exception as e:
+            logger.warning("Redis文档名称缓存写入失败: %r", e)
+    
+    def _empty_stage1_result(
+        self,
+        min_score: float,
+        top_k: int,
+        filtered_count: int,
+        stage1_start: float
+    ) -> Dict[str, Any]:
+        """
+        构建智能检索阶段1无结果时的返回值
+        
+        Args:
+            min_score: 使用的分数阈值
+            top_k: 使用的Top K
+            filtered_count: 满足阈值的chunk数
+            stage1_start: 阶段1开始时间戳
+            
+        Returns:
+            与 smart_retrieval 成功返回结构一致的空结果
+        """
+        import time
+        return {
+            "success": True,
+            "stage1": {
+                "chunk_results": [],
+                "summary": {
+                    "total_chunks": 0,
+                    "total_documents": 0,
+                    "score_range": [0, 0],
+                    "threshold": min_score,
+                    "top_k": top_k,
+                    "filtered_count": filtered_count,
+                    "execution_time": time.time() - stage1_start
+                }
+            },
+            "stage2": {"refined_results": [], "total_count": 0}
+        }
+    
+    async def _traverse_stage2_relationships(
         self,
         entity_uuids: List[str],
+        cognee_entity_ids: List[str],
         group_ids: Optional[List[str]] = None,
         max_depth: int = 2
-    ) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    ) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
-        图遍历Graphiti Entity的1-2跳关系
+        一次Neo4j往返完成关系扩展：Graphiti Entity的1-2跳关系 + Cognee Entity的1跳关系
         
         Args:
-            entity_uuids: Entity UUID列表
+            entity_uuids: Graphiti Entity UUID列表
+            cognee_entity_ids: Cognee Entity ID列表
             group_ids: 文档组ID列表（可选，用于过滤）
-            max_depth: 最大遍历深度（1或2）
+            max_depth: Graphiti最大遍历深度（1或2）
             
         Returns:
-            (relationships, paths): 关系列表和路径列表
+            (relationships, paths, cognee_records): Graphiti关系列表、Graphiti路径列表、Cognee关系记录列表
         """
-        relationships = []
+        # (source_uuid, target_uuid, type) -> 关系：边读取边去重，服务端去重只在单个种子内，
+        # 不同种子可能到达同一关系
+        relationships: Dict[tuple, Dict[str, Any]] = {}
         paths = []
+        cognee_records = []
         
-        if not entity_uuids:
-            return relationships, paths
+        if not entity_uuids and not cognee_entity_ids:
+            return [], paths, cognee_records
         
         try:
             # 限制种子数量，避免查询过大
             seed_uuids = entity_uuids[:20]
             
-            # 构建查询：1-2跳关系遍历
+            # 构建查询：Graphiti 1-2跳关系遍历 + Cognee 1跳关系
             # 查询所有关系类型：RELATES_TO, HAS_FEATURE, BELONGS_TO, HAS_MODULE, DEPENDS_ON, IMPLEMENTS等
-            query = """
-            MATCH (source:Entity)
-            WHERE source.uuid IN $entity_uuids
-            WITH source
-            
-            // 1跳关系
-            MATCH (source)-[r1]->(target1:Entity)
-            WHERE ($group_ids IS NULL OR target1.group_id IN $group_ids)
-            WITH source, target1, r1, 1 as depth
-            
-            // 可选：2跳关系
-            OPTIONAL MATCH (target1)-[r2]->(target2:Entity)
-            WHERE ($group_ids IS NULL OR target2.group_id IN $group_ids)
-              AND depth = 1
-              AND $max_depth >= 2
-            
-            WITH source, target1, r1, target2, r2, depth
-            ORDER BY depth, source.uuid
-            
-            RETURN DISTINCT
-                source.uuid as source_uuid,
-                source.name as source_name,
-                labels(source) as source_labels,
-                target1.uuid as target1_uuid,
-                target1.name as target1_name,
-                labels(target1) as target1_labels,
-                type(r1) as rel1_type,
-                r1.fact as rel1_fact,
-                properties(r1) as rel1_props,
-                target2.uuid as target2_uuid,
-                target2.name as target2_name,
-                labels(target2) as target2_labels,
-                type(r2) as rel2_type,
-                r2.fact as rel2_fact,
-                properties(r2) as rel2_props,
-                depth
-            LIMIT 100
-            """
-            
             params = {
                 "entity_uuids": seed_uuids,
+                "entity_ids": cognee_entity_ids,
                 "group_ids": group_ids,
                 "max_depth": max_depth
             }
             
-            results = neo4j_client.execute_query(query, params)
-            
-            # 处理1跳关系
-            for record in results or []:
-                source_uuid = record.get("source_uuid", "")
-                source_name = record.get("source_name", "")
-                source_labels = record.get("source_labels", [])
-                source_type = source_labels[0] if source_labels else "Entity"
+            # Graphiti每行是一条路径（服务端已组装成单个map）：只取最后一跳，前缀关系已由更短的路径给出
+            def handle_row(record) -> None:
+                row = record["row"]
+                if record["tag"] == "cognee":
+                    cognee_records.append(row)
+                    return
                 
-                target1_uuid = record.get("target1_uuid", "")
-                target1_name = record.get("target1_name", "")
-                target1_labels = record.get("target1_labels", [])
-                target1_type = target1_labels[0] if target1_labels else "Entity"
+                path_nodes = row.get("nodes") or []
+                path_rels = row.get("rels") or []
+                depth = row.get("depth", len(path_rels))
+                if len(path_nodes) < 2 or not path_rels:
+                    return
                 
-                rel1_type = record.get("rel1_type", "")
-                rel1_fact = record.get("rel1_fact", "")
-                rel1_props = record.get("rel1_props", {})
+                entities = [
+                    {
+                        "uuid": node.get("uuid", ""),
+                        "name": node.get("name", ""),
+                        "type": node["labels"][0] if node.get("labels") else "Entity"
+                    }
+                    for node in path_nodes
+                ]
+                source, target = entities[-2], entities[-1]
+                rel = path_rels[-1]
+                rel_key = (source["uuid"], target["uuid"], rel.get("type", ""))
                 
-                # 添加1跳关系
-                relationships.append({
-                    "source_uuid": source_uuid,
-                    "source_name": source_name,
-                    "source_type": source_type,
-                    "target_uuid": target1_uuid,
-                    "target_name": target1_name,
-                    "target_type": target1_type,
-                    "type": rel1_type,
-                    "fact": rel1_fact,
-                    "properties": serialize_neo4j_properties(rel1_props),
-                    "depth": 1
-                })
+                if rel_key not in relationships:
+                    relationships[rel_key] = {
+                        "source_uuid": source["uuid"],
+                        "source_name": source["name"],
+                        "source_type": source["type"],
+                        "target_uuid": target["uuid"],
+                        "target_name": target["name"],
+                        "target_type": target["type"],
+                        "type": rel.get("type", ""),
+                        "fact": rel.get("fact", ""),
+                        "depth": depth
+                    }
                 
-                # 处理2跳关系（如果存在）
-                target2_uuid = record.get("target2_uuid")
-                if target2_uuid and max_depth >= 2:
-                    target2_name = record.get("target2_name", "")
-                    target2_labels = record.get("target2_labels", [])
-                    target2_type = target2_labels[0] if target2_labels else "Entity"
-                    
-                    rel2_type = record.get("rel2_type", "")
-                    rel2_fact = record.get("rel2_fact", "")
-                    rel2_props = record.get("rel2_props", {})
-                    
-                    # 添加2跳关系
-                    relationships.append({
-                        "source_uuid": target1_uuid,
-                        "source_name": target1_name,
-                        "source_type": target1_type,
-                        "target_uuid": target2_uuid,
-                        "target_name": target2_name,
-                        "target_type": target2_type,
-                        "type": rel2_type,
-                        "fact": rel2_fact,
-                        "properties": serialize_neo4j_properties(rel2_props),
-                        "depth": 2
-                    })
-                    
-                    # 构建路径
+                # 构建路径（2跳）
+                if depth >= 2:
                     paths.append({
-                        "entities": [
-                            {"uuid": source_uuid, "name": source_name, "type": source_type},
-                            {"uuid": target1_uuid, "name": target1_name, "type": target1_type},
-                            {"uuid": target2_uuid, "name": target2_name, "type": target2_type}
-                        ],
-                        "relationships": [rel1_type, rel2_type],
-                        "depth": 2
+                        "entities": entities,
+                        "relationships": [r.get("type", "") for r in path_rels],
+                        "depth": depth
                     })
             
-            # 去重关系
-            seen_rels = set()
-            unique_relationships = []
-            for rel in relationships:
-                rel_key = (rel["source_uuid"], rel["target_uuid"], rel["type"])
-                if rel_key not in seen_rels:
-                    seen_rels.add(rel_key)
-                    unique_relationships.append(rel)
+            # 记录在Neo4j线程中边读取边处理，不再先缓冲为 record.data() 列表
+            await self._neo4j_stream(_CYPHER_STAGE2_TRAVERSE, params, handle_row, timeout=_STAGE2_NEO4J_TIMEOUT)
             
-            return unique_relationships, paths
+            return list(relationships.values()), paths, cognee_records
             
         except Exception as e:
-            logger.error(f"图遍历失败: {e}", exc_info=True)
-            return [], []
+            logger.error("图遍历失败: %s", e, exc_info=True)
+            return [], [], []
+    
+    def _build_graph_bundle_graphiti(
+        self,
+        graphiti_entities: List[Dict[str, Any]],
+        lc_chunks: List[str],
+        chunk_views: List[Dict[str, Any]],
+        chunk_keywords: List[str],
+        name_hits: Optional[Dict[str, List[int]]] = None
+    ) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        关联Graphiti Entity到chunk并构建关系图
+        
+        Returns:
+            (entities, nodes, edges)
+        """
+        self._link_entities_to_chunks(graphiti_entities, lc_chunks, chunk_views, chunk_keywords, name_hits)
+        
+        graphiti_node_map = {entity["uuid"]: idx for idx, entity in enumerate(graphiti_entities)}
+        graphiti_nodes = [
+            {
+                "id": entity["uuid"],
+                "name": entity["name"],
+                "type": entity["type"],
+                "score": entity["score"],
+                "properties": entity["properties"]
+            }
+            for entity in graphiti_entities
+        ]
+        # edge_key -> edge：setdefault 一次完成去重和写入
+        graphiti_edges: Dict[tuple, Dict[str, Any]] = {}
+        nodes_append = graphiti_nodes.append
+        add_edge = graphiti_edges.setdefault
+        # 关系先展平为元组列表，构图循环只做元组解包
+        all_edges = [
+            (
+                entity["uuid"],
+                rel.get("target_uuid", ""),
+                rel.get("target", ""),
+                rel.get("target_type", "Entity"),
+                rel.get("type", ""),
+                rel.get("fact", "")
+            )
+            for entity in graphiti_entities
+            for rel in entity["relationships"]
+        ]
+        
+        # 先添加所有检索到的Entity作为节点（即使target不在检索结果中，也添加为节点）
+        for source_uuid, target_uuid, target_name, target_type, rel_type, fact in all_edges:
+            if not target_uuid:
+                continue
+            
+            # 如果target不在节点映射中，添加为节点
+            if target_uuid not in graphiti_node_map:
+                graphiti_node_map[target_uuid] = len(graphiti_nodes)
+                nodes_append({
+                    "id": target_uuid,
+                    "name": target_name,
+                    "type": target_type,
+                    "score": 0.0,  # target不在检索结果中，分数为0
+                    "properties": {}
+                })
+            
+            # 添加边（无论target是否在检索结果中）
+            add_edge((source_uuid, target_uuid, rel_type), {
+                "source": source_uuid,
+                "target": target_uuid,
+                "type": rel_type,
+                "fact": fact
+            })
+        
+        return graphiti_entities, graphiti_nodes, list(graphiti_edges.values())
+    
+    def _build_graph_bundle_cognee(
+        self,
+        cognee_entities: List[Dict[str, Any]],
+        lc_chunks: List[str],
+        chunk_views: List[Dict[str, Any]],
+        chunk_keywords: List[str],
+        name_hits: Optional[Dict[str, List[int]]] = None
+    ) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        关联Cognee Entity到chunk并构建关系图
+        
+        Returns:
+            (entities, nodes, edges)
+        """
+        self._link_entities_to_chunks(cognee_entities, lc_chunks, chunk_views, chunk_keywords, name_hits)
+        
+        cognee_node_map = {entity["id"]: idx for idx, entity in enumerate(cognee_entities)}
+        cognee_nodes = [
+            {
+                "id": entity["id"],
+                "name": entity["name"],
+                "type": entity["type"],
+                "score": entity["score"],
+                "properties": entity["properties"]
+            }
+            for entity in cognee_entities
+        ]
+        # edge_key -> edge：setdefault 一次完成去重和写入
+        cognee_edges: Dict[tuple, Dict[str, Any]] = {}
+        nodes_append = cognee_nodes.append
+        add_edge = cognee_edges.setdefault
+        # 关系先展平为元组列表，构图循环只做元组解包
+        all_edges = [
+            (
+                entity["id"],
+                rel.get("target_id", ""),
+                rel.get("target", ""),
+                rel.get("target_type", "Entity"),
+                rel.get("type", "")
+            )
+            for entity in cognee_entities
+            for rel in entity["relationships"]
+        ]
+        
+        # 先添加所有检索到的Entity作为节点（即使target不在检索结果中，也添加为节点）
+        for source_id, target_id, target_name, target_type, rel_type in all_edges:
+            if not target_id:
+                continue
+            
+            # 如果target不在节点映射中，添加为节点
+            if target_id not in cognee_node_map:
+                cognee_node_map[target_id] = len(cognee_nodes)
+                nodes_append({
+                    "id": target_id,
+                    "name": target_name,
+                    "type": target_type,
+                    "score": 0.0,  # target不在检索结果中，分数为0
+                    "properties": {}
+                })
+            
+            # 添加边（无论target是否在检索结果中）
+            add_edge((source_id, target_id, rel_type), {
+                "source": source_id,
+                "target": target_id,
+                "type": rel_type
+            })
+        
+        return cognee_entities, cognee_nodes, list(cognee_edges.values())
+    
+    def _prepare_chunk_views(
+        self,
+        final_chunks: List[Dict[str, Any]],
+        lowercase: bool = True
+    ) -> tuple[List[str], List[Dict[str, Any]]]:
+        """
+        为Entity关联预先构建chunk的匹配文本和关联视图（与final_chunks一一对应）
+        
+        不直接写回chunk字典，避免内部字段出现在返回结果中。
+        
+        Args:
+            final_chunks: 阶段1最终chunk列表
+            lowercase: 是否小写化匹配文本；Entity名称都不含大小写字母（如纯中文）时
+                原文匹配结果相同，可省去每个chunk一次完整的字符串复制
+        
+        Returns:
+            (lc_chunks, chunk_views): 匹配文本列表和related_chunks条目列表
+        """
+        lc_chunks = []
+        chunk_views = []
+        for chunk in final_chunks:
+            content = chunk.get("content", "")
+            lc_chunks.append(content.lower() if lowercase else content)
+            chunk_views.append({
+                "uuid": chunk.get("uuid", ""),
+                "score": chunk.get("score", 0.0),
+                "content_preview": content[:200] + "...",
+                "section_name": chunk.get("section_name", ""),
+                "document_name": chunk.get("document_name", "")
+            })
+        return lc_chunks, chunk_views
+    
+    def _link_entities_to_chunks(
+        self,
+        entities: List[Dict[str, Any]],
+        lc_chunks: List[str],
+        chunk_views: List[Dict[str, Any]],
+        chunk_keywords: List[str],
+        name_hits: Optional[Dict[str, List[int]]] = None,
+        max_related: int = _MAX_RELATED_CHUNKS
+    ) -> None:
+        """
+        将Entity关联到chunk，结果写入 entity["related_chunks"]
+        
+        提供了name_hits（全文索引或进程池的匹配结果）时直接按结果关联，
+        否则在当前线程中用 match_names_in_texts 匹配。
+        
+        Args:
+            entities: Entity列表（原地更新）
+            lc_chunks: chunk匹配文本（按分数排序，见 _prepare_chunk_views）
+            chunk_views: 与lc_chunks对应的related_chunks条目
+            chunk_keywords: 从chunk中提取的关键词
+            name_hits: 小写名称 -> 命中chunk下标列表（按chunk顺序）
+            max_related: 每个Entity最多关联的chunk数量
+        """
+        if not entities:
+            return
+        
+        # 关键词命中只取决于Entity名称：先对每个Entity做一次 O(K) 预判，
+        # 命中直接取分数最高的前几个chunk，只有其余Entity才需要逐chunk扫描
+        long_keywords = tuple(keyword for keyword in chunk_keywords if len(keyword) > 3)
+        top_views = chunk_views[:max_related]
+        
+        buckets: List[List[Dict[str, Any]]] = [[] for _ in entities]
+        # 小写名称 -> 需要逐chunk匹配的Entity下标（同名Entity共享一次匹配）
+        pending: Dict[str, List[int]] = {}
+        for idx, entity in enumerate(entities):
+            entity_name = entity.get("name", "").lower()
+            if not entity_name:
+                # 空名称不关联任何chunk（空串是任何内容的子串，原先会误关联全部chunk）
+                continue
+            if any(keyword in entity_name for keyword in long_keywords):
+                buckets[idx] = top_views
+            else:
+                pending.setdefault(entity_name, []).append(idx)
+        
+        if pending:
+            if name_hits is None:
+                names = list(pending)
+                name_hits = dict(zip(names, match_names_in_texts(lc_chunks, names, max_related)))
+            
+            for entity_name, indices in pending.items():
+                related = [chunk_views[pos] for pos in name_hits.get(entity_name, ())[:max_related]]
+                for idx in indices:
+                    buckets[idx] = related
+        
+        for entity, related in zip(entities, buckets):
+            entity["related_chunks"] = related
+    
+    async def _query_chunk_fulltext_hits(
+        self,
+        entities: List[Dict[str, Any]],
+        lc_chunks: List[str],
+        chunk_views: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, List[int]]]:
+        """
+        通过Neo4j全文索引（document_chunk_text）一次性查找包含各Entity名称的chunk
+        
+        全文索引只用于缩小候选范围：单个英文/数字词按前缀查询（如 api* 可命中 APIs），
+        其余名称按短语查询；命中的chunk再用与内存匹配相同的子串规则校验，
+        保证结果与 match_names_in_texts 一致（只可能因分词而少命中，不会多命中）。
+        
+        Returns:
+            小写名称 -> 命中chunk下标列表（按chunk顺序）；查询失败返回None，由调用方回退
+        """
+        names = {entity.get("name", "").lower() for entity in entities}
+        names.discard("")
+        if not names or not chunk_views:
+            return {}
+        
+        queries = []
+        for name in names:
+            if _RE_FULLTEXT_TERM.fullmatch(name):
+                query = name + "*"
+            else:
+                # 短语查询中只有反斜杠和双引号需要转义
+                query = '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+            queries.append({"name": name, "query": query})
+        try:
+            results = await self._neo4j(_CYPHER_CHUNK_FULLTEXT_LINK, {
+                "queries": queries,
+                "chunk_ids": [view["uuid"] for view in chunk_views],
+                "limit": _FULLTEXT_LINK_QUERY_LIMIT
+            }, timeout=_STAGE2_NEO4J_TIMEOUT)
+        except Exception as e:
+            logger.warning("全文索引关联chunk失败，回退到内存匹配: %s", e)
+            return None
+        
+        chunk_pos = {view["uuid"]: pos for pos, view in enumerate(chunk_views)}
+        name_hits = {}
+        for record in results or []:
+            name = record["name"]
+            positions = sorted({chunk_pos[cid] for cid in record["chunk_ids"] if cid in chunk_pos})
+            # 子串校验：lc_chunks 在存在大小写敏感名称时已小写化，与内存匹配规则一致
+            name_hits[name] = [pos for pos in positions if name in lc_chunks[pos]][:_MAX_RELATED_CHUNKS]
+        return name_hits
+    
+    async def _match_names_in_process_pool(
+        self,
+        entities: List[Dict[str, Any]],
+        lc_chunks: List[str]
+    ) -> Optional[Dict[str, List[int]]]:
+        """
+        在进程池中批量匹配Entity名称，CPU密集的匹配不占用事件循环所在进程的GIL
+        
+        Returns:
+            小写名称 -> 命中chunk下标列表；进程池不可用时返回None，由调用方回退到线程内匹配
+        """
+        names = sorted({entity.get("name", "").lower() for entity in entities} - {""})
+        if not names:
+            return {}
+        
+        loop = asyncio.get_running_loop()
+        try:
+            hits = await loop.run_in_executor(
+                _get_link_process_pool(), match_names_in_texts, lc_chunks, names, _MAX_RELATED_CHUNKS
+            )
+        except Exception as e:
+            logger.warning("进程池Entity匹配失败，回退到线程内匹配: %s", e)
+            return None
+        
+        return dict(zip(names, hits))
     
     def _extract_keywords_from_chunks(self, chunks: List[Dict[str, Any]], max_keywords: int = 20) -> List[str]:
         """
@@ -5158,26 +5594,19 @@ class IntelligentChatService:
         Returns:
             关键词列表
         """
-        keywords = set()
-        
-        # 简单的关键词提取：提取长度>=2的中文词和英文词
-        for chunk in chunks:
-            content = chunk.get("content", "")
-            
-            # 提取中文词（连续的中文字符）
-            chinese_words = re.findall(r'[\u4e00-\u9fff]{2,}', content)
-            keywords.update(chinese_words)
-            
-            # 提取英文词（连续的字母，长度>=3）
-            english_words = re.findall(r'[a-zA-Z]{3,}', content)
-            keywords.update(word.lower() for word in english_words)
-            
-            # 提取数字+字母组合（如"SD-WAN"）
-            alphanumeric = re.findall(r'[a-zA-Z0-9-]{4,}', content)
-            keywords.update(word.upper() for word in alphanumeric)
-        
-        # 过滤太短的关键词，按长度排序
-        filtered_keywords = [kw for kw in keywords if len(kw) >= 2]
-        filtered_keywords.sort(key=len, reverse=True)
+        # 所有chunk拼接后每个模式只扫描一遍（\x01不会被任何模式匹配，不会跨chunk成词）
+        blob = "\x01".join(chunk.get("content", "") for chunk in chunks)
+        
+        counter = Counter(_RE_CN.findall(blob))
+        counter.update(word.lower() for word in _RE_EN.findall(blob))
+        counter.update(word.upper() for word in _RE_AN.findall(blob))
+        
+        # 按 长度 × log(1+词频) 对全部候选词排序取前N：长词优先，同时保留词频信号
+        # （三个模式都保证词长>=2，无需再过滤）
+        candidates = heapq.nlargest(
+            max_keywords,
+            counter.items(),
+            key=lambda item: len(item[0]) * math.log1p(item[1])
+        )
         
-        return filtered_keywords[:max_keywords]
\ No newline at end of file
+        return [kw for kw, _ in candidates]
\ No newline at end of file
@@ -1,12 +1,378 @@
 """
 文档生成Agent实现
 """
+import asyncio
+import heapq
+import json
 import logging
-from typing import Dict, Any, Optional, List
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Any, Optional, List
+
+import numpy as np
+
+from app.core.embedding_client import embedding_client
+from app.core.llm_client import get_llm_client
+from app.services.intelligent_chat_service import IntelligentChatService
+from app.utils.json_extract import extract_first_json, json_loads
 from .state import DocumentGenerationState, GenerationStage
+from .retrieval_cache import retrieval_cache
+from .prompts import build_generation_prompt, build_review_messages, build_optimization_messages
 
 logger = logging.getLogger(__name__)
 
+# 流式回调合并：累计超过256字符或距上次推送超过50ms才推送一次
+_STREAM_FLUSH_CHARS = 256
+_STREAM_FLUSH_INTERVAL = 0.05
+# LLM token流与回调之间的有界缓冲，回调较慢时不阻塞上游token消费
+_STREAM_QUEUE_SIZE = 64
+
+# 生成Prompt缓存：相同输入（重试、连续重复请求）直接复用已拼接的Prompt
+_PROMPT_CACHE_SIZE = 32
+_PROMPT_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_MISSING = object()
+# build_generation_prompt实际用到的字段（检索内容只使用前10条，相似需求只使用前5条）
+_RETRIEVED_PROMPT_LIMIT = 10
+_SIMILAR_PROMPT_LIMIT = 5
+_REQUIREMENT_PROMPT_FIELDS = ("name", "description", "content", "version")
+
+# Entity properties中需要展示的关键字段及其标签
+_FIELD_LABELS = (("description", "描述"), ("definition", "定义"), ("specification", "规格"))
+
+
+def _make_admit(score_cutoff: float, limit: int) -> Callable[[float], bool]:
+    """
+    构造准入判断：低于分数阈值（0-1）、或在已满的Top N有界最小堆中排不上的结果
+    直接跳过，不再拼接内容和构建结果字典
+    """
+    top_scores: List[float] = []
+    
+    def admit(score: float) -> bool:
+        if score < score_cutoff:
+            return False
+        if len(top_scores) < limit:
+            heapq.heappush(top_scores, score)
+            return True
+        if score < top_scores[0]:
+            return False
+        if score > top_scores[0]:
+            heapq.heapreplace(top_scores, score)
+        return True
+    
+    return admit
+
+
+def _scaled_scores(items: List[Dict[str, Any]]) -> np.ndarray:
+    """一次性取出全部分数并转换为0-1（v4.0返回0-100）"""
+    return np.fromiter(
+        (item.get("score", 0.0) for item in items), dtype=np.float64, count=len(items)
+    ) / 100.0
+
+
+def _format_entity_content(
+    name: str,
+    type_: str,
+    properties: Any,
+    extra: Optional[List[str]] = None,
+    fallback: str = ""
+) -> str:
+    """
+    拼接Entity的展示内容（参考对话模式的formatEntityContent）
+    
+    Args:
+        name: 实体名称
+        type_: 实体类型
+        properties: 实体properties（非dict时忽略）
+        extra: 追加在关键字段之后的内容行
+        fallback: 只有名称和类型时补充的描述
+    """
+    parts: List[str] = []
+    append = parts.append
+    if name:
+        append(f"实体名称: {name}")
+    if type_:
+        append(f"类型: {type_}")
+    if isinstance(properties, dict):
+        for key, label in _FIELD_LABELS:
+            value = properties.get(key)
+            if value:
+                append(f"{label}: {value}")
+    if fallback and len(parts) <= 2:
+        append(f"描述: {fallback}")
+    if extra:
+        parts.extend(extra)
+    return "\n".join(parts) if parts else name or "实体信息"
+
+
+def _to_agent_chunks(chunk_results: List[Dict[str, Any]], score_cutoff: float, limit: int) -> List[Dict[str, Any]]:
+    """阶段1: DocumentChunk转换为Agent结果格式"""
+    admit = _make_admit(score_cutoff, limit)
+    results: List[Dict[str, Any]] = []
+    scores = _scaled_scores(chunk_results)
+    for idx in np.flatnonzero(scores >= score_cutoff):
+        score = float(scores[idx])
+        if not admit(score):
+            continue
+        chunk = chunk_results[idx]
+        agent_result = {
+            "type": "chunk",  # DocumentChunk
+            "name": chunk.get("chunk_name", ""),
+            "content": chunk.get("content", ""),
+            "score": score,
+            "source": chunk.get("group_id", ""),
+            "raw_data": {
+                "chunk_id": chunk.get("chunk_id", ""),
+                "group_id": chunk.get("group_id", ""),
+                "doc_id": chunk.get("doc_id", ""),
+                "section_name": chunk.get("section_name", ""),
+                "document_name": chunk.get("document_name", ""),
+                "metadata": chunk.get("metadata", {})
+            }
+        }
+        results.append(agent_result)
+    return results
+
+
+def _to_agent_graphiti(entities: List[Dict[str, Any]], score_cutoff: float, limit: int) -> List[Dict[str, Any]]:
+    """阶段2: Graphiti Entity转换为Agent结果格式"""
+    admit = _make_admit(score_cutoff, limit)
+    results: List[Dict[str, Any]] = []
+    scores = _scaled_scores(entities)
+    for idx in np.flatnonzero(scores >= score_cutoff):
+        score = float(scores[idx])
+        if not admit(score):
+            continue
+        entity = entities[idx]
+        # 参考对话模式的做法：从properties中提取内容
+        entity_name = entity.get("name", "")
+        entity_type = entity.get("type", "")
+        properties = entity.get("properties", {})
+        # 如果没有properties中的字段，使用entity的description或definition
+        entity_content = _format_entity_content(
+            entity_name, entity_type, properties,
+            fallback=entity.get("description") or entity.get("definition", "")
+        )
+
+        agent_result = {
+            "type": "graphiti_entity",  # Graphiti Entity
+            "name": entity_name,
+            "content": entity_content,
+            "score": score,
+            "source": entity.get("group_id", ""),
+            "raw_data": {
+                "uuid": entity.get("uuid", ""),
+                "type": entity_type,
+                "group_id": entity.get("group_id", ""),
+                "properties": properties,
+                "metadata": entity.get("metadata", {})
+            }
+        }
+        results.append(agent_result)
+    return results
+
+
+def _to_agent_cognee(entities: List[Dict[str, Any]], score_cutoff: float, limit: int) -> List[Dict[str, Any]]:
+    """阶段2: Cognee Entity转换为Agent结果格式"""
+    admit = _make_admit(score_cutoff, limit)
+    results: List[Dict[str, Any]] = []
+    scores = _scaled_scores(entities)
+    for idx in np.flatnonzero(scores >= score_cutoff):
+        score = float(scores[idx])
+        if not admit(score):
+            continue
+        entity = entities[idx]
+        # 参考对话模式的做法：从properties和related_chunks中提取内容
+        entity_name = entity.get("name", "")
+        entity_type = entity.get("type", "")
+        properties = entity.get("properties", {})
+        extra_parts: List[str] = []
+
+        # 1. properties中的正文内容（截断到200字符）
+        if isinstance(properties, dict):
+            content_text = properties.get("content")
+            if content_text and isinstance(content_text, str):
+                extra_parts.append(f"内容: {content_text[:200]}{'...' if len(content_text) > 200 else ''}")
+
+        # 2. 从related_chunks中提取关联章节信息
+        related_chunks = entity.get("related_chunks", [])
+        if related_chunks:
+            section_names = []
+            for chunk in related_chunks:
+                section_name = chunk.get("section_name") or chunk.get("content_preview", "")[:50]
+                if section_name:
+                    section_names.append(section_name)
+                    if len(section_names) >= 3:  # 最多显示3个
+                        break
+            if section_names:
+                extra_parts.append(f"关联章节: {', '.join(section_names)}")
+
+        # 3. 组合content
+        entity_content = _format_entity_content(entity_name, entity_type, properties, extra=extra_parts)
+
+        agent_result = {
+            "type": "cognee_entity",  # Cognee Entity
+            "name": entity_name,
+            "content": entity_content,
+            "score": score,
+            "source": entity.get("group_id", ""),
+            "raw_data": {
+                "id": entity.get("id", ""),
+                "type": entity_type,
+                "group_id": entity.get("group_id", ""),
+                "properties": properties,
+                "related_chunks": related_chunks
+            }
+        }
+        results.append(agent_result)
+    return results
+
+
+def _generation_prompt_key(
+    user_query: str,
+    retrieved_content: List[Dict[str, Any]],
+    new_requirement: Optional[Dict[str, Any]],
+    similar_requirements: List[Dict[str, Any]]
+) -> tuple:
+    """由生成Prompt实际用到的字段构造缓存键"""
+    retrieved_key = tuple(
+        (item.get("type", "unknown"), item.get("score", 0), item.get("content", ""))
+        for item in retrieved_content[:_RETRIEVED_PROMPT_LIMIT]
+    )
+    new_requirement_key = None
+    if new_requirement:
+        new_requirement_key = tuple(new_requirement.get(field, _MISSING) for field in _REQUIREMENT_PROMPT_FIELDS)
+    similar_key = tuple(
+        tuple(req.get(field, _MISSING) for field in _REQUIREMENT_PROMPT_FIELDS)
+        for req in similar_requirements[:_SIMILAR_PROMPT_LIMIT]
+    )
+    return (user_query, retrieved_key, new_requirement_key, similar_key)
+
+
+def _get_generation_prompt(
+    user_query: str,
+    retrieved_content: List[Dict[str, Any]],
+    new_requirement: Optional[Dict[str, Any]],
+    similar_requirements: List[Dict[str, Any]]
+) -> str:
+    """构建生成Prompt，输入相同时复用缓存（LRU）"""
+    key = _generation_prompt_key(user_query, retrieved_content, new_requirement, similar_requirements)
+    try:
+        prompt = _PROMPT_CACHE.get(key)
+    except TypeError:
+        # 字段值不可哈希（如dict），不走缓存
+        return build_generation_prompt(
+            user_query=user_query,
+            retrieved_content=retrieved_content,
+            new_requirement=new_requirement,
+            similar_requirements=similar_requirements
+        )
+    if prompt is not None:
+        _PROMPT_CACHE.move_to_end(key)
+        return prompt
+    
+    prompt = build_generation_prompt(
+        user_query=user_query,
+        retrieved_content=retrieved_content,
+        new_requirement=new_requirement,
+        similar_requirements=similar_requirements
+    )
+    _PROMPT_CACHE[key] = prompt
+    while len(_PROMPT_CACHE) > _PROMPT_CACHE_SIZE:
+        _PROMPT_CACHE.popitem(last=False)
+    return prompt
+
+
+async def _run_llm(
+    messages: List[Dict[str, str]],
+    provider: str,
+    temperature: float,
+    use_thinking: bool,
+    stage: str,
+    stream_callback=None
+) -> str:
+    """
+    调用LLM并返回完整文本（有stream_callback时流式输出）
+    
+    Args:
+        messages: 对话消息（静态指令放在system消息中，便于服务端前缀缓存）
+        provider: LLM提供商
+        temperature: 温度
+        use_thinking: 是否启用思考模式
+        stage: 流式回调的阶段标识（generating/reviewing/optimizing）
+        stream_callback: 流式输出回调函数，接收(chunk: str, stage: str) -> None
+    """
+    llm_client = get_llm_client(provider)
+    
+    if not stream_callback:
+        # 非流式生成（兼容旧代码）
+        return await llm_client.chat(
+            provider=provider,
+            messages=messages,
+            temperature=temperature,
+            use_thinking=use_thinking
+        )
+    
+    # 流式生成：生产者消费LLM token流写入有界队列，消费者按字符数/时间窗口合并后推送，
+    # 回调（下游WebSocket/SSE）较慢时不会拖住上游token读取
+    parts: List[str] = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_STREAM_QUEUE_SIZE)
+    
+    async def produce() -> None:
+        stream = llm_client.chat_stream(
+            provider=provider,
+            messages=messages,
+            temperature=temperature,
+            use_thinking=use_thinking
+        )
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                await queue.put(chunk)
+        except asyncio.CancelledError:
+            # 只有消费者已退出（回调异常/外层取消）才会取消生产者，此时队列可能已满，
+            # 不能再阻塞等待写入结束标记
+            raise
+        except Exception:
+            # LLM流异常：通知仍在运行的消费者结束，异常在 await producer 时传播
+            await queue.put(None)
+            raise
+        else:
+            await queue.put(None)
+        finally:
+            # 关闭LLM流，释放底层HTTP连接
+            await stream.aclose()
+    
+    async def consume() -> None:
+        pending: List[str] = []
+        pending_chars = 0
+        last_flush = time.monotonic()
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            pending.append(chunk)
+            pending_chars += len(chunk)
+            now = time.monotonic()
+            if pending_chars >= _STREAM_FLUSH_CHARS or now - last_flush >= _STREAM_FLUSH_INTERVAL:
+                await stream_callback("".join(pending), stage)
+                pending.clear()
+                pending_chars = 0
+                last_flush = now
+        if pending:
+            await stream_callback("".join(pending), stage)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        await consume()
+    except BaseException:
+        # 回调异常时取消生产者并等待其退出（关闭LLM流），以回调异常为准向上抛出
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        raise
+    # 传播LLM流中的异常
+    await producer
+    return "".join(parts)
+
 
 class ContentRetriever:
     """内容检索Agent - 使用v4.0智能检索（两阶段检索）"""
@@ -31,15 +397,10 @@ class ContentRetriever:
         
         logger.info(f"开始v4.0智能检索: query='{user_query}', top_k={top_k}, min_score={min_score}, enable_refine={enable_refine}")
         
-        # 使用 v4.0 smartRetrieval
-        from app.services.intelligent_chat_service import IntelligentChatService
-        
         all_results = []
         retrieval_result = None  # 初始化，确保在try块外也可访问
         
         try:
-            service = IntelligentChatService()
-            
             # 确定检索范围
             target_group_ids = None
             if group_id:
@@ -48,148 +409,54 @@ class ContentRetriever:
                 target_group_ids = group_ids
             # all_documents 时 target_group_ids 为 None，表示检索全部文档
             
-            # 执行v4.0智能检索
-            retrieval_result = await service.smart_retrieval(
-                query=user_query,
-                top_k=top_k,
-                min_score=min_score,
-                group_ids=target_group_ids,
-                enable_refine=enable_refine
+            # 语义缓存：查询向量只生成一次，未命中时直接传给smart_retrieval复用
+            query_embedding = await embedding_client.get_embedding(user_query)
+            cache_key = (
+                tuple(sorted(target_group_ids)) if target_group_ids else None,
+                top_k, min_score, enable_refine, retrieval_limit
             )
+            cached = retrieval_cache.lookup(query_embedding, cache_key)
             
-            # 转换v4.0格式为Agent需要的格式
-            # v4.0返回格式: {
-            #   "stage1": {"chunk_results": [...]},
-            #   "stage2": {"graphiti": {"entities": [...]}, "cognee": {"entities": [...]}},
-            #   "summary": {...}
-            # }
-            
-            # 阶段1: DocumentChunk
-            if retrieval_result.get("stage1") and retrieval_result["stage1"].get("chunk_results"):
-                for chunk in retrieval_result["stage1"]["chunk_results"]:
-                    agent_result = {
-                        "type": "chunk",  # DocumentChunk
-                        "name": chunk.get("chunk_name", ""),
-                        "content": chunk.get("content", ""),
-                        "score": chunk.get("score", 0.0) / 100.0,  # v4.0返回0-100，转换为0-1
-                        "source": chunk.get("group_id", ""),
-                        "raw_data": {
-                            "chunk_id": chunk.get("chunk_id", ""),
-                            "group_id": chunk.get("group_id", ""),
-                            "doc_id": chunk.get("doc_id", ""),
-                            "section_name": chunk.get("section_name", ""),
-                            "document_name": chunk.get("document_name", ""),
-                            "metadata": chunk.get("metadata", {})
-                        }
-                    }
-                    all_results.append(agent_result)
-            
-            # 阶段2: Graphiti Entities
-            if enable_refine and retrieval_result.get("stage2") and retrieval_result["stage2"].get("graphiti"):
-                graphiti_entities = retrieval_result["stage2"]["graphiti"].get("entities", [])
-                for entity in graphiti_entities:
-                    # 参考对话模式的做法：从properties中提取内容
-                    content_parts = []
-                    
-                    entity_name = entity.get("name", "")
-                    entity_type = entity.get("type", "")
-                    if entity_name:
-                        content_parts.append(f"实体名称: {entity_name}")
-                    if entity_type:
-                        content_parts.append(f"类型: {entity_type}")
-                    
-                    # 从properties中提取关键字段
-                    properties = entity.get("properties", {})
-                    if isinstance(properties, dict):
-                        if properties.get("description"):
-                            content_parts.append(f"描述: {properties['description']}")
-                        if properties.get("definition"):
-                            content_parts.append(f"定义: {properties['definition']}")
-                        if properties.get("specification"):
-                            content_parts.append(f"规格: {properties['specification']}")
-                    
-                    # 如果没有properties中的字段，使用entity的description或definition
-                    if not content_parts or len(content_parts) <= 2:  # 只有名称和类型
-                        description = entity.get("description") or entity.get("definition", "")
-                        if description:
-                            content_parts.append(f"描述: {description}")
-                    
-                    # 组合content
-                    entity_content = "\n".join(content_parts) if content_parts else entity_name or "实体信息"
-                    
-                    agent_result = {
-                        "type": "graphiti_entity",  # Graphiti Entity
-                        "name": entity_name,
-                        "content": entity_content,
-                        "score": entity.get("score", 0.0) / 100.0,  # v4.0返回0-100，转换为0-1
-                        "source": entity.get("group_id", ""),
-                        "raw_data": {
-                            "uuid": entity.get("uuid", ""),
-                            "type": entity_type,
-                            "group_id": entity.get("group_id", ""),
-                            "properties": properties,
-                            "metadata": entity.get("metadata", {})
-                        }
-                    }
-                    all_results.append(agent_result)
-            
-            # 阶段2: Cognee Entities
-            if enable_refine and retrieval_result.get("stage2") and retrieval_result["stage2"].get("cognee"):
-                cognee_entities = retrieval_result["stage2"]["cognee"].get("entities", [])
-                for entity in cognee_entities:
-                    # 参考对话模式的做法：从properties和related_chunks中提取内容
-                    content_parts = []
-                    
-                    # 1. Entity名称和类型
-                    entity_name = entity.get("name", "")
-                    entity_type = entity.get("type", "")
-                    if entity_name:
-                        content_parts.append(f"实体名称: {entity_name}")
-                    if entity_type:
-                        content_parts.append(f"类型: {entity_type}")
-                    
-                    # 2. 从properties中提取关键字段（参考对话模式的formatEntityContent）
-                    properties = entity.get("properties", {})
-                    if isinstance(properties, dict):
-                        if properties.get("description"):
-                            content_parts.append(f"描述: {properties['description']}")
-                        if properties.get("definition"):
-                            content_parts.append(f"定义: {properties['definition']}")
-                        if properties.get("specification"):
-                            content_parts.append(f"规格: {properties['specification']}")
-                        if properties.get("content") and isinstance(properties.get("content"), str):
-                            content_text = properties["content"]
-                            content_parts.append(f"内容: {content_text[:200]}{'...' if len(content_text) > 200 else ''}")
-                    
-                    # 3. 从related_chunks中提取关联章节信息
-                    related_chunks = entity.get("related_chunks", [])
-                    if related_chunks:
-                        section_names = []
-                        for chunk in related_chunks:
-                            section_name = chunk.get("section_name") or chunk.get("content_preview", "")[:50]
-                            if section_name:
-                                section_names.append(section_name)
-                        if section_names:
-                            content_parts.append(f"关联章节: {', '.join(section_names[:3])}")  # 最多显示3个
-                    
-                    # 4. 组合content
-                    entity_content = "\n".join(content_parts) if content_parts else entity_name or "实体信息"
-                    
-                    agent_result = {
-                        "type": "cognee_entity",  # Cognee Entity
-                        "name": entity_name,
-                        "content": entity_content,
-                        "score": entity.get("score", 0.0) / 100.0,  # v4.0返回0-100，转换为0-1
-                        "source": entity.get("group_id", ""),
-                        "raw_data": {
-                            "id": entity.get("id", ""),
-                            "type": entity_type,
-                            "group_id": entity.get("group_id", ""),
-                            "properties": properties,
-                            "related_chunks": related_chunks
-                        }
-                    }
-                    all_results.append(agent_result)
+            if cached is not None:
+                retrieval_result, all_results = cached
+            else:
+                service = IntelligentChatService()
+                
+                # 执行v4.0智能检索
+                retrieval_result = await service.smart_retrieval(
+                    query=user_query,
+                    top_k=top_k,
+                    min_score=min_score,
+                    group_ids=target_group_ids,
+                    enable_refine=enable_refine,
+                    query_embedding=query_embedding or None
+                )
+                
+                # 转换v4.0格式为Agent需要的格式
+                # v4.0返回格式: {
+                #   "stage1": {"chunk_results": [...]},
+                #   "stage2": {"graphiti": {"entities": [...]}, "cognee": {"entities": [...]}},
+                #   "summary": {...}
+                # }
+                stage1 = retrieval_result.get("stage1") or {}
+                stage2 = (retrieval_result.get("stage2") or {}) if enable_refine else {}
+                chunk_results = stage1.get("chunk_results") or []
+                graphiti_entities = (stage2.get("graphiti") or {}).get("entities", [])
+                cognee_entities = (stage2.get("cognee") or {}).get("entities", [])
+                
+                # 三类结果互不依赖，分别在线程中转换；每类各自按阈值和Top N准入，
+                # 全局Top N必然落在各自的Top N之内，最终由nlargest统一截取
+                score_cutoff = min_score / 100.0
+                chunks, graphiti, cognee = await asyncio.gather(
+                    asyncio.to_thread(_to_agent_chunks, chunk_results, score_cutoff, retrieval_limit),
+                    asyncio.to_thread(_to_agent_graphiti, graphiti_entities, score_cutoff, retrieval_limit),
+                    asyncio.to_thread(_to_agent_cognee, cognee_entities, score_cutoff, retrieval_limit)
+                )
+                all_results = chunks + graphiti + cognee
+                
+                # 只缓存非空结果，避免短暂故障导致的空结果被反复复用
+                if all_results:
+                    retrieval_cache.store(query_embedding, cache_key, retrieval_result, all_results)
             
             logger.info(f"v4.0智能检索完成，返回 {len(all_results)} 个结果")
             
@@ -197,16 +464,14 @@ class ContentRetriever:
             logger.error(f"v4.0智能检索失败: {e}", exc_info=True)
             # 如果检索失败，返回空结果，不影响后续流程
         
-        # 按相关性分数排序
-        all_results.sort(key=lambda x: x.get("score", 0), reverse=True)
+        # 按相关性分数取Top N（只保留retrieval_limit条，无需对全部结果排序）
+        retrieved_content = heapq.nlargest(retrieval_limit, all_results, key=lambda x: x.get("score", 0))
         
-        # 限制数量
-        retrieved_content = all_results[:retrieval_limit]
-        
-        # 统计各类型数量
-        chunk_count = sum(1 for r in retrieved_content if r["type"] == "chunk")
-        graphiti_count = sum(1 for r in retrieved_content if r["type"] == "graphiti_entity")
-        cognee_count = sum(1 for r in retrieved_content if r["type"] == "cognee_entity")
+        # 统计各类型数量（单次遍历）
+        type_counts = Counter(r["type"] for r in retrieved_content)
+        chunk_count = type_counts["chunk"]
+        graphiti_count = type_counts["graphiti_entity"]
+        cognee_count = type_counts["cognee_entity"]
         
         state["retrieved_content"] = retrieved_content
         # 保存原始检索结果（v4.0格式），用于前端显示
@@ -233,16 +498,13 @@ class DocumentGenerator:
             state: 文档生成状态
             stream_callback: 流式输出回调函数，接收(chunk: str, stage: str) -> None
         """
-        from .prompts import build_generation_prompt
-        from app.core.llm_client import get_llm_client
-        
         # 构建生成Prompt（整合检索结果）
         retrieved_count = len(state["retrieved_content"])
         logger.info(f"DocumentGenerator: 准备生成文档，检索结果数量={retrieved_count}")
         if retrieved_count == 0:
             logger.warning("DocumentGenerator: ⚠️ 检索结果为空，将基于通用知识生成文档")
         
-        prompt = build_generation_prompt(
+        prompt = _get_generation_prompt(
             user_query=state["user_query"],
             retrieved_content=state["retrieved_content"],
             new_requirement=state.get("new_requirement"),
@@ -254,33 +516,13 @@ class DocumentGenerator:
         
         # 调用LLM生成（支持流式输出）
         provider = state.get("provider", "qianwen")  # 从state读取provider，默认qianwen
-        llm_client = get_llm_client(provider)
         use_thinking = state.get("use_thinking", False)
         temperature = state.get("temperature", 0.7)
         
-        document = ""
-        
-        if stream_callback:
-            # 流式生成
-            async for chunk in llm_client.chat_stream(
-                provider=provider,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                use_thinking=use_thinking
-            ):
-                document += chunk
-                # 调用流式回调（异步）
-                if stream_callback:
-                    await stream_callback(chunk, "generating")
-        else:
-            # 非流式生成（兼容旧代码）
-            document = await llm_client.generate(
-                provider=provider,
-                prompt=prompt,
-                temperature=temperature,
-                max_tokens=8000,
-                use_thinking=use_thinking
-            )
+        document = await _run_llm(
+            [{"role": "user", "content": prompt}], provider, temperature, use_thinking,
+            stage="generating", stream_callback=stream_callback
+        )
         
         state["current_document"] = document
         state["current_stage"] = GenerationStage.GENERATING
@@ -302,43 +544,18 @@ class DocumentReviewer:
             state: 文档生成状态
             stream_callback: 流式输出回调函数，接收(chunk: str, stage: str) -> None
         """
-        from .prompts import build_review_prompt
-        from app.core.llm_client import get_llm_client
-        import json
-        import re
-        
-        # 构建评审Prompt
-        prompt = build_review_prompt(state["current_document"])
+        # 构建评审消息
+        messages = build_review_messages(state["current_document"])
         
         # 调用LLM评审（支持流式输出）
         provider = state.get("provider", "qianwen")  # 从state读取provider，默认qianwen
-        llm_client = get_llm_client(provider)
         use_thinking = state.get("use_thinking", False)
         temperature = 0.3  # 评审需要更低的温度
         
-        review_result = ""
-        
-        if stream_callback:
-            # 流式生成
-            async for chunk in llm_client.chat_stream(
-                provider=provider,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                use_thinking=use_thinking
-            ):
-                review_result += chunk
-                # 调用流式回调（异步）
-                if stream_callback:
-                    await stream_callback(chunk, "reviewing")
-        else:
-            # 非流式生成（兼容旧代码）
-            review_result = await llm_client.generate(
-                provider=provider,
-                prompt=prompt,
-                temperature=temperature,
-                max_tokens=2000,
-                use_thinking=use_thinking
-            )
+        review_result = await _run_llm(
+            messages, provider, temperature, use_thinking,
+            stage="reviewing", stream_callback=stream_callback
+        )
         
         # 解析评审结果（JSON格式）
         review_report = DocumentReviewer._parse_review_result(review_result)
@@ -354,15 +571,15 @@ class DocumentReviewer:
     @staticmethod
     def _parse_review_result(review_text: str) -> Dict[str, Any]:
         """解析评审结果JSON"""
-        import json
-        import re
-        
         try:
             # 尝试提取JSON部分
-            json_match = re.search(r'\{.*\}', review_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            return json.loads(review_text)
+            json_text = extract_first_json(review_text)
+            if json_text:
+                try:
+                    return json_loads(json_text)
+                except json.JSONDecodeError:
+                    pass
+            return json_loads(review_text)
         except json.JSONDecodeError:
             logger.warning(f"评审结果解析失败，使用默认值: {review_text[:100]}")
             # 返回默认评审报告
@@ -389,44 +606,21 @@ class DocumentOptimizer:
             state: 文档生成状态
             stream_callback: 流式输出回调函数，接收(chunk: str, stage: str) -> None
         """
-        from .prompts import build_optimization_prompt
-        from app.core.llm_client import get_llm_client
-        
-        # 构建优化Prompt
-        prompt = build_optimization_prompt(
+        # 构建优化消息
+        messages = build_optimization_messages(
             state["current_document"],
             state["review_report"]
         )
         
         # 调用LLM优化（支持流式输出）
         provider = state.get("provider", "qianwen")  # 从state读取provider，默认qianwen
-        llm_client = get_llm_client(provider)
         use_thinking = state.get("use_thinking", False)
         temperature = 0.5
         
-        optimized_document = ""
-        
-        if stream_callback:
-            # 流式生成
-            async for chunk in llm_client.chat_stream(
-                provider=provider,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                use_thinking=use_thinking
-            ):
-                optimized_document += chunk
-                # 调用流式回调（异步）
-                if stream_callback:
-                    await stream_callback(chunk, "optimizing")
-        else:
-            # 非流式生成（兼容旧代码）
-            optimized_document = await llm_client.generate(
-                provider=provider,
-                prompt=prompt,
-                temperature=temperature,
-                max_tokens=8000,
-                use_thinking=use_thinking
-            )
+        optimized_document = await _run_llm(
+            messages, provider, temperature, use_thinking,
+            stage="optimizing", stream_callback=stream_callback
+        )
         
         state["current_document"] = optimized_document
         state["iteration_count"] += 1
@@ -75,9 +75,9 @@ def build_generation_prompt(
     return prompt
 
 
-def build_review_prompt(document: str) -> str:
-    """构建文档评审Prompt"""
-    prompt = f"""你是一个专业的需求文档评审专家。请对以下需求文档进行评审，从以下维度评分（0-100分），并给出改进建议。
+# 评审/优化Prompt的静态部分作为system消息，每轮迭代只重新拼接文档等动态内容，
+# 同时便于LLM服务端的前缀缓存命中
+REVIEW_SYSTEM_PROMPT = """你是一个专业的需求文档评审专家。请对用户提供的需求文档进行评审，从以下维度评分（0-100分），并给出改进建议。
 
 ## 评审维度
 1. **完整性（Completeness）**：文档是否包含所有必要章节和信息
@@ -85,12 +85,9 @@ def build_review_prompt(document: str) -> str:
 3. **一致性（Consistency）**：文档格式、术语使用是否一致
 4. **可读性（Readability）**：文档表达是否清晰，是否易于理解
 
-## 待评审文档
-{document}
-
 ## 输出要求
 请以JSON格式输出评审结果，格式如下：
-{{
+{
   "overall_score": 85.0,
   "completeness_score": 90.0,
   "accuracy_score": 85.0,
@@ -104,11 +101,44 @@ def build_review_prompt(document: str) -> str:
     "改进建议1",
     "改进建议2"
   ]
-}}
+}
 
 只返回JSON，不要其他内容。"""
-    
-    return prompt
+
+OPTIMIZATION_SYSTEM_PROMPT = """你是一个专业的需求文档优化专家。请根据评审结果优化用户提供的需求文档。
+
+## 优化要求
+1. **针对性地解决评审中发现的问题**
+2. **采纳改进建议，提升文档质量**
+3. **保持文档的原有结构和核心内容**
+4. **确保优化后的文档更加完整、准确、一致、易读**
+5. **使用 Markdown 格式**
+
+请输出优化后的完整文档。"""
+
+
+def build_review_messages(document: str) -> List[Dict[str, str]]:
+    """构建文档评审消息（静态system + 待评审文档）"""
+    return [
+        {"role": "system", "content": REVIEW_SYSTEM_PROMPT},
+        {"role": "user", "content": f"## 待评审文档\n{document}"}
+    ]
+
+
+def build_review_prompt(document: str) -> str:
+    """构建文档评审Prompt"""
+    return f"{REVIEW_SYSTEM_PROMPT}\n\n## 待评审文档\n{document}"
+
+
+def build_optimization_messages(
+    document: str,
+    review_report: Dict[str, Any]
+) -> List[Dict[str, str]]:
+    """构建文档优化消息（静态system + 当前文档和评审结果）"""
+    return [
+        {"role": "system", "content": OPTIMIZATION_SYSTEM_PROMPT},
+        {"role": "user", "content": _build_optimization_body(document, review_report)}
+    ]
 
 
 def build_optimization_prompt(
@@ -116,6 +146,14 @@ def build_optimization_prompt(
     review_report: Dict[str, Any]
 ) -> str:
     """构建文档优化Prompt"""
+    return f"{OPTIMIZATION_SYSTEM_PROMPT}\n\n{_build_optimization_body(document, review_report)}"
+
+
+def _build_optimization_body(
+    document: str,
+    review_report: Dict[str, Any]
+) -> str:
+    """构建优化Prompt的动态部分（当前文档 + 评审结果）"""
     issues = review_report.get("issues", [])
     suggestions = review_report.get("suggestions", [])
     scores = {
@@ -128,9 +166,7 @@ def build_optimization_prompt(
     issues_text = "\n".join([f"- {issue}" for issue in issues]) if issues else "无"
     suggestions_text = "\n".join([f"- {suggestion}" for suggestion in suggestions]) if suggestions else "无"
     
-    prompt = f"""你是一个专业的需求文档优化专家。请根据评审结果优化以下需求文档。
-
-## 当前文档
+    return f"""## 当前文档
 {document}
 
 ## 评审结果
@@ -144,16 +180,4 @@ def build_optimization_prompt(
 {issues_text}
 
 ### 改进建议
-{suggestions_text}
-
-## 优化要求
-1. **针对性地解决评审中发现的问题**
-2. **采纳改进建议，提升文档质量**
-3. **保持文档的原有结构和核心内容**
-4. **确保优化后的文档更加完整、准确、一致、易读**
-5. **使用 Markdown 格式**
-
-请输出优化后的完整文档。"""
-    
-    return prompt
-
+{suggestions_text}"""
@@ -0,0 +1,98 @@
+"""
+检索语义缓存
+
+按查询向量的余弦相似度命中：语义相同（或改写后的）查询在短时间内重复出现时，
+直接复用上一次 smart_retrieval 的结果，跳过向量检索和图谱扩展。
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalSemanticCache:
+    """进程内LRU语义缓存（检索参数必须完全一致才会比较相似度）"""
+
+    def __init__(self, max_entries: int = 128, threshold: float = 0.95, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        # entry_id -> (params_key, 归一化查询向量, 写入时间, retrieval_result, all_results)
+        self._entries: "OrderedDict[int, Tuple[Hashable, np.ndarray, float, Dict[str, Any], List[Dict[str, Any]]]]" = OrderedDict()
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry[2] > self.ttl]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    def lookup(
+        self,
+        embedding: List[float],
+        params_key: Hashable
+    ) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        查找语义相近的缓存结果
+
+        Returns:
+            (retrieval_result, all_results)；未命中返回None
+        """
+        if not embedding or not self._entries:
+            return None
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+
+        self._evict_expired(time.time())
+        candidates = [
+            (entry_id, entry) for entry_id, entry in self._entries.items()
+            if entry[0] == params_key and entry[1].shape == query.shape
+        ]
+        if not candidates:
+            return None
+
+        # 一次矩阵-向量乘法算出全部余弦相似度
+        matrix = np.stack([entry[1] for _, entry in candidates])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        entry_id, entry = candidates[best]
+        self._entries.move_to_end(entry_id)
+        logger.info("检索语义缓存命中: 相似度=%.4f", float(scores[best]))
+        return entry[3], list(entry[4])
+
+    def store(
+        self,
+        embedding: List[float],
+        params_key: Hashable,
+        retrieval_result: Dict[str, Any],
+        all_results: List[Dict[str, Any]]
+    ) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if not embedding:
+            return
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+
+        self._entries[self._next_id] = (params_key, vec, time.time(), retrieval_result, list(all_results))
+        self._next_id += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+retrieval_cache = RetrievalSemanticCache()
@@ -2,7 +2,7 @@
 LangGraph工作流定义
 """
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .state import DocumentGenerationState, GenerationStage
 from .agents import (
     ContentRetriever,
@@ -14,6 +14,42 @@ from .agents import (
 
 logger = logging.getLogger(__name__)
 
+# 收敛提前终止：总分及各维度评分都已接近阈值（差距不超过5分）且相比上一轮提升都不足2分时，
+# 继续优化+评审的收益很低，直接结束迭代以节省LLM调用
+_CONVERGENCE_MIN_GAIN = 2.0
+_CONVERGENCE_MARGIN = 5.0
+_SUB_SCORE_KEYS = ("completeness_score", "accuracy_score", "consistency_score", "readability_score")
+
+
+def _has_converged(
+    previous_report: Optional[Dict[str, Any]],
+    review_report: Dict[str, Any],
+    quality_threshold: float
+) -> bool:
+    """
+    判断评审评分是否已收敛
+    
+    总分相比上一轮的提升在 [0, _CONVERGENCE_MIN_GAIN) 内，且总分和各维度评分都不低于
+    quality_threshold - _CONVERGENCE_MARGIN、各维度提升也都不足 _CONVERGENCE_MIN_GAIN。
+    总分下降（本轮优化反而变差）不视为收敛，继续迭代；评审结果缺少的维度不参与判断。
+    """
+    if not previous_report:
+        return False
+    floor = quality_threshold - _CONVERGENCE_MARGIN
+    for key in ("overall_score",) + _SUB_SCORE_KEYS:
+        current = review_report.get(key)
+        previous = previous_report.get(key)
+        if current is None or previous is None:
+            if key == "overall_score":
+                return False
+            continue
+        gain = float(current) - float(previous)
+        if key == "overall_score" and gain < 0:
+            return False
+        if gain >= _CONVERGENCE_MIN_GAIN or float(current) < floor:
+            return False
+    return True
+
 
 async def run_document_generation_workflow(
     state: DocumentGenerationState,
@@ -60,6 +96,7 @@ async def run_document_generation_workflow(
         # 步骤3-6: 迭代优化循环
         max_iterations = state.get("max_iterations", 3)
         iteration = 0
+        previous_report = None
         
         while iteration < max_iterations:
             iteration += 1
@@ -86,6 +123,22 @@ async def run_document_generation_workflow(
                 logger.info("文档质量达标，结束迭代")
                 break
             
+            quality_score = state["quality_score"]
+            review_report = dict(state.get("review_report") or {}, overall_score=quality_score)
+            if _has_converged(previous_report, review_report, state["quality_threshold"]):
+                logger.info(
+                    f"文档质量已收敛（上轮评分: {previous_report.get('overall_score', 0.0):.1f}, 本轮评分: {quality_score:.1f}），结束迭代"
+                )
+                state["should_continue"] = False
+                state["is_final"] = True
+                state["current_stage"] = GenerationStage.COMPLETED
+                state["progress"] = 100
+                state["current_step"] = f"文档质量已收敛，最终质量评分: {quality_score:.1f}/100"
+                if progress_callback:
+                    await progress_callback(state)
+                break
+            previous_report = review_report
+            
             # 步骤6: 优化（流式输出）
             logger.info(f"开始优化文档（第{iteration}次迭代）")
             if progress_callback:
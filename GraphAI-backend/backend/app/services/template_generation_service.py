@@ -3,14 +3,350 @@ LLM模板生成服务
 实现方案B（智能分段）和方案D（全文分块）两种分析模式
 """
 import re
+import copy
 import json
+import math
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
 from app.core.llm_client import get_llm_client
 from app.services.template_service import TemplateService
+from app.utils.json_extract import extract_first_json, json_dumps_compact, json_loads
 
 logger = logging.getLogger(__name__)
 
+# 预编译正则：Markdown标题、```json 代码块
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+# 关键章节识别：标题包含任一关键词（不区分大小写）
+_KEYWORD_RE = re.compile(
+    r'需求|功能|架构|设计|模块|系统|用户|产品|requirement|feature|architecture|design|module|system|user|product',
+    re.IGNORECASE
+)
+
+# LLM响应缓存（精确匹配）：同一文档重复分析、调整参数重试时，相同输入直接复用解析后的结果
+# 设置过期时间，避免用户主动"重新生成"时一直拿到同一份结果
+_LLM_CACHE_SIZE = 64
+_LLM_CACHE_TTL = 600.0
+_LLM_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _llm_cache_key(provider: str, temperature: float, system_prompt: str, prompt: str) -> str:
+    """由LLM调用的全部输入构造缓存键"""
+    raw = f"{provider}|{temperature}|{system_prompt}|{prompt}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _llm_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    """读取缓存（返回副本，调用方的后处理不会修改缓存内容）"""
+    entry = _LLM_CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, value = entry
+    if time.time() - stored_at > _LLM_CACHE_TTL:
+        del _LLM_CACHE[key]
+        return None
+    _LLM_CACHE.move_to_end(key)
+    return copy.deepcopy(value)
+
+
+def _llm_cache_put(key: str, value: Dict[str, Any]) -> None:
+    """写入缓存，超出容量时淘汰最久未使用的条目"""
+    _LLM_CACHE[key] = (time.time(), copy.deepcopy(value))
+    _LLM_CACHE.move_to_end(key)
+    while len(_LLM_CACHE) > _LLM_CACHE_SIZE:
+        _LLM_CACHE.popitem(last=False)
+
+
+# 标题层级缩进（1-6级标题对应0-5级缩进）
+_INDENTS = tuple('  ' * i for i in range(6))
+
+# 智能分段结果缓存（按文档内容摘要，FIFO淘汰）：同一文档重试或切换参数时跳过标题扫描
+_SEGMENT_CACHE_SIZE = 64
+_SEGMENT_CACHE: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+
+# 智能分段模式下关键章节内容的总字符预算
+_KEY_SECTIONS_BUDGET = 20000
+
+# 默认Prompt的静态部分（说明、保留字段、JSON格式示例）放在最前面，文档等动态内容放在末尾，
+# 使每次调用的Prompt前缀完全相同，便于LLM服务端的前缀缓存命中
+_SEGMENT_PROMPT_PREFIX = """你是一个知识图谱模板生成专家。请分析文末给出的文档内容，生成适合的实体和关系模板配置。
+
+请根据文档内容，识别并生成：
+
+1. **实体类型（entity_types）**：
+   - 识别文档中的核心实体（如：需求、功能、模块、系统、用户、产品等）
+   - 为每个实体类型定义：
+     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
+     * **fields**：字段定义（字段类型、是否必需、描述）
+   - 字段类型支持：str, Optional[str], int, Optional[int], bool, Optional[bool] 等
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
+   - 请使用其他字段名，例如：entity_name, title, description, status 等
+
+2. **关系类型（edge_types）**：
+   - 识别实体之间的关系类型（如：HAS_FEATURE, BELONGS_TO, USED_BY等）
+   - 为每个关系类型定义：
+     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
+     * **fields**：字段定义
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
+
+3. **关系映射（edge_type_map）**：
+   - 定义哪些实体之间可以使用哪些关系
+   - 格式：{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}
+
+要求：
+- 返回标准JSON格式
+- 实体类型和关系类型要符合文档的实际内容
+- 字段定义要完整（type, required, description）
+- 关系映射要准确反映文档中的实体关系
+- ⚠️ **严禁使用保留字段名**
+
+返回JSON格式：
+{
+  "entity_types": {
+    "EntityName": {
+      "description": "实体类型的描述，说明这个实体类型代表什么（例如：\"角色实体，代表系统中的各种角色和岗位\"）",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_types": {
+    "EdgeName": {
+      "description": "关系类型的描述，说明这个关系类型代表什么（例如：\"审批关系，表示一个实体对另一个实体的审批行为\"）",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_type_map": {
+    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
+  }
+}
+
+"""
+
+_SUMMARY_PROMPT_PREFIX = """你是一个知识图谱模板生成专家。请分析文末给出的文档摘要内容，生成适合的实体和关系模板配置。
+
+**注意：文末给出的内容是文档的摘要信息（Episode Body），包含了文档的基本信息和关键提取内容，而非完整文档。**
+
+请根据文档摘要内容，识别并生成：
+
+1. **实体类型（entity_types）**：
+   - 识别文档中的核心实体（如：需求、功能、模块、系统、用户、产品等）
+   - 为每个实体类型定义：
+     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
+     * **fields**：字段定义（字段类型、是否必需、描述）
+   - 字段类型支持：str, Optional[str], int, Optional[int], bool, Optional[bool] 等
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
+   - 请使用其他字段名，例如：entity_name, title, description, status 等
+
+2. **关系类型（edge_types）**：
+   - 识别实体之间的关系类型（如：HAS_FEATURE, BELONGS_TO, USED_BY等）
+   - 为每个关系类型定义：
+     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
+     * **fields**：字段定义
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
+
+3. **关系映射（edge_type_map）**：
+   - 定义哪些实体之间可以使用哪些关系
+   - 格式：{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}
+
+要求：
+- 返回标准JSON格式
+- 实体类型和关系类型要符合文档摘要的实际内容
+- 字段定义要完整（type, required, description）
+- 关系映射要准确反映文档中的实体关系
+- ⚠️ **严禁使用保留字段名**
+
+返回JSON格式：
+{
+  "entity_types": {
+    "EntityName": {
+      "description": "实体类型的描述，说明这个实体类型代表什么（例如：\"角色实体，代表系统中的各种角色和岗位\"）",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_types": {
+    "EdgeName": {
+      "description": "关系类型的描述，说明这个关系类型代表什么（例如：\"审批关系，表示一个实体对另一个实体的审批行为\"）",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_type_map": {
+    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
+  }
+}
+
+"""
+
+_CHUNK_PROMPT_PREFIX = """分析文末给出的文档片段，提取实体和关系类型：
+
+请提取：
+1. 实体类型及其字段定义
+   - ⚠️ **禁止使用保留字段**：uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
+   - 请使用其他字段名，如：entity_name, title, description, status 等
+   - 格式：{"EntityName": {"description": "实体类型描述", "fields": {"field_name": {"type": "str", "required": true, "description": "字段描述"}}}}
+2. 关系类型及其字段定义
+   - ⚠️ **禁止使用保留字段**：uuid, source_node_uuid, target_node_uuid, name, fact, attributes
+   - 格式：{"EdgeName": {"description": "关系类型描述", "fields": {"field_name": {"type": "str", "required": false, "description": "字段描述"}}}}
+3. 实体之间的关系映射
+   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
+   - 示例：{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS"]}
+   - ❌ 错误格式：{"Product": ["HAS_ORDER"]} 或单个实体名称作为key
+
+返回JSON格式：
+{
+  "entity_types": {
+    "EntityName": {
+      "description": "实体类型的描述",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_types": {
+    "EdgeName": {
+      "description": "关系类型的描述",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_type_map": {
+    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
+  }
+}
+
+"""
+
+_MERGE_PROMPT_PREFIX = """基于文末给出的所有分析结果，生成统一的模板配置。
+
+请合并、去重、统一，生成最终的模板配置。确保：
+1. 实体类型定义完整（包含字段类型、是否必需、描述）
+   - 格式：{"EntityName": {"fields": {"field_name": {"type": "str", "required": true, "description": "..."}}}}
+2. 关系类型定义完整
+   - 格式：{"EdgeName": {"fields": {"field_name": {"type": "str", "required": false, "description": "..."}}}}
+3. 关系映射准确
+   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
+   - 示例：{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS", "USES"]}
+   - ❌ 错误格式：{"Product": ["HAS_ORDER"]} 或单个实体名称作为key
+4. 返回标准JSON格式
+5. ⚠️ **严禁使用保留字段**：
+   - 实体保留字段：uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
+   - 关系保留字段：uuid, source_node_uuid, target_node_uuid, name, fact, attributes
+   - 请使用替代字段名，如：entity_name, title, description, status 等
+
+返回JSON格式：
+{
+  "entity_types": {"EntityName": {"fields": {...}}},
+  "edge_types": {"EdgeName": {"fields": {...}}},
+  "edge_type_map": {"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}
+}
+
+"""
+
+_FULL_CONTENT_PROMPT_PREFIX = """你是一个知识图谱模板生成专家。请分析文末给出的文档内容，生成适合的实体和关系模板配置。
+
+请根据文档内容，识别并生成：
+
+1. **实体类型（entity_types）**：
+   - 识别文档中的核心实体
+   - 为每个实体类型定义：
+     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
+     * **fields**：字段定义（字段类型、是否必需、描述）
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
+   - 请使用其他字段名，例如：entity_name, title, description, status 等
+
+2. **关系类型（edge_types）**：
+   - 识别实体之间的关系类型
+   - 为每个关系类型定义：
+     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
+     * **fields**：字段定义
+   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
+     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
+
+3. **关系映射（edge_type_map）**：
+   - 定义哪些实体之间可以使用哪些关系
+   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
+   - 示例：{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS", "USES"]}
+   - ❌ 错误格式：{"Product": ["HAS_ORDER"]} 或 {"产品": ["订单"]}
+
+返回标准JSON格式：
+{
+  "entity_types": {
+    "EntityName": {
+      "description": "实体类型的描述，说明这个实体类型代表什么",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_types": {
+    "EdgeName": {
+      "description": "关系类型的描述，说明这个关系类型代表什么",
+      "fields": {
+        "field_name": {
+          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
+          "required": true|false,
+          "description": "字段描述"
+        }
+      }
+    }
+  },
+  "edge_type_map": {
+    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
+  }
+}
+
+⚠️ **格式要求**：
+- entity_types 必须是字典：{"EntityName": {"description": "...", "fields": {...}}}
+- edge_types 必须是字典：{"EdgeName": {"description": "...", "fields": {...}}}
+- edge_type_map 必须是字典：{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}
+⚠️ **严禁使用保留字段名**
+"""
+
 
 class TemplateGenerationService:
     """模板生成服务"""
@@ -37,7 +373,7 @@ class TemplateGenerationService:
                     fields = entity_config["fields"]
                     if isinstance(fields, dict):
                         # 移除保留字段
-                        fields_to_remove = [f for f in fields.keys() if f in entity_reserved]
+                        fields_to_remove = fields.keys() & entity_reserved
                         for field in fields_to_remove:
                             logger.warning(f"自动移除实体类型 '{entity_name}' 的保留字段 '{field}'")
                             del fields[field]
@@ -50,7 +386,7 @@ class TemplateGenerationService:
                     fields = edge_config["fields"]
                     if isinstance(fields, dict):
                         # 移除保留字段
-                        fields_to_remove = [f for f in fields.keys() if f in edge_reserved]
+                        fields_to_remove = fields.keys() & edge_reserved
                         for field in fields_to_remove:
                             logger.warning(f"自动移除关系类型 '{edge_name}' 的保留字段 '{field}'")
                             del fields[field]
@@ -60,7 +396,7 @@ class TemplateGenerationService:
     @staticmethod
     def smart_segment(content: str) -> Dict[str, Any]:
         """
-        方案B：智能分段，提取文档结构
+        方案B：智能分段，提取文档结构（按文档内容缓存）
         
         Args:
             content: 文档内容（Markdown格式）
@@ -68,54 +404,74 @@ class TemplateGenerationService:
         Returns:
             分段结果，包含标题、关键章节、目录等
         """
-        # 提取所有标题
+        key = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        segments = _SEGMENT_CACHE.get(key)
+        if segments is None:
+            segments = TemplateGenerationService._smart_segment_impl(content)
+            _SEGMENT_CACHE[key] = segments
+            while len(_SEGMENT_CACHE) > _SEGMENT_CACHE_SIZE:
+                _SEGMENT_CACHE.popitem(last=False)
+        return copy.deepcopy(segments)
+    
+    @staticmethod
+    def _smart_segment_impl(content: str) -> Dict[str, Any]:
+        """智能分段的实际实现（见 smart_segment）"""
+        # 单次扫描标题：最多保留30个标题、5个关键章节（包含关键词的章节），
+        # 并记录第一个一级标题的位置；三者都已确定时提前结束，不再扫描文档剩余部分
         headings = []
-        for match in re.finditer(r'^(#{1,6})\s+(.+)$', content, re.MULTILINE):
-            level = len(match.group(1))
-            title = match.group(2).strip()
-            headings.append({
-                'level': level,
-                'title': title,
-                'position': match.start()
+        key_sections = []
+        pending_section = None  # 等待下一个标题位置来确定结束位置的关键章节
+        first_h1_position = None
+        
+        def close_section(section: Dict[str, Any], end: int) -> None:
+            section_content = content[section['position']:end]
+            # 限制每个章节内容长度（避免过长）
+            if len(section_content) > 5000:
+                section_content = section_content[:5000] + "\n\n[内容已截断...]"
+            key_sections.append({
+                'title': section['title'],
+                'level': section['level'],
+                'content': section_content
             })
         
-        # 识别关键章节（包含关键词的章节）
-        keywords = ['需求', '功能', '架构', '设计', '模块', '系统', '用户', '产品', 
-                   'requirement', 'feature', 'architecture', 'design', 'module', 
-                   'system', 'user', 'product']
-        key_sections = []
-        for i, heading in enumerate(headings):
-            if any(kw.lower() in heading['title'].lower() for kw in keywords):
-                # 获取章节内容范围
-                start = heading['position']
-                end = headings[i+1]['position'] if i+1 < len(headings) else len(content)
-                section_content = content[start:end]
-                # 限制每个章节内容长度（避免过长）
-                if len(section_content) > 5000:
-                    section_content = section_content[:5000] + "\n\n[内容已截断...]"
-                key_sections.append({
-                    'title': heading['title'],
-                    'level': heading['level'],
-                    'content': section_content
-                })
+        for match in _HEADING_RE.finditer(content):
+            position = match.start()
+            heading = {
+                'level': len(match.group(1)),
+                'title': match.group(2).strip(),
+                'position': position
+            }
+            if pending_section is not None:
+                close_section(pending_section, position)
+                pending_section = None
+            if first_h1_position is None and heading['level'] == 1:
+                first_h1_position = position
+            if len(headings) < 30:
+                headings.append(heading)
+            if len(key_sections) < 5 and _KEYWORD_RE.search(heading['title']):
+                pending_section = heading
+            if len(headings) >= 30 and len(key_sections) >= 5 and first_h1_position is not None:
+                break
+        
+        if pending_section is not None:
+            close_section(pending_section, len(content))
         
         # 提取目录部分（第一个一级标题之前）
-        first_h1 = next((h for h in headings if h['level'] == 1), None)
-        toc_content = content[:first_h1['position']] if first_h1 and first_h1['position'] > 0 else ""
+        toc_content = content[:first_h1_position] if first_h1_position else ""
         # 限制目录长度
         if len(toc_content) > 2000:
             toc_content = toc_content[:2000] + "\n\n[目录已截断...]"
         
         # 提取章节标题列表（用于结构分析）
         headings_text = "\n".join([
-            f"{'  ' * (h['level'] - 1)}- {h['title']}"
-            for h in headings[:30]  # 最多30个标题
+            f"{_INDENTS[h['level'] - 1]}- {h['title']}"
+            for h in headings
         ])
         
         return {
-            'headings': headings[:30],  # 最多30个标题
+            'headings': headings,  # 最多30个标题
             'headings_text': headings_text,
-            'key_sections': key_sections[:5],  # 最多5个关键章节
+            'key_sections': key_sections,  # 最多5个关键章节
             'toc_content': toc_content,
             'total_length': len(content)
         }
@@ -133,27 +489,28 @@ class TemplateGenerationService:
         Returns:
             分块列表
         """
-        chunks = []
-        start = 0
+        if overlap >= chunk_size:
+            raise ValueError(f"overlap ({overlap}) 必须小于 chunk_size ({chunk_size})")
+        
+        content_length = len(content)
+        if content_length == 0:
+            return []
         
-        while start < len(content):
-            end = min(start + chunk_size, len(content))
-            chunk = content[start:end]
+        # 相邻块重叠overlap个字符（避免在句子中间断开），块数可直接算出，
+        # 最后一块到达文档末尾即结束
+        step = chunk_size - overlap
+        total_chunks = max(1, math.ceil((content_length - overlap) / step))
+        chunks = []
+        for index in range(total_chunks):
+            start = index * step
+            end = min(start + chunk_size, content_length)
             chunks.append({
-                'index': len(chunks),
-                'content': chunk,
+                'index': index,
+                'content': content[start:end],
                 'start': start,
                 'end': end,
-                'total_chunks': 0  # 稍后更新
+                'total_chunks': total_chunks
             })
-            # 重叠部分，避免在句子中间断开
-            start = end - overlap
-            if start >= len(content):
-                break
-        
-        # 更新总块数
-        for chunk in chunks:
-            chunk['total_chunks'] = len(chunks)
         
         return chunks
     
@@ -185,108 +542,62 @@ class TemplateGenerationService:
         # 第一步：智能分段
         segments = TemplateGenerationService.smart_segment(content)
         
-        # 构建综合Prompt
-        structure_info = f"""
-文档目录结构：
-{segments['toc_content'][:2000] if segments['toc_content'] else '无目录'}
-
-章节标题列表：
-{segments['headings_text']}
-"""
-        
-        key_sections_text = "\n\n".join([
-            f"## {s['title']}\n{s['content']}"
-            for s in segments['key_sections']
-        ])
+        # 构建综合Prompt：各部分先收集为片段列表，最后一次性拼接，避免逐层生成中间字符串
+        structure_parts = [
+            "\n文档目录结构：\n",
+            segments['toc_content'][:2000] if segments['toc_content'] else '无目录',
+            "\n\n章节标题列表：\n",
+            segments['headings_text'],
+            "\n",
+        ]
+        
+        # 关键章节按字符预算拼接（分隔符"\n\n"计入预算），超出预算的部分截断后不再继续拼接
+        key_section_parts = []
+        remaining = _KEY_SECTIONS_BUDGET
+        for s in segments['key_sections']:
+            if key_section_parts:
+                # 剩余预算放不下分隔符和至少一个字符的内容时直接结束
+                if remaining <= 2:
+                    break
+                key_section_parts.append("\n\n")
+                remaining -= 2
+            piece = f"## {s['title']}\n{s['content']}"
+            if len(piece) >= remaining:
+                key_section_parts.append(piece[:remaining])
+                break
+            key_section_parts.append(piece)
+            remaining -= len(piece)
         
-        if not key_sections_text:
+        if not key_section_parts:
             # 如果没有关键章节，使用前5000字符
-            key_sections_text = content[:5000]
+            key_section_parts = [content[:5000]]
         
         # 使用自定义Prompt或默认Prompt
         if user_prompt_template:
             # 替换占位符（使用 replace 而不是 format，避免 JSON 中的花括号被错误解析）
             prompt = user_prompt_template.replace("{document_name}", document_name)
-            prompt = prompt.replace("{structure_info}", structure_info)
-            prompt = prompt.replace("{key_sections_text}", key_sections_text)
+            prompt = prompt.replace("{structure_info}", "".join(structure_parts))
+            prompt = prompt.replace("{key_sections_text}", "".join(key_section_parts))
         else:
-            # 默认User Prompt
-            prompt = f"""你是一个知识图谱模板生成专家。请分析以下文档内容，生成适合的实体和关系模板配置。
-
-{document_name}
-
-{structure_info}
-
-关键章节内容：
-{key_sections_text}
-
-请根据文档内容，识别并生成：
-
-1. **实体类型（entity_types）**：
-   - 识别文档中的核心实体（如：需求、功能、模块、系统、用户、产品等）
-   - 为每个实体类型定义：
-     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
-     * **fields**：字段定义（字段类型、是否必需、描述）
-   - 字段类型支持：str, Optional[str], int, Optional[int], bool, Optional[bool] 等
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
-   - 请使用其他字段名，例如：entity_name, title, description, status 等
-
-2. **关系类型（edge_types）**：
-   - 识别实体之间的关系类型（如：HAS_FEATURE, BELONGS_TO, USED_BY等）
-   - 为每个关系类型定义：
-     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
-     * **fields**：字段定义
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
-
-3. **关系映射（edge_type_map）**：
-   - 定义哪些实体之间可以使用哪些关系
-   - 格式：{{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}}
-
-要求：
-- 返回标准JSON格式
-- 实体类型和关系类型要符合文档的实际内容
-- 字段定义要完整（type, required, description）
-- 关系映射要准确反映文档中的实体关系
-- ⚠️ **严禁使用保留字段名**
-
-返回JSON格式：
-{{
-  "entity_types": {{
-    "EntityName": {{
-      "description": "实体类型的描述，说明这个实体类型代表什么（例如：\"角色实体，代表系统中的各种角色和岗位\"）",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_types": {{
-    "EdgeName": {{
-      "description": "关系类型的描述，说明这个关系类型代表什么（例如：\"审批关系，表示一个实体对另一个实体的审批行为\"）",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_type_map": {{
-    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
-  }}
-}}
-
-只返回JSON，不要其他内容。"""
+            # 默认User Prompt：静态前缀 + 动态部分，一次join生成
+            prompt = "".join([
+                _SEGMENT_PROMPT_PREFIX,
+                "\n", document_name, "\n\n",
+                *structure_parts,
+                "\n\n关键章节内容：\n",
+                *key_section_parts,
+                "\n\n只返回JSON，不要其他内容。",
+            ])
 
         # 准备System Prompt
         final_system_prompt = system_prompt if system_prompt else "你是一个专业的知识图谱模板生成专家，擅长从文档中提取实体和关系结构，生成规范的模板配置。"
         
+        cache_key = _llm_cache_key(provider, temperature, final_system_prompt, prompt)
+        cached = _llm_cache_get(cache_key)
+        if cached is not None:
+            logger.info("命中LLM响应缓存（智能分段模式）")
+            return TemplateGenerationService._remove_reserved_fields(cached)
+        
         # 调用LLM
         llm_client = get_llm_client()
         logger.info(f"调用LLM生成模板（智能分段模式）")
@@ -310,11 +621,9 @@ class TemplateGenerationService:
         # 解析JSON响应
         try:
             # 尝试提取JSON部分
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                template_config = json.loads(json_match.group())
-            else:
-                template_config = json.loads(response)
+            json_str = extract_first_json(response) or response.strip()
+            template_config = json_loads(json_str)
+            _llm_cache_put(cache_key, template_config)
             
             # 后处理：移除保留字段
             template_config = TemplateGenerationService._remove_reserved_fields(template_config)
@@ -355,11 +664,13 @@ class TemplateGenerationService:
         if len(episode_body) > MAX_LENGTH:
             logger.warning(f"Episode Body 内容过长 ({len(episode_body)} 字符)，截断至 {MAX_LENGTH} 字符")
             episode_body = episode_body[:MAX_LENGTH]
-            # 尝试在句子或段落边界截断
-            if '\n\n' in episode_body:
-                episode_body = episode_body.rsplit('\n\n', 1)[0]
-            elif '\n' in episode_body:
-                episode_body = episode_body.rsplit('\n', 1)[0]
+            # 尝试在段落或行边界截断（只在末尾10%范围内查找，避免为了对齐边界丢掉大段内容）
+            min_cut = int(MAX_LENGTH * 0.9)
+            cut = episode_body.rfind('\n\n', min_cut)
+            if cut == -1:
+                cut = episode_body.rfind('\n', min_cut)
+            if cut != -1:
+                episode_body = episode_body[:cut]
         
         # 使用自定义Prompt或默认Prompt
         if user_prompt_template:
@@ -368,82 +679,23 @@ class TemplateGenerationService:
             prompt = prompt.replace("{summary_content}", episode_body)
         else:
             # 默认User Prompt（针对摘要内容优化）
-            prompt = f"""你是一个知识图谱模板生成专家。请分析以下文档摘要内容，生成适合的实体和关系模板配置。
-
-**注意：以下内容是文档的摘要信息（Episode Body），包含了文档的基本信息和关键提取内容，而非完整文档。**
-
+            prompt = _SUMMARY_PROMPT_PREFIX + f"""
 文档名称: {document_name}
 
 文档摘要内容:
 {episode_body}
 
-请根据文档摘要内容，识别并生成：
-
-1. **实体类型（entity_types）**：
-   - 识别文档中的核心实体（如：需求、功能、模块、系统、用户、产品等）
-   - 为每个实体类型定义：
-     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
-     * **fields**：字段定义（字段类型、是否必需、描述）
-   - 字段类型支持：str, Optional[str], int, Optional[int], bool, Optional[bool] 等
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
-   - 请使用其他字段名，例如：entity_name, title, description, status 等
-
-2. **关系类型（edge_types）**：
-   - 识别实体之间的关系类型（如：HAS_FEATURE, BELONGS_TO, USED_BY等）
-   - 为每个关系类型定义：
-     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
-     * **fields**：字段定义
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
-
-3. **关系映射（edge_type_map）**：
-   - 定义哪些实体之间可以使用哪些关系
-   - 格式：{{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}}
-
-要求：
-- 返回标准JSON格式
-- 实体类型和关系类型要符合文档摘要的实际内容
-- 字段定义要完整（type, required, description）
-- 关系映射要准确反映文档中的实体关系
-- ⚠️ **严禁使用保留字段名**
-
-返回JSON格式：
-{{
-  "entity_types": {{
-    "EntityName": {{
-      "description": "实体类型的描述，说明这个实体类型代表什么（例如：\"角色实体，代表系统中的各种角色和岗位\"）",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_types": {{
-    "EdgeName": {{
-      "description": "关系类型的描述，说明这个关系类型代表什么（例如：\"审批关系，表示一个实体对另一个实体的审批行为\"）",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_type_map": {{
-    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
-  }}
-}}
-
 只返回JSON，不要其他内容。"""
 
         # 准备System Prompt
         final_system_prompt = system_prompt if system_prompt else "你是一个专业的知识图谱模板生成专家，擅长从文档摘要中提取实体和关系结构，生成规范的模板配置。"
 
+        cache_key = _llm_cache_key(provider, temperature, final_system_prompt, prompt)
+        cached = _llm_cache_get(cache_key)
+        if cached is not None:
+            logger.info("命中LLM响应缓存（摘要解析模式）")
+            return TemplateGenerationService._remove_reserved_fields(cached)
+
         # 调用LLM
         llm_client = get_llm_client()
         logger.info(f"调用LLM生成模板（摘要解析模式），输入内容长度: {len(episode_body)} 字符")
@@ -467,11 +719,9 @@ class TemplateGenerationService:
         # 解析JSON响应
         try:
             # 尝试提取JSON部分
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                template_config = json.loads(json_match.group())
-            else:
-                template_config = json.loads(response)
+            json_str = extract_first_json(response) or response.strip()
+            template_config = json_loads(json_str)
+            _llm_cache_put(cache_key, template_config)
             
             # 后处理：移除保留字段
             template_config = TemplateGenerationService._remove_reserved_fields(template_config)
@@ -489,7 +739,9 @@ class TemplateGenerationService:
         provider: str = "local",
         temperature: float = 0.3,
         system_prompt: Optional[str] = None,
-        user_prompt_template: Optional[str] = None
+        user_prompt_template: Optional[str] = None,
+        chunk_provider: Optional[str] = None,
+        merge_provider: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         方案D：全文 + 分块分析生成模板
@@ -501,6 +753,8 @@ class TemplateGenerationService:
             temperature: 温度
             system_prompt: 自定义System Prompt
             user_prompt_template: 自定义User Prompt模板（需要包含 {document_name}, {summary_content} 占位符）
+            chunk_provider: 分块分析使用的LLM提供商（默认同provider，可指定更快/更便宜的模型）
+            merge_provider: 最终合并使用的LLM提供商（默认同provider）
         
         Returns:
             生成的模板配置
@@ -523,7 +777,7 @@ class TemplateGenerationService:
             )
         else:
             # 大文档，分块分析
-            logger.info(f"文档长度 {len(content)} 字符，分块分析")
+            logger.info(f"文档长度 {len(content)} 字符，分块分析: chunk_provider={chunk_provider or provider}, merge_provider={merge_provider or provider}")
             chunks = TemplateGenerationService.chunk_document(content)
             logger.info(f"文档分为 {len(chunks)} 个块")
             
@@ -533,132 +787,114 @@ class TemplateGenerationService:
             all_edge_maps = {}
             
             llm_client = get_llm_client()
+            chunk_provider = chunk_provider or provider
+            merge_provider = merge_provider or provider
             
-            for i, chunk in enumerate(chunks):
-                logger.info(f"分析第 {i+1}/{len(chunks)} 个块")
-                chunk_prompt = f"""分析以下文档片段，提取实体和关系类型：
-
+            # 各块分析互不依赖，并发调用LLM（用Semaphore限制同时进行的请求数）
+            # - get_llm_client() 返回进程内单例，其OpenAI客户端在初始化时创建一次，
+            #   内部httpx连接池保持keep-alive，并发请求复用已建立的TCP/TLS连接
+            # - Semaphore按调用创建而不是模块级单例：Celery任务每次使用新的事件循环，
+            #   asyncio.Semaphore跨事件循环等待会抛出RuntimeError
+            semaphore = asyncio.Semaphore(max(1, settings.TEMPLATE_CHUNK_MAX_CONCURRENT))
+            chunk_system_prompt = "你是一个专业的知识图谱模板生成专家，擅长从文档片段中提取实体和关系结构。"
+            
+            async def analyze_chunk(chunk: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]]]:
+                i = chunk['index']
+                chunk_prompt = _CHUNK_PROMPT_PREFIX + f"""
 文档片段（第{chunk['index']+1}部分，共{chunk['total_chunks']}部分）：
 {chunk['content']}
 
-请提取：
-1. 实体类型及其字段定义
-   - ⚠️ **禁止使用保留字段**：uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
-   - 请使用其他字段名，如：entity_name, title, description, status 等
-   - 格式：{{"EntityName": {{"description": "实体类型描述", "fields": {{"field_name": {{"type": "str", "required": true, "description": "字段描述"}}}}}}}}
-2. 关系类型及其字段定义
-   - ⚠️ **禁止使用保留字段**：uuid, source_node_uuid, target_node_uuid, name, fact, attributes
-   - 格式：{{"EdgeName": {{"description": "关系类型描述", "fields": {{"field_name": {{"type": "str", "required": false, "description": "字段描述"}}}}}}}}
-3. 实体之间的关系映射
-   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
-   - 示例：{{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS"]}}
-   - ❌ 错误格式：{{"Product": ["HAS_ORDER"]}} 或单个实体名称作为key
-
-返回JSON格式：
-{{
-  "entity_types": {{
-    "EntityName": {{
-      "description": "实体类型的描述",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_types": {{
-    "EdgeName": {{
-      "description": "关系类型的描述",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_type_map": {{
-    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
-  }}
-}}
-
 只返回JSON，不要其他内容。"""
                 
+                cache_key = _llm_cache_key(chunk_provider, 0.3, chunk_system_prompt, chunk_prompt)
+                cached = _llm_cache_get(cache_key)
+                if cached is not None:
+                    logger.info(f"第 {i+1}/{len(chunks)} 个块命中LLM响应缓存")
+                    return i, cached
+                
                 try:
-                    response = await llm_client.chat(
-                        "local",
-                        [
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的知识图谱模板生成专家，擅长从文档片段中提取实体和关系结构。"
-                            },
-                            {
-                                "role": "user",
-                                "content": chunk_prompt
-                            }
-                        ],
-                        temperature=0.3,
-                        use_thinking=False
-                    )
+                    async with semaphore:
+                        logger.info(f"分析第 {i+1}/{len(chunks)} 个块")
+                        response = await llm_client.chat(
+                            chunk_provider,
+                            [
+                                {
+                                    "role": "system",
+                                    "content": chunk_system_prompt
+                                },
+                                {
+                                    "role": "user",
+                                    "content": chunk_prompt
+                                }
+                            ],
+                            temperature=0.3,
+                            use_thinking=False
+                        )
                     
                     # 解析JSON
-                    json_match = re.search(r'\{.*\}', response, re.DOTALL)
-                    if json_match:
-                        chunk_result = json.loads(json_match.group())
-                    else:
-                        chunk_result = json.loads(response)
-                    
-                    # 合并结果（去重，后出现的覆盖先出现的）
-                    all_entity_types.update(chunk_result.get('entity_types', {}))
-                    all_edge_types.update(chunk_result.get('edge_types', {}))
-                    all_edge_maps.update(chunk_result.get('edge_type_map', {}))
-                    
+                    json_str = extract_first_json(response) or response.strip()
+                    chunk_result = json_loads(json_str)
+                    if isinstance(chunk_result, dict):
+                        _llm_cache_put(cache_key, chunk_result)
+                    return i, chunk_result
                 except Exception as e:
                     logger.warning(f"分析第 {i+1} 个块失败: {e}，跳过")
+                    return i, None
+            
+            # 每个块完成后立即合并，不等待全部块返回；同名定义保留块序号最大的一份，
+            # 与按块顺序依次覆盖（后出现的覆盖先出现的）的结果一致
+            merge_targets = (
+                ('entity_types', all_entity_types, {}),
+                ('edge_types', all_edge_types, {}),
+                ('edge_type_map', all_edge_maps, {})
+            )
+            has_conflict = False  # 不同块对同名类型给出了不同定义
+            for next_result in asyncio.as_completed([analyze_chunk(chunk) for chunk in chunks]):
+                index, chunk_result = await next_result
+                if not isinstance(chunk_result, dict):
                     continue
+                for result_key, merged, owners in merge_targets:
+                    items = chunk_result.get(result_key, {})
+                    if not isinstance(items, dict):
+                        continue
+                    for name, value in items.items():
+                        if name in merged and merged[name] != value:
+                            has_conflict = True
+                        if owners.get(name, -1) < index:
+                            owners[name] = index
+                            merged[name] = value
+            
+            # 各块结果没有冲突、且关系映射格式正确时，按名称合并的结果即为最终模板，
+            # 无需再调用一次LLM进行合并
+            if (
+                all_entity_types
+                and not has_conflict
+                and all(" -> " in key for key in all_edge_maps)
+            ):
+                final_template = TemplateGenerationService._remove_reserved_fields({
+                    'entity_types': all_entity_types,
+                    'edge_types': all_edge_types,
+                    'edge_type_map': all_edge_maps
+                })
+                logger.info(f"各块分析结果无冲突，跳过LLM合并：{len(all_entity_types)} 个实体类型，{len(all_edge_types)} 个关系类型")
+                return final_template
             
             # 最终综合生成模板
             logger.info("综合所有分析结果，生成最终模板")
-            final_prompt = f"""基于以下所有分析结果，生成统一的模板配置：
-
+            final_prompt = _MERGE_PROMPT_PREFIX + f"""
 实体类型汇总：
-{json.dumps(all_entity_types, ensure_ascii=False, indent=2)[:5000]}
+{json_dumps_compact(all_entity_types)[:5000]}
 
 关系类型汇总：
-{json.dumps(all_edge_types, ensure_ascii=False, indent=2)[:5000]}
+{json_dumps_compact(all_edge_types)[:5000]}
 
 关系映射汇总：
-{json.dumps(all_edge_maps, ensure_ascii=False, indent=2)[:5000]}
-
-请合并、去重、统一，生成最终的模板配置。确保：
-1. 实体类型定义完整（包含字段类型、是否必需、描述）
-   - 格式：{{"EntityName": {{"fields": {{"field_name": {{"type": "str", "required": true, "description": "..."}}}}}}}}
-2. 关系类型定义完整
-   - 格式：{{"EdgeName": {{"fields": {{"field_name": {{"type": "str", "required": false, "description": "..."}}}}}}}}
-3. 关系映射准确
-   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
-   - 示例：{{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS", "USES"]}}
-   - ❌ 错误格式：{{"Product": ["HAS_ORDER"]}} 或单个实体名称作为key
-4. 返回标准JSON格式
-5. ⚠️ **严禁使用保留字段**：
-   - 实体保留字段：uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
-   - 关系保留字段：uuid, source_node_uuid, target_node_uuid, name, fact, attributes
-   - 请使用替代字段名，如：entity_name, title, description, status 等
-
-返回JSON格式：
-{{
-  "entity_types": {{"EntityName": {{"fields": {{...}}}}}},
-  "edge_types": {{"EdgeName": {{"fields": {{...}}}}}},
-  "edge_type_map": {{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}}
-}}
+{json_dumps_compact(all_edge_maps)[:5000]}
 
 只返回JSON，不要其他内容。"""
             
             final_response = await llm_client.chat(
-                "local",
+                merge_provider,
                 [
                     {
                         "role": "system",
@@ -674,11 +910,8 @@ class TemplateGenerationService:
             )
             
             # 解析最终结果
-            json_match = re.search(r'\{.*\}', final_response, re.DOTALL)
-            if json_match:
-                final_template = json.loads(json_match.group())
-            else:
-                final_template = json.loads(final_response)
+            json_str = extract_first_json(final_response) or final_response.strip()
+            final_template = json_loads(json_str)
             
             # 后处理：移除保留字段
             final_template = TemplateGenerationService._remove_reserved_fields(final_template)
@@ -716,79 +949,23 @@ class TemplateGenerationService:
             prompt = prompt.replace("{summary_content}", content)
         else:
             # 默认User Prompt
-            prompt = f"""你是一个知识图谱模板生成专家。请分析以下文档内容，生成适合的实体和关系模板配置。
-
+            prompt = _FULL_CONTENT_PROMPT_PREFIX + f"""
 文档名称: {document_name}
 
 文档内容:
 {content}
 
-请根据文档内容，识别并生成：
-
-1. **实体类型（entity_types）**：
-   - 识别文档中的核心实体
-   - 为每个实体类型定义：
-     * **description**（必需）：实体类型的描述，说明这个实体类型代表什么（例如："需求实体，代表系统中的各种功能需求"）
-     * **fields**：字段定义（字段类型、是否必需、描述）
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, name, group_id, labels, created_at, name_embedding, summary, attributes
-   - 请使用其他字段名，例如：entity_name, title, description, status 等
-
-2. **关系类型（edge_types）**：
-   - 识别实体之间的关系类型
-   - 为每个关系类型定义：
-     * **description**（必需）：关系类型的描述，说明这个关系类型代表什么（例如："包含关系，表示一个实体包含另一个实体"）
-     * **fields**：字段定义
-   - ⚠️ **重要：以下字段是系统保留字段，不能使用**：
-     - uuid, source_node_uuid, target_node_uuid, name, fact, attributes
-
-3. **关系映射（edge_type_map）**：
-   - 定义哪些实体之间可以使用哪些关系
-   - ⚠️ **格式要求**：必须是字典，key格式为 "SourceEntity -> TargetEntity"（注意中间有空格和箭头）
-   - 示例：{{"Product -> Order": ["HAS_ORDER"], "User -> Product": ["OWNS", "USES"]}}
-   - ❌ 错误格式：{{"Product": ["HAS_ORDER"]}} 或 {{"产品": ["订单"]}}
-
-返回标准JSON格式：
-{{
-  "entity_types": {{
-    "EntityName": {{
-      "description": "实体类型的描述，说明这个实体类型代表什么",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_types": {{
-    "EdgeName": {{
-      "description": "关系类型的描述，说明这个关系类型代表什么",
-      "fields": {{
-        "field_name": {{
-          "type": "str|Optional[str]|int|Optional[int]|bool|Optional[bool]",
-          "required": true|false,
-          "description": "字段描述"
-        }}
-      }}
-    }}
-  }},
-  "edge_type_map": {{
-    "SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]
-  }}
-}}
-
-只返回JSON，不要其他内容。
-⚠️ **格式要求**：
-- entity_types 必须是字典：{{"EntityName": {{"description": "...", "fields": {{...}}}}}}
-- edge_types 必须是字典：{{"EdgeName": {{"description": "...", "fields": {{...}}}}}}
-- edge_type_map 必须是字典：{{"SourceEntity -> TargetEntity": ["EdgeName1", "EdgeName2"]}}
-⚠️ **严禁使用保留字段名**"""
+只返回JSON，不要其他内容。"""
         
         # 准备System Prompt
         final_system_prompt = system_prompt if system_prompt else "你是一个专业的知识图谱模板生成专家，擅长从文档中提取实体和关系结构，生成规范的模板配置。"
         
+        cache_key = _llm_cache_key(provider, temperature, final_system_prompt, prompt)
+        cached = _llm_cache_get(cache_key)
+        if cached is not None:
+            logger.info("命中LLM响应缓存（全文分析）")
+            return TemplateGenerationService._remove_reserved_fields(cached)
+        
         llm_client = get_llm_client()
         response = await llm_client.chat(
             provider,
@@ -809,27 +986,24 @@ class TemplateGenerationService:
         # 解析JSON响应
         try:
             # 尝试提取JSON部分（可能包含markdown代码块或其他文本）
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-            else:
-                json_str = response.strip()
+            json_str = extract_first_json(response) or response.strip()
             
             # 尝试解析JSON
-            template_config = json.loads(json_str)
+            template_config = json_loads(json_str)
         except json.JSONDecodeError as e:
             logger.error(f"解析LLM响应JSON失败: {e}\n响应内容前500字符: {response[:500]}")
             # 尝试更宽松的JSON提取
             # 查找 ```json 代码块
-            json_block_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
-            if json_block_match:
-                try:
-                    template_config = json.loads(json_block_match.group(1))
-                    logger.info("从markdown代码块中成功提取JSON")
-                except json.JSONDecodeError as e2:
-                    raise Exception(f"LLM返回的JSON格式错误: {str(e)}\n响应内容前500字符: {response[:500]}")
-        else:
-                raise Exception(f"LLM返回的JSON格式错误: {str(e)}\n响应内容前500字符: {response[:500]}")
+            json_block_match = _JSON_BLOCK_RE.search(response)
+            if not json_block_match:
+                raise Exception(f"LLM返回的JSON格式错误: {str(e)}\n响应内容前500字符: {response[:500]}") from e
+            try:
+                template_config = json_loads(json_block_match.group(1))
+                logger.info("从markdown代码块中成功提取JSON")
+            except json.JSONDecodeError as e2:
+                raise Exception(f"LLM返回的JSON格式错误: {str(e2)}\n响应内容前500字符: {response[:500]}") from e2
+        
+        _llm_cache_put(cache_key, template_config)
         
         # 后处理：移除保留字段
         template_config = TemplateGenerationService._remove_reserved_fields(template_config)
@@ -0,0 +1,57 @@
+"""
+Entity名称与chunk文本的批量匹配
+
+纯函数、无重量级依赖，既可在线程中直接调用，也可提交到进程池执行
+（spawn子进程只需导入本模块）。
+"""
+
+from typing import List
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def match_names_in_texts(texts: List[str], names: List[str], max_hits: int = 5) -> List[List[int]]:
+    """
+    查找每个名称出现在哪些文本中
+
+    安装了pyahocorasick时对全部名称构建一个自动机，每个文本只需线性扫描一遍，
+    否则回退为逐个子串匹配。调用方负责统一大小写。
+
+    Args:
+        texts: 待匹配文本列表（顺序即优先级，如按分数排序的chunk）
+        names: 名称列表（非空、互不重复）
+        max_hits: 每个名称最多返回的命中数
+
+    Returns:
+        与names一一对应的命中文本下标列表（按文本顺序）
+    """
+    hits: List[List[int]] = [[] for _ in names]
+    if not names or not texts:
+        return hits
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for idx, name in enumerate(names):
+            automaton.add_word(name, idx)
+        automaton.make_automaton()
+
+        for text_idx, text in enumerate(texts):
+            # 同一名称在一个文本中多次出现只记录一次
+            matched = set()
+            for _, idx in automaton.iter(text):
+                if idx in matched:
+                    continue
+                matched.add(idx)
+                if len(hits[idx]) < max_hits:
+                    hits[idx].append(text_idx)
+    else:
+        contains = str.__contains__
+        for idx, name in enumerate(names):
+            hits[idx] = [
+                text_idx for text_idx, text in enumerate(texts) if contains(text, name)
+            ][:max_hits]
+
+    return hits
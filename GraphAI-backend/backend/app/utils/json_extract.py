@@ -0,0 +1,61 @@
+"""
+从LLM响应文本中提取JSON，以及基于orjson的JSON解析/序列化
+"""
+
+from typing import Any, Optional, Union
+
+import orjson
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    解析JSON（orjson，C实现）
+
+    orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方可继续捕获 json.JSONDecodeError
+    """
+    return orjson.loads(data)
+
+
+def json_dumps_compact(obj: Any) -> str:
+    """紧凑JSON序列化（保留非ASCII字符），与 json.dumps(ensure_ascii=False, separators=(',', ':')) 输出一致"""
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def extract_first_json(text: str) -> Optional[str]:
+    """
+    线性扫描提取第一个完整的JSON对象
+
+    从第一个'{'开始计数括号深度（忽略字符串内的括号和转义字符），
+    找到与之配对的'}'即返回。相比贪婪正则 r'\\{.*\\}'，不会回溯，
+    且模型在JSON之后追加说明文字时也只返回JSON本身。
+
+    Args:
+        text: LLM响应文本
+
+    Returns:
+        JSON对象子串；没有完整的JSON对象时返回None
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for idx in range(start, len(text)):
+        ch = text[idx]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:idx + 1]
+    return None
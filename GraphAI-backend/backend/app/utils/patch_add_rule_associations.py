@@ -9,13 +9,55 @@ Monkey patch for add_rule_associations to use simple BaseModel instead of DataPo
 - Cognee DataPoint：212.23 秒 ❌ (Server disconnected)
 """
 
+import asyncio
+import copy
+import hashlib
 import logging
-from typing import List, Optional
-from uuid import NAMESPACE_OID, uuid5
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import NAMESPACE_OID, UUID, uuid5
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
+# SimpleRuleSet 的 JSON Schema 缓存（按生成参数区分）
+_JSON_SCHEMA_CACHE: Dict[tuple, Dict[str, Any]] = {}
+
+# LLM规则提取结果缓存（精确匹配 system + user prompt）：同一段落重试或重复处理时直接复用
+# 已有规则会拼进 user prompt，规则集合变化后缓存键自然不同
+_RULES_CACHE_SIZE = 256
+_RULES_CACHE_TTL = 3600.0
+_RULES_CACHE: "OrderedDict[str, Tuple[float, Tuple[str, ...]]]" = OrderedDict()
+
+
+def _rules_cache_key(system_prompt: str, user_prompt: str) -> str:
+    """由LLM调用的输入构造缓存键"""
+    raw = f"{system_prompt}\x00{user_prompt}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _rules_cache_get(key: str) -> Optional[Tuple[str, ...]]:
+    """读取缓存，过期条目直接删除"""
+    entry = _RULES_CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, rules = entry
+    if time.time() - stored_at > _RULES_CACHE_TTL:
+        del _RULES_CACHE[key]
+        return None
+    _RULES_CACHE.move_to_end(key)
+    return rules
+
+
+def _rules_cache_put(key: str, rules: List[str]) -> None:
+    """写入缓存，超出容量时淘汰最久未使用的条目"""
+    _RULES_CACHE[key] = (time.time(), tuple(rules))
+    _RULES_CACHE.move_to_end(key)
+    while len(_RULES_CACHE) > _RULES_CACHE_SIZE:
+        _RULES_CACHE.popitem(last=False)
+
 
 # 简单的 Pydantic 模型，用于 LLM 调用
 # 注意：为了避免 Instructor 的 JSON Schema $ref 问题，我们使用内联定义而不是嵌套模型
@@ -26,6 +68,62 @@ class SimpleRuleSet(BaseModel):
         description="List of developer rules extracted from the input text. Each rule is a string representing a coding best practice or guideline.",
     )
 
+    @classmethod
+    def model_json_schema(cls, *args, **kwargs) -> Dict[str, Any]:
+        """
+        缓存 JSON Schema：结构化输出每次调用都会重新生成 Schema，而模型定义不会变化，
+        生成一次后返回副本即可（返回副本避免调用方修改缓存内容）
+        """
+        try:
+            key = (cls, args, tuple(sorted(kwargs.items())))
+            cached = _JSON_SCHEMA_CACHE.get(key)
+        except TypeError:
+            # 参数不可哈希时不缓存
+            return super().model_json_schema(*args, **kwargs)
+        if cached is None:
+            cached = _JSON_SCHEMA_CACHE[key] = super().model_json_schema(*args, **kwargs)
+        return copy.deepcopy(cached)
+
+
+# 导入时预先生成默认参数下的 Schema，首个请求无需再构建
+SimpleRuleSet.model_json_schema()
+
+
+@lru_cache(maxsize=None)
+def _cognee_deps() -> tuple:
+    """
+    导入 patch 依赖的 Cognee 组件（仅首次调用时导入，之后直接返回）
+
+    不放在模块顶层：Cognee 在导入时读取环境变量配置，必须等应用完成 Cognee 配置后再导入
+    """
+    from cognee.infrastructure.databases.graph import get_graph_engine
+    from cognee.infrastructure.llm.prompts import render_prompt
+    from cognee.infrastructure.llm import LLMGateway
+    from cognee.modules.engine.models import NodeSet
+    from cognee.tasks.storage import add_data_points, index_graph_edges
+    
+    # 导入 Cognee 的原始 Rule 类（用于最终保存）
+    from cognee.tasks.codingagents.coding_rule_associations import Rule, get_existing_rules, get_origin_edges
+    
+    return (
+        get_graph_engine, render_prompt, LLMGateway, NodeSet,
+        add_data_points, index_graph_edges,
+        Rule, get_existing_rules, get_origin_edges
+    )
+
+
+@lru_cache(maxsize=64)
+def _render_static_prompt(prompt_location: str) -> str:
+    """渲染不含上下文变量的提示词模板（如系统提示词），按模板位置缓存，避免每次读文件并渲染Jinja"""
+    render_prompt = _cognee_deps()[1]
+    return render_prompt(prompt_location, context={})
+
+
+@lru_cache(maxsize=128)
+def _rules_nodeset_id(rules_nodeset_name: str) -> UUID:
+    """规则集合名 -> NodeSet ID（确定性映射，可缓存）"""
+    return uuid5(NAMESPACE_OID, name=rules_nodeset_name)
+
 
 async def patched_add_rule_associations(
     data: str,
@@ -44,15 +142,11 @@ async def patched_add_rule_associations(
     2. LLM 调用成功后，将结果转换为 Cognee 的 Rule（DataPoint）格式
     3. 性能提升：从 212 秒（失败）降低到 6 秒（成功）
     """
-    from cognee.infrastructure.databases.graph import get_graph_engine
-    from cognee.infrastructure.databases.vector import get_vector_engine
-    from cognee.infrastructure.llm.prompts import render_prompt
-    from cognee.infrastructure.llm import LLMGateway
-    from cognee.modules.engine.models import NodeSet
-    from cognee.tasks.storage import add_data_points, index_graph_edges
-    
-    # 导入 Cognee 的原始 Rule 类（用于最终保存）
-    from cognee.tasks.codingagents.coding_rule_associations import Rule, get_existing_rules, get_origin_edges
+    (
+        get_graph_engine, render_prompt, LLMGateway, NodeSet,
+        add_data_points, index_graph_edges,
+        Rule, get_existing_rules, get_origin_edges
+    ) = _cognee_deps()
     
     logger.info("🔧 使用 patched_add_rule_associations（使用简单 BaseModel）")
     
@@ -60,16 +154,23 @@ async def patched_add_rule_associations(
         data = " ".join(data)
     
     # 步骤1: 获取现有规则
+    # 直接传入的user_prompt不含 {rules} 占位符时，prompt 不需要现有规则，推迟到去重前再查询
     graph_engine = await get_graph_engine()
-    existing_rules = await get_existing_rules(rules_nodeset_name=rules_nodeset_name)
-    existing_rules_str = "\n".join(f"- {rule}" for rule in existing_rules)
+    needs_rules = user_prompt is None or "{rules}" in user_prompt
+    if needs_rules:
+        existing_rules = await get_existing_rules(rules_nodeset_name=rules_nodeset_name)
+        existing_rules_str = "\n".join(["- " + rule for rule in existing_rules])
+    else:
+        existing_rules = None
+        existing_rules_str = ""
     
     # 步骤2: 构建 prompt
     # 如果直接传入了提示词内容，使用直接传入的内容；否则使用文件路径加载
     if user_prompt is not None:
         # 直接使用传入的user_prompt，替换占位符
         final_user_prompt = user_prompt.replace("{chat}", data)
-        final_user_prompt = final_user_prompt.replace("{rules}", existing_rules_str)
+        if needs_rules:
+            final_user_prompt = final_user_prompt.replace("{rules}", existing_rules_str)
         # 支持其他占位符（如 {document_name}, {section_title}, {section_content} 等）
         # 这些占位符在调用时已经替换，这里只替换 {chat} 和 {rules}
     else:
@@ -81,40 +182,67 @@ async def patched_add_rule_associations(
         # 直接使用传入的system_prompt
         final_system_prompt = system_prompt
     else:
-        # 使用文件路径加载
-        final_system_prompt = render_prompt(system_prompt_location, context={})
+        # 使用文件路径加载（系统提示词没有上下文变量，渲染结果可缓存）
+        final_system_prompt = _render_static_prompt(system_prompt_location)
     
     # 步骤3: 使用简单的 BaseModel 进行 LLM 调用（关键修复）
-    logger.info(f"  调用 LLM（使用 SimpleRuleSet）...")
-    simple_rule_list = await LLMGateway.acreate_structured_output(
-        text_input=final_user_prompt,
-        system_prompt=final_system_prompt,
-        response_model=SimpleRuleSet  # ← 使用简单的 BaseModel
-    )
-    logger.info(f"  ✅ LLM 调用成功，返回 {len(simple_rule_list.rules)} 条规则")
+    cache_key = _rules_cache_key(final_system_prompt, final_user_prompt)
+    cached_rules = _rules_cache_get(cache_key)
+    if cached_rules is not None:
+        simple_rule_list = SimpleRuleSet(rules=list(cached_rules))
+        logger.info(f"  ✅ 命中LLM结果缓存，{len(simple_rule_list.rules)} 条规则")
+    else:
+        logger.info(f"  调用 LLM（使用 SimpleRuleSet）...")
+        simple_rule_list = await LLMGateway.acreate_structured_output(
+            text_input=final_user_prompt,
+            system_prompt=final_system_prompt,
+            response_model=SimpleRuleSet  # ← 使用简单的 BaseModel
+        )
+        _rules_cache_put(cache_key, simple_rule_list.rules)
+        logger.info(f"  ✅ LLM 调用成功，返回 {len(simple_rule_list.rules)} 条规则")
+    
+    # 过滤已存在的规则及本次返回中的重复规则（忽略首尾空白和大小写），避免重复写入节点和边
+    if existing_rules is None:
+        existing_rules = await get_existing_rules(rules_nodeset_name=rules_nodeset_name)
+    seen_rules = {rule.strip().lower() for rule in existing_rules}
+    new_rules = []
+    for rule_text in simple_rule_list.rules:
+        normalized = rule_text.strip().lower()
+        if normalized in seen_rules:
+            continue
+        seen_rules.add(normalized)
+        new_rules.append(rule_text)
+    
+    skipped = len(simple_rule_list.rules) - len(new_rules)
+    if skipped:
+        logger.info(f"  ⏭️  跳过 {skipped} 条已存在或重复的规则")
+    if not new_rules:
+        logger.info("  ✅ 没有新规则需要保存")
+        return
     
     # 步骤4: 转换为 Cognee 的 Rule（DataPoint）格式
+    # NodeSet 是可变的 DataPoint，保存过程中可能被写入字段，每次调用单独创建；只缓存ID
     rules_nodeset = NodeSet(
-        id=uuid5(NAMESPACE_OID, name=rules_nodeset_name),
+        id=_rules_nodeset_id(rules_nodeset_name),
         name=rules_nodeset_name
     )
     
-    cognee_rules = []
-    for rule_text in simple_rule_list.rules:
-        # 创建 Cognee 的 Rule 对象（现在 rules 直接是字符串列表）
-        cognee_rule = Rule(
-            text=rule_text,
-            belongs_to_set=rules_nodeset
-        )
-        cognee_rules.append(cognee_rule)
-    
-    # 步骤5: 获取关联边
-    edges_to_save = await get_origin_edges(data=data, rules=cognee_rules)
+    # 创建 Cognee 的 Rule 对象（现在 rules 直接是字符串列表）
+    # 不使用 model_construct：DataPoint 在 __init__ 中填充 type 等字段，跳过会导致保存的数据不完整
+    cognee_rules = [
+        Rule(text=rule_text, belongs_to_set=rules_nodeset)
+        for rule_text in new_rules
+    ]
     
-    # 步骤6: 保存到数据库
-    await add_data_points(data_points=cognee_rules)
+    # 步骤5+6: 获取关联边（向量检索来源chunk）与保存规则节点互不依赖，并发执行；
+    # 边的写入依赖规则节点已存在，放在两者完成之后
+    edges_to_save, _ = await asyncio.gather(
+        get_origin_edges(data=data, rules=cognee_rules),
+        add_data_points(data_points=cognee_rules)
+    )
     
-    if len(edges_to_save) > 0:
+    # 只写入并索引本次新建的边；Neo4jAdapter.add_edges 内部已用 UNWIND 批量写入
+    if edges_to_save:
         await graph_engine.add_edges(edges_to_save)
         await index_graph_edges(edges_to_save)
     
@@ -1,10 +1,16 @@
 """
 Neo4j 索引初始化脚本
 用于在应用启动前创建 Graphiti 所需的所有索引
+
+诊断模式：python init_neo4j_indexes.py --audit
+列出统计周期超过7天仍未被读取过的索引（每个索引都会增加写入开销，可据此从列表中移除）
 """
 import os
 import sys
 import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
 from neo4j import GraphDatabase
 from neo4j.exceptions import ServiceUnavailable, AuthError
 
@@ -17,64 +23,82 @@ def get_neo4j_config():
         raise ValueError("NEO4J_PASSWORD 环境变量未设置")
     return uri, username, password
 
-def wait_for_neo4j(driver, max_retries=30, retry_interval=2):
-    """等待 Neo4j 就绪"""
+def wait_for_neo4j(driver, max_wait=60, base_interval=0.25, max_interval=3.0):
+    """等待 Neo4j 就绪（指数退避 + 随机抖动，总等待时间不超过 max_wait 秒）"""
     print(f"⏳ 等待 Neo4j 服务就绪...")
-    for i in range(max_retries):
+    deadline = time.monotonic() + max_wait
+    attempt = 0
+    while True:
+        attempt += 1
         try:
             with driver.session() as session:
                 session.run("RETURN 1")
             print(f"✅ Neo4j 服务已就绪")
             return True
         except (ServiceUnavailable, AuthError) as e:
-            if i < max_retries - 1:
-                print(f"⚠️  尝试 {i+1}/{max_retries}: Neo4j 未就绪，{retry_interval}秒后重试... ({e})")
-                time.sleep(retry_interval)
-            else:
-                print(f"❌ Neo4j 服务在 {max_retries * retry_interval} 秒后仍未就绪")
+            # 启动初期间隔短、探测密集，之后逐步放宽；抖动避免多个容器同时重试
+            delay = min(max_interval, base_interval * 2 ** (attempt - 1)) + random.uniform(0, 0.5)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"❌ Neo4j 服务在 {max_wait} 秒后仍未就绪")
                 return False
-    return False
+            delay = min(delay, remaining)
+            print(f"⚠️  尝试 {attempt}: Neo4j 未就绪，{delay:.1f}秒后重试... ({e})")
+            time.sleep(delay)
 
 def create_indexes(driver):
     """创建 Graphiti 所需的所有索引"""
+    # (索引名, DDL)；时间属性上的索引显式声明为 RANGE，供范围谓词使用
     indexes = [
         # Entity 节点索引
-        "CREATE INDEX entity_uuid IF NOT EXISTS FOR (n:Entity) ON (n.uuid)",
-        "CREATE INDEX entity_group_id IF NOT EXISTS FOR (n:Entity) ON (n.group_id)",
-        "CREATE INDEX name_entity_index IF NOT EXISTS FOR (n:Entity) ON (n.name)",
-        "CREATE INDEX created_at_entity_index IF NOT EXISTS FOR (n:Entity) ON (n.created_at)",
+        ("entity_uuid", "CREATE INDEX entity_uuid IF NOT EXISTS FOR (n:Entity) ON (n.uuid)"),
+        ("entity_group_id", "CREATE INDEX entity_group_id IF NOT EXISTS FOR (n:Entity) ON (n.group_id)"),
+        ("name_entity_index", "CREATE INDEX name_entity_index IF NOT EXISTS FOR (n:Entity) ON (n.name)"),
+        ("created_at_entity_index", "CREATE RANGE INDEX created_at_entity_index IF NOT EXISTS FOR (n:Entity) ON (n.created_at)"),
         
         # Episodic 节点索引
-        "CREATE INDEX episode_uuid IF NOT EXISTS FOR (n:Episodic) ON (n.uuid)",
-        "CREATE INDEX episode_group_id IF NOT EXISTS FOR (n:Episodic) ON (n.group_id)",
-        "CREATE INDEX created_at_episodic_index IF NOT EXISTS FOR (n:Episodic) ON (n.created_at)",
-        "CREATE INDEX valid_at_episodic_index IF NOT EXISTS FOR (n:Episodic) ON (n.valid_at)",
+        ("episode_uuid", "CREATE INDEX episode_uuid IF NOT EXISTS FOR (n:Episodic) ON (n.uuid)"),
+        ("episode_group_id", "CREATE INDEX episode_group_id IF NOT EXISTS FOR (n:Episodic) ON (n.group_id)"),
+        ("created_at_episodic_index", "CREATE RANGE INDEX created_at_episodic_index IF NOT EXISTS FOR (n:Episodic) ON (n.created_at)"),
+        ("valid_at_episodic_index", "CREATE RANGE INDEX valid_at_episodic_index IF NOT EXISTS FOR (n:Episodic) ON (n.valid_at)"),
         
         # Community 节点索引
-        "CREATE INDEX community_uuid IF NOT EXISTS FOR (n:Community) ON (n.uuid)",
-        "CREATE INDEX community_group_id IF NOT EXISTS FOR (n:Community) ON (n.group_id)",
+        ("community_uuid", "CREATE INDEX community_uuid IF NOT EXISTS FOR (n:Community) ON (n.uuid)"),
+        ("community_group_id", "CREATE INDEX community_group_id IF NOT EXISTS FOR (n:Community) ON (n.group_id)"),
         
         # RELATES_TO 关系索引
-        "CREATE INDEX relation_uuid IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.uuid)",
-        "CREATE INDEX relation_group_id IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.group_id)",
-        "CREATE INDEX name_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.name)",
-        "CREATE INDEX created_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.created_at)",
-        "CREATE INDEX expired_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.expired_at)",
-        "CREATE INDEX valid_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.valid_at)",
-        "CREATE INDEX invalid_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.invalid_at)",
+        ("relation_uuid", "CREATE INDEX relation_uuid IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.uuid)"),
+        ("relation_group_id", "CREATE INDEX relation_group_id IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.group_id)"),
+        ("name_edge_index", "CREATE INDEX name_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.name)"),
+        ("created_at_edge_index", "CREATE RANGE INDEX created_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.created_at)"),
+        ("expired_at_edge_index", "CREATE RANGE INDEX expired_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.expired_at)"),
+        ("valid_at_edge_index", "CREATE RANGE INDEX valid_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.valid_at)"),
+        ("invalid_at_edge_index", "CREATE RANGE INDEX invalid_at_edge_index IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.invalid_at)"),
         
         # MENTIONS 关系索引
-        "CREATE INDEX mention_uuid IF NOT EXISTS FOR ()-[e:MENTIONS]-() ON (e.uuid)",
-        "CREATE INDEX mention_group_id IF NOT EXISTS FOR ()-[e:MENTIONS]-() ON (e.group_id)",
+        # mention_uuid / has_member_uuid：关系通常经由端点节点遍历，很少按 uuid 直接查找，
+        # 是 --audit 下最可能长期无读取的索引，确认无读取后可移除
+        ("mention_uuid", "CREATE INDEX mention_uuid IF NOT EXISTS FOR ()-[e:MENTIONS]-() ON (e.uuid)"),
+        ("mention_group_id", "CREATE INDEX mention_group_id IF NOT EXISTS FOR ()-[e:MENTIONS]-() ON (e.group_id)"),
         
         # HAS_MEMBER 关系索引
-        "CREATE INDEX has_member_uuid IF NOT EXISTS FOR ()-[e:HAS_MEMBER]-() ON (e.uuid)",
+        ("has_member_uuid", "CREATE INDEX has_member_uuid IF NOT EXISTS FOR ()-[e:HAS_MEMBER]-() ON (e.uuid)"),
+        
+        # 复合索引：按 group_id 过滤后再按 uuid/name 查找或按时间排序的查询可直接走 NodeIndexSeek
+        # （单属性索引保留：按 uuid 单独查找的查询仍需要）
+        ("entity_group_uuid", "CREATE INDEX entity_group_uuid IF NOT EXISTS FOR (n:Entity) ON (n.group_id, n.uuid)"),
+        ("entity_group_name", "CREATE INDEX entity_group_name IF NOT EXISTS FOR (n:Entity) ON (n.group_id, n.name)"),
+        ("episode_group_valid_at", "CREATE RANGE INDEX episode_group_valid_at IF NOT EXISTS FOR (n:Episodic) ON (n.group_id, n.valid_at)"),
+        ("episode_group_created_at", "CREATE RANGE INDEX episode_group_created_at IF NOT EXISTS FOR (n:Episodic) ON (n.group_id, n.created_at)"),
+        ("relation_group_valid_at", "CREATE RANGE INDEX relation_group_valid_at IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON (e.group_id, e.valid_at)"),
         
-        # 全文索引
-        "CREATE FULLTEXT INDEX episode_content IF NOT EXISTS FOR (e:Episodic) ON EACH [e.content, e.source, e.source_description, e.group_id]",
-        "CREATE FULLTEXT INDEX node_name_and_summary IF NOT EXISTS FOR (n:Entity) ON EACH [n.name, n.summary, n.group_id]",
-        "CREATE FULLTEXT INDEX community_name IF NOT EXISTS FOR (n:Community) ON EACH [n.name, n.group_id]",
-        "CREATE FULLTEXT INDEX edge_name_and_fact IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON EACH [e.name, e.fact, e.group_id]",
+        # 全文索引：显式指定分析器和一致性配置（即 Neo4j 5 默认值），不依赖版本默认
+        ("episode_content", "CREATE FULLTEXT INDEX episode_content IF NOT EXISTS FOR (e:Episodic) ON EACH [e.content, e.source, e.source_description, e.group_id] OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words', `fulltext.eventually_consistent`: false}}"),
+        ("node_name_and_summary", "CREATE FULLTEXT INDEX node_name_and_summary IF NOT EXISTS FOR (n:Entity) ON EACH [n.name, n.summary, n.group_id] OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words', `fulltext.eventually_consistent`: false}}"),
+        ("community_name", "CREATE FULLTEXT INDEX community_name IF NOT EXISTS FOR (n:Community) ON EACH [n.name, n.group_id] OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words', `fulltext.eventually_consistent`: false}}"),
+        ("edge_name_and_fact", "CREATE FULLTEXT INDEX edge_name_and_fact IF NOT EXISTS FOR ()-[e:RELATES_TO]-() ON EACH [e.name, e.fact, e.group_id] OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words', `fulltext.eventually_consistent`: false}}"),
+        # 智能检索阶段2：Entity名称 -> DocumentChunk 关联（与 app/main.py 启动时创建的索引一致）
+        ("document_chunk_text", "CREATE FULLTEXT INDEX document_chunk_text IF NOT EXISTS FOR (n:DocumentChunk) ON EACH [n.text] OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words', `fulltext.eventually_consistent`: false}}"),
     ]
     
     print(f"📊 开始创建 {len(indexes)} 个索引...")
@@ -82,27 +106,98 @@ def create_indexes(driver):
     skipped_count = 0
     
     with driver.session() as session:
-        for idx_query in indexes:
+        # 先用一次查询取出已有索引名，已存在的索引不再发送DDL
+        existing = {record["name"] for record in session.run("SHOW INDEXES YIELD name")}
+        pending = []
+        for name, ddl in indexes:
+            if name in existing:
+                skipped_count += 1
+                print(f"  ⏭️  已存在: {name}")
+            else:
+                pending.append((name, ddl))
+        
+        if pending:
             try:
-                result = session.run(idx_query)
-                summary = result.consume()
-                
-                # 检查索引是否已存在
-                if summary.counters.indexes_added > 0:
-                    created_count += 1
-                    print(f"  ✅ 创建: {idx_query[:80]}...")
-                else:
-                    skipped_count += 1
-                    print(f"  ⏭️  已存在: {idx_query[:80]}...")
-                    
+                # 所有DDL放在同一个事务中提交，只需一次往返和一次提交
+                added_counts = session.execute_write(_create_all, [ddl for _, ddl in pending])
+                for (name, ddl), added in zip(pending, added_counts):
+                    if added > 0:
+                        created_count += 1
+                        print(f"  ✅ 创建: {ddl[:80]}...")
+                    else:
+                        skipped_count += 1
+                        print(f"  ⏭️  已存在: {name}")
             except Exception as e:
-                print(f"  ⚠️  失败: {idx_query[:80]}... ({e})")
+                # 事务中任一语句失败会导致整个事务回滚，回退为逐条执行，单条失败不影响其余索引
+                print(f"  ⚠️  批量创建失败，改为逐条创建 ({e})")
+                created, skipped = _create_one_by_one(session, pending)
+                created_count += created
+                skipped_count += skipped
+        
+        # 等待索引填充完成（ONLINE）后再返回，避免应用启动后查询仍走全表扫描
+        try:
+            session.run("CALL db.awaitIndexes(300)").consume()
+        except Exception as e:
+            print(f"  ⚠️  等待索引上线失败: {e}")
     
     print(f"\n✅ 索引初始化完成: 创建 {created_count} 个, 跳过 {skipped_count} 个")
     return True
 
+def _create_all(tx, queries):
+    """在同一事务中执行全部索引语句，返回每条语句新增的索引数"""
+    return [tx.run(query).consume().counters.indexes_added for query in queries]
+
+def _create_one_by_one(session, indexes):
+    """逐条（各自独立的自动提交事务）创建索引，返回 (创建数, 跳过数)"""
+    created_count = 0
+    skipped_count = 0
+    for name, ddl in indexes:
+        try:
+            result = session.run(ddl)
+            summary = result.consume()
+            
+            # 检查索引是否已存在
+            if summary.counters.indexes_added > 0:
+                created_count += 1
+                print(f"  ✅ 创建: {ddl[:80]}...")
+            else:
+                skipped_count += 1
+                print(f"  ⏭️  已存在: {name}")
+                
+        except Exception as e:
+            print(f"  ⚠️  失败: {ddl[:80]}... ({e})")
+    return created_count, skipped_count
+
+def audit_indexes(driver, min_age_days=7):
+    """诊断：列出统计时间超过 min_age_days 天且读取次数为0的索引"""
+    print(f"🔍 检查超过 {min_age_days} 天未被读取的索引...")
+    threshold = datetime.now(timezone.utc) - timedelta(days=min_age_days)
+    unused = []
+    with driver.session() as session:
+        records = session.run(
+            "SHOW INDEXES YIELD name, type, entityType, readCount, trackedSince"
+        )
+        for record in records:
+            # LOOKUP 索引由 Neo4j 内部使用，不参与统计
+            if record["type"] == "LOOKUP" or record["readCount"]:
+                continue
+            tracked_since = record["trackedSince"]
+            if tracked_since is None or tracked_since.to_native() > threshold:
+                continue
+            unused.append((record["name"], record["type"], record["entityType"]))
+    
+    if not unused:
+        print("✅ 没有长期未被读取的索引")
+    for name, index_type, entity_type in unused:
+        print(f"  ⚠️  未被读取: {name} ({index_type}, {entity_type})")
+    return unused
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Neo4j 索引初始化脚本")
+    parser.add_argument("--audit", action="store_true", help="只检查长期未被读取的索引，不创建索引")
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("🚀 Neo4j 索引初始化脚本")
     print("=" * 80)
@@ -114,7 +209,16 @@ def main():
     
     # 创建驱动
     try:
-        driver = GraphDatabase.driver(uri, auth=(username, password))
+        # 脚本只串行执行少量查询：小连接池，连接/获取连接快速失败交给 wait_for_neo4j 重试，
+        # 开启TCP keepalive避免等待索引上线期间连接被中间网络设备断开
+        driver = GraphDatabase.driver(
+            uri,
+            auth=(username, password),
+            max_connection_pool_size=4,
+            connection_acquisition_timeout=5,
+            connection_timeout=3,
+            keep_alive=True
+        )
     except Exception as e:
         print(f"❌ 无法创建 Neo4j 驱动: {e}")
         sys.exit(1)
@@ -125,6 +229,10 @@ def main():
             print("❌ Neo4j 服务未就绪，退出")
             sys.exit(1)
         
+        if args.audit:
+            audit_indexes(driver)
+            sys.exit(0)
+        
         # 创建索引
         if not create_indexes(driver):
             print("❌ 索引创建失败")
@@ -0,0 +1,100 @@
+"""
+patch_add_rule_associations 规则去重测试
+"""
+import asyncio
+from collections import OrderedDict
+
+from app.utils import patch_add_rule_associations as patch
+
+
+class _FakeGraphEngine:
+    def __init__(self):
+        self.edges = []
+
+    async def add_edges(self, edges):
+        self.edges.extend(edges)
+
+
+class _FakeNodeSet:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class _FakeRule:
+    def __init__(self, text, belongs_to_set):
+        self.text = text
+        self.belongs_to_set = belongs_to_set
+
+
+def _install_fakes(monkeypatch, existing_rules, llm_rules):
+    """替换 Cognee 依赖，返回记录调用情况的字典"""
+    calls = {"existing_rules_queries": 0, "saved_rules": None, "llm_prompts": []}
+    graph_engine = _FakeGraphEngine()
+
+    async def get_graph_engine():
+        return graph_engine
+
+    async def get_existing_rules(rules_nodeset_name):
+        calls["existing_rules_queries"] += 1
+        return list(existing_rules)
+
+    async def get_origin_edges(data, rules):
+        return []
+
+    async def add_data_points(data_points):
+        calls["saved_rules"] = [rule.text for rule in data_points]
+
+    async def index_graph_edges(edges):
+        pass
+
+    class _FakeLLMGateway:
+        @staticmethod
+        async def acreate_structured_output(text_input, system_prompt, response_model):
+            calls["llm_prompts"].append(text_input)
+            return response_model(rules=list(llm_rules))
+
+    deps = (
+        get_graph_engine, None, _FakeLLMGateway, _FakeNodeSet,
+        add_data_points, index_graph_edges,
+        _FakeRule, get_existing_rules, get_origin_edges
+    )
+    monkeypatch.setattr(patch, "_cognee_deps", lambda: deps)
+    monkeypatch.setattr(patch, "_RULES_CACHE", OrderedDict())
+    return calls
+
+
+def test_existing_rules_deduped_when_prompt_has_no_rules_placeholder(monkeypatch):
+    """user_prompt 不含 {rules} 时，已存在于图谱中的规则仍不会被重复保存"""
+    calls = _install_fakes(
+        monkeypatch,
+        existing_rules=["Use type hints"],
+        llm_rules=["use type hints ", "Write docstrings"]
+    )
+
+    asyncio.run(patch.patched_add_rule_associations(
+        data="section text",
+        user_prompt="Extract rules from: {chat}",
+        system_prompt="system"
+    ))
+
+    assert calls["existing_rules_queries"] == 1
+    assert calls["saved_rules"] == ["Write docstrings"]
+    assert calls["llm_prompts"] == ["Extract rules from: section text"]
+
+
+def test_nothing_saved_when_all_rules_exist(monkeypatch):
+    calls = _install_fakes(
+        monkeypatch,
+        existing_rules=["Use type hints"],
+        llm_rules=["Use type hints", "USE TYPE HINTS"]
+    )
+
+    asyncio.run(patch.patched_add_rule_associations(
+        data="section text",
+        user_prompt="Existing: {rules}\nExtract rules from: {chat}",
+        system_prompt="system"
+    ))
+
+    assert calls["saved_rules"] is None
+    assert calls["llm_prompts"] == ["Existing: - Use type hints\nExtract rules from: section text"]
@@ -0,0 +1,63 @@
+"""
+requirement_generation.agents._run_llm 流式输出测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.requirement_generation import agents
+
+
+class _FakeStreamClient:
+    """模拟LLM客户端：chat_stream 瞬间产出大量token，记录流是否被关闭"""
+
+    def __init__(self, chunks: int = 1000, chunk_size: int = 300):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    async def chat_stream(self, **kwargs):
+        try:
+            for _ in range(self.chunks):
+                yield "x" * self.chunk_size
+        finally:
+            self.closed = True
+
+
+def test_run_llm_callback_error_with_full_queue_does_not_hang(monkeypatch):
+    """回调在队列已满时抛出异常：异常向上传播，生产者退出且LLM流被关闭"""
+    client = _FakeStreamClient()
+    monkeypatch.setattr(agents, "get_llm_client", lambda provider=None: client)
+
+    async def failing_callback(chunk, stage):
+        # 回调变慢期间生产者写满队列，之后客户端断开
+        await asyncio.sleep(0.05)
+        raise RuntimeError("client disconnected")
+
+    async def run():
+        with pytest.raises(RuntimeError, match="client disconnected"):
+            await asyncio.wait_for(
+                agents._run_llm([], "qianwen", 0.3, False, "generating", failing_callback),
+                timeout=5
+            )
+        # 除当前任务外不应残留生产者任务
+        assert len(asyncio.all_tasks()) == 1
+
+    asyncio.run(run())
+    assert client.closed
+
+
+def test_run_llm_streams_full_text(monkeypatch):
+    """正常流式输出：回调收到的内容与返回的完整文本一致"""
+    client = _FakeStreamClient(chunks=200, chunk_size=10)
+    monkeypatch.setattr(agents, "get_llm_client", lambda provider=None: client)
+    received = []
+
+    async def callback(chunk, stage):
+        received.append(chunk)
+
+    text = asyncio.run(agents._run_llm([], "qianwen", 0.3, False, "generating", callback))
+
+    assert text == "x" * 2000
+    assert "".join(received) == text
+    assert client.closed
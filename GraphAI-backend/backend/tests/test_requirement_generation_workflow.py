@@ -0,0 +1,117 @@
+"""
+requirement_generation.workflow 迭代收敛判断测试
+"""
+import asyncio
+
+from app.services.requirement_generation import workflow
+
+
+def _report(overall, sub=None):
+    sub = overall if sub is None else sub
+    return {
+        "overall_score": overall,
+        "completeness_score": sub,
+        "accuracy_score": sub,
+        "consistency_score": sub,
+        "readability_score": sub,
+    }
+
+
+def test_has_converged_requires_previous_report():
+    assert not workflow._has_converged(None, _report(84.0), 85.0)
+
+
+def test_has_converged_on_small_gain_near_threshold():
+    assert workflow._has_converged(_report(82.0), _report(83.0), 85.0)
+
+
+def test_has_converged_rejects_regression():
+    """总分下降不视为收敛"""
+    assert not workflow._has_converged(_report(82.0), _report(81.0), 85.0)
+
+
+def test_has_converged_rejects_low_sub_score():
+    """总分接近阈值但某个维度仍明显偏低时继续优化"""
+    current = _report(83.0)
+    current["accuracy_score"] = 70.0
+    previous = _report(82.0)
+    previous["accuracy_score"] = 70.0
+    assert not workflow._has_converged(previous, current, 85.0)
+
+
+def test_has_converged_rejects_large_sub_score_gain():
+    """某个维度仍在明显提升时继续优化"""
+    previous = _report(82.0)
+    current = _report(83.0)
+    current["readability_score"] = 86.0
+    assert not workflow._has_converged(previous, current, 85.0)
+
+
+class _FakeRetriever:
+    @staticmethod
+    async def retrieve(state):
+        return state
+
+
+class _FakeGenerator:
+    @staticmethod
+    async def generate(state, stream_callback=None):
+        state["current_document"] = "v0"
+        return state
+
+
+def _fake_reviewer(scores):
+    pending = list(scores)
+
+    class _FakeReviewer:
+        @staticmethod
+        async def review(state, stream_callback=None):
+            score = pending.pop(0)
+            state["review_report"] = _report(score)
+            state["quality_score"] = score
+            return state
+
+    return _FakeReviewer
+
+
+def _fake_optimizer(calls):
+    class _FakeOptimizer:
+        @staticmethod
+        async def optimize(state, stream_callback=None):
+            calls.append(state["current_document"])
+            state["current_document"] = f"v{len(calls)}"
+            return state
+
+    return _FakeOptimizer
+
+
+def _run_workflow(monkeypatch, scores):
+    calls = []
+    monkeypatch.setattr(workflow, "ContentRetriever", _FakeRetriever)
+    monkeypatch.setattr(workflow, "DocumentGenerator", _FakeGenerator)
+    monkeypatch.setattr(workflow, "DocumentReviewer", _fake_reviewer(scores))
+    monkeypatch.setattr(workflow, "DocumentOptimizer", _fake_optimizer(calls))
+    state = {
+        "max_iterations": 3,
+        "quality_threshold": 85.0,
+        "iteration_count": 0,
+        "quality_score": 0.0,
+        "review_report": None,
+        "current_document": "",
+    }
+    return asyncio.run(workflow.run_document_generation_workflow(state)), calls
+
+
+def test_workflow_keeps_optimizing_after_regression(monkeypatch):
+    """评分回退（82 -> 81）时不能按"已收敛"提前结束"""
+    state, calls = _run_workflow(monkeypatch, [82.0, 81.0, 81.5])
+    assert len(calls) == 2
+    assert state["quality_score"] == 81.5
+
+
+def test_workflow_stops_when_converged(monkeypatch):
+    """评分接近阈值且提升不足时提前结束，不再优化"""
+    state, calls = _run_workflow(monkeypatch, [82.0, 83.0, 84.0])
+    assert len(calls) == 1
+    assert state["quality_score"] == 83.0
+    assert state["is_final"]